@@ -0,0 +1,76 @@
+"""
+Azure Function: analyze_turn
+
+Extracts the intake fields from a user message and decides the next chat mode
+with one structured-output OpenAI call. Replaces calling extract_fields_from_input
+and switch_chat_mode separately for the same turn.
+"""
+
+import logging
+import azure.functions as func
+from shared.admission import admission_controlled
+from shared.http import Field, Schema, json_handler, json_response
+from shared.resilience import ServiceUnavailableError
+from shared.session_state import get_session_state_store
+from shared.timing import mark, stage, timed_handler
+from shared.turn_analysis import FUNCTION_NAME, analyze_turn, degraded_analysis
+
+REQUEST_SCHEMA = Schema(
+    Field("message", str, required=True, strip=True, non_empty=True),
+    Field("context", str),
+    Field("current_mode", str),
+    Field("session_id", (str, int), coerce=str),
+)
+
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME, "Turn analysis failed.")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Analyze one chat turn.
+
+    Expected input JSON:
+    {
+        "session_id": "abc123",
+        "message": "I've been feeling overwhelmed for a few weeks.",
+        "context": "optional conversation context for the mode decision",
+        "current_mode": "optional mode kept when OpenAI is unavailable"
+    }
+
+    Returns:
+    {
+        "status": "ok",
+        "fields": {"symptoms": "overwhelmed", "duration": "a few weeks", ...},
+        "new_mode": "intake"
+    }
+
+    With a session_id, the fields are also merged into the session's intake state
+    and "accumulated_fields", "score" and "enough_data" are added. While OpenAI is
+    unavailable the response is degraded ("degraded": true): all fields are null
+    and the mode stays at current_mode.
+    """
+    payload = REQUEST_SCHEMA.parse(req)
+    message = payload["message"]
+    session_id = payload["session_id"]
+    mark("validate")
+
+    # Log session_id but not message content for privacy
+    logging.info("Processing turn analysis for session: %s", session_id)
+
+    try:
+        analysis = await analyze_turn(message, payload["context"])
+        result = {"status": "ok", "fields": analysis["fields"], "new_mode": analysis["mode"]}
+    except ServiceUnavailableError as e:
+        logging.warning("Turn analysis degraded for session %s: %s", session_id, e)
+        analysis = degraded_analysis(payload["current_mode"])
+        result = {"status": "ok", "fields": analysis["fields"], "new_mode": analysis["mode"], "degraded": True}
+
+    if session_id:
+        with stage("state"):
+            state = get_session_state_store().merge_fields(session_id, analysis["fields"])
+        result["accumulated_fields"] = state["fields"]
+        result["score"] = state["score"]
+        result["enough_data"] = state["enough_data"]
+
+    return json_response(result)
@@ -0,0 +1,123 @@
+"""
+Concurrency scaling check of the async handlers.
+
+A handler that holds the event loop while it waits on OpenAI serves one request
+at a time however many are in flight. This check runs a handler against the
+OpenAI stand-in (fixed latency, no caches) at increasing concurrency and fails
+when throughput does not rise with the number of in-flight requests: each level
+must reach --min-gain times the throughput of the previous one.
+
+The default levels 1, 10 and 50 stay meaningful under admission control: at 50
+in flight, ADMISSION_MAX_CONCURRENCY (default 32) requests are served at once
+and the rest queue, so the gain from 10 to 50 is well below 5x (about 1.9x with
+the defaults).
+
+Usage (from the repository root):
+
+    python -m benchmarks.concurrency_check
+    python -m benchmarks.concurrency_check --function switch_chat_mode --concurrency 1 10 50 --min-gain 1.5
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+# Stand-in credentials must be present before the shared clients are built
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+os.environ.setdefault("NOCODB_API_URL", "http://nocodb.local")
+os.environ.setdefault("NOCODB_API_KEY", "benchmark-key")
+# Every request must reach the stand-in, so nothing is answered locally
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ.pop("MODE_CLASSIFIER_PATH", None)
+
+from benchmarks.harness import run_load  # noqa: E402
+from benchmarks.stubs import LatencyModel, OpenAIStub, install_stubs  # noqa: E402
+
+
+BODIES = {
+    "switch_chat_mode": lambda i: {
+        "session_id": f"bench-{i}",
+        "context": f"user: I've been feeling overwhelmed for a few weeks. (#{i})",
+    },
+    "extract_fields_from_input": lambda i: {
+        "session_id": f"bench-{i}",
+        "message": f"I feel anxious most nights and can't sleep. (#{i})",
+    },
+    "analyze_turn": lambda i: {
+        "session_id": f"bench-{i}",
+        "message": f"I feel anxious most nights and can't sleep. (#{i})",
+    },
+}
+
+
+async def measure(function: str, levels: List[int], requests: int, latency_ms: float) -> Dict[int, Dict[str, Any]]:
+    install_stubs(openai=OpenAIStub(LatencyModel(latency_ms)))
+    handler = importlib.import_module(function).main
+    make_body = BODIES[function]
+    # Warm-up: client construction and first-call imports are not what is measured
+    await run_load(handler, make_body, 5, 1, f"/api/{function}")
+
+    results = {}
+    for concurrency in levels:
+        # At least a few rounds per level, so throughput is not a single-batch artefact
+        count = max(requests, concurrency * 4)
+        results[concurrency] = await run_load(handler, make_body, count, concurrency, f"/api/{function}")
+    return results
+
+
+def check_scaling(results: Dict[int, Dict[str, Any]], min_gain: float) -> List[str]:
+    """Levels whose throughput is not ``min_gain`` times the previous level's, or that had errors."""
+    failures = []
+    previous = None
+    for concurrency, result in results.items():
+        if result["errors"]:
+            failures.append(f"concurrency {concurrency}: {result['errors']} error responses")
+        if previous is not None:
+            gain = result["throughput_rps"] / previous[1] if previous[1] else 0.0
+            if gain < min_gain:
+                failures.append(
+                    f"concurrency {previous[0]} -> {concurrency}: throughput {previous[1]} -> "
+                    f"{result['throughput_rps']} req/s ({gain:.2f}x, expected at least {min_gain}x)"
+                )
+        previous = (concurrency, result["throughput_rps"])
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--function", choices=sorted(BODIES), default="switch_chat_mode")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 10, 50], help="Levels, in increasing order")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per level (at least 4 rounds)")
+    parser.add_argument("--openai-latency-ms", type=float, default=50.0)
+    parser.add_argument("--min-gain", type=float, default=1.5, help="Required throughput ratio between levels")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    levels = sorted(set(args.concurrency))
+    results = asyncio.run(measure(args.function, levels, args.requests, args.openai_latency_ms))
+    failures = check_scaling(results, args.min_gain)
+
+    if args.json:
+        print(json.dumps({"function": args.function, "results": results, "failures": failures}, indent=2))
+    else:
+        print(f"{args.function}, OpenAI stand-in at {args.openai_latency_ms} ms")
+        print(f"{'in flight':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for concurrency, result in results.items():
+            print(f"{concurrency:<10}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+                  f"{result['p95_ms']:>10}{result['errors']:>8}")
+        for failure in failures:
+            print(f"  FAIL {failure}")
+        if not failures:
+            print(f"Throughput rises at least {args.min_gain}x with each concurrency level.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
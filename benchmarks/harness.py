@@ -0,0 +1,132 @@
+"""
+Measurement helpers for the handler benchmarks.
+
+Handlers are called directly with synthetic func.HttpRequest objects, the same
+way the Functions host invokes them, so the numbers cover parsing, validation,
+client acquisition, the (stubbed) outbound calls and serialization.
+"""
+
+import asyncio
+import inspect
+import json
+import math
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+import azure.functions as func
+
+
+Handler = Callable[[func.HttpRequest], Awaitable[func.HttpResponse]]
+BodyFactory = Callable[[int], Any]
+
+
+def make_request(body: Any, route: str = "/api/benchmark", headers: Dict[str, str] = None) -> func.HttpRequest:
+    """Build the HttpRequest the host would pass for a JSON (or raw bytes) POST body."""
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    return func.HttpRequest(
+        method="POST",
+        url=f"http://localhost{route}",
+        headers={"Content-Type": "application/json", **(headers or {})},
+        body=payload
+    )
+
+
+async def invoke(handler: Handler, request: func.HttpRequest) -> func.HttpResponse:
+    """Call a handler whether it is a coroutine function or a plain function."""
+    result = handler(request)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+def percentile(sorted_samples: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, math.ceil(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
+
+
+def summarize_latencies(latencies_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies_ms)
+    return {
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+    }
+
+
+async def run_load(
+    handler: Handler,
+    make_body: BodyFactory,
+    requests: int,
+    concurrency: int,
+    route: str = "/api/benchmark"
+) -> Dict[str, Any]:
+    """
+    Issue ``requests`` calls with at most ``concurrency`` in flight.
+
+    Returns:
+        Dict with latency percentiles, throughput (requests/second) and the
+        number of 5xx responses
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for index in counter:
+            request = make_request(make_body(index), route)
+            started = time.perf_counter()
+            response = await invoke(handler, request)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        **summarize_latencies(latencies),
+    }
+
+
+async def measure_allocations(
+    handler: Handler,
+    make_body: BodyFactory,
+    requests: int,
+    route: str = "/api/benchmark"
+) -> Dict[str, float]:
+    """
+    Trace Python allocations of sequential calls with tracemalloc.
+
+    Reports the mean transient peak per request (memory allocated on top of what
+    was live when the request started) and the memory still held after all calls.
+    """
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        peaks = []
+        for index in range(requests):
+            request = make_request(make_body(index), route)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await invoke(handler, request)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "peak_kib_per_request": round(sum(peaks) / len(peaks) / 1024, 2) if peaks else 0.0,
+        "retained_kib": round((retained - baseline) / 1024, 2),
+    }
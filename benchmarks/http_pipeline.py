@@ -0,0 +1,199 @@
+"""
+CPU cost per request of the shared request/response pipeline (shared.http).
+
+Each scenario runs the request handling of one handler twice over the same
+requests, with no network and no model calls:
+
+- legacy: req.get_json(), hand-written checks and json.dumps per request,
+  as the handlers did before shared.http
+- pipeline: the handler's compiled REQUEST_SCHEMA, the fast codec and the
+  pre-serialized error bodies
+
+Usage (from the repository root):
+
+    python -m benchmarks.http_pipeline
+    python -m benchmarks.http_pipeline --iterations 50000 --json
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import azure.functions as func
+
+from analyze_turn import REQUEST_SCHEMA as ANALYZE_TURN_SCHEMA
+from benchmarks.harness import make_request
+from save_session_summary import REQUEST_SCHEMA as SAVE_SUMMARY_SCHEMA
+from shared.http import JSON_CODEC, OK_BODY, HttpError, dumps, json_response, parse_json
+from shared.timing import stage
+
+
+FIELDS = {
+    "symptoms": "trouble sleeping and constant worry",
+    "duration": "about three months",
+    "triggers": "work deadlines",
+    "intensity": "7/10",
+    "frequency": "most nights",
+    "impact_on_life": "missing work, avoiding friends",
+    "coping_mechanisms": None,
+}
+
+
+def _legacy_error(message: str, status_code: int) -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps({"status": "error", "message": message}),
+        status_code=status_code,
+        mimetype="application/json"
+    )
+
+
+def legacy_analyze_turn(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        with stage("parse"):
+            req_body = req.get_json()
+    except ValueError:
+        return _legacy_error("Invalid JSON in request body.", 400)
+    if not req_body or not isinstance(req_body.get("message"), str) or not req_body["message"].strip():
+        return _legacy_error("Missing or invalid 'message' field.", 400)
+    context = req_body.get("context")
+    if context is not None and not isinstance(context, str):
+        return _legacy_error("Invalid 'context' field: must be a string.", 400)
+    result = {"status": "ok", "fields": FIELDS, "new_mode": "intake",
+              "accumulated_fields": FIELDS, "score": 9, "enough_data": True}
+    with stage("serialize"):
+        body = json.dumps(result)
+    return func.HttpResponse(body, status_code=200, mimetype="application/json")
+
+
+def pipeline_analyze_turn(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        ANALYZE_TURN_SCHEMA.parse(req)
+    except HttpError as e:
+        return e.to_response()
+    result = {"status": "ok", "fields": FIELDS, "new_mode": "intake",
+              "accumulated_fields": FIELDS, "score": 9, "enough_data": True}
+    return json_response(result)
+
+
+def legacy_save_summary(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        with stage("parse"):
+            req_body = req.get_json()
+    except ValueError:
+        return _legacy_error("Invalid JSON in request body", 400)
+    if not req_body:
+        return _legacy_error("Request body is required", 400)
+    session_id = req_body.get("session_id")
+    summary = req_body.get("summary")
+    if not session_id or not isinstance(session_id, str) or not session_id.strip():
+        return _legacy_error("Missing 'session_id' field or NocoDB request failed.", 400)
+    if not summary or not isinstance(summary, str) or not summary.strip():
+        return _legacy_error("Missing 'summary' field or NocoDB request failed.", 400)
+    return func.HttpResponse(json.dumps({"status": "ok"}), status_code=200, mimetype="application/json")
+
+
+def pipeline_save_summary(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        SAVE_SUMMARY_SCHEMA.parse(req)
+    except HttpError as e:
+        return e.to_response()
+    return json_response(OK_BODY)
+
+
+def legacy_evaluate_batch(req: func.HttpRequest) -> func.HttpResponse:
+    with stage("parse"):
+        records = req.get_json()
+    lines = "".join(
+        json.dumps({"session_id": record["session_id"], "status": "ok", "score": 7, "enough_data": True}) + "\n"
+        for record in records
+    )
+    return func.HttpResponse(lines, status_code=200, mimetype="application/x-ndjson")
+
+
+def pipeline_evaluate_batch(req: func.HttpRequest) -> func.HttpResponse:
+    with stage("parse"):
+        records = parse_json(req)
+    lines = b"".join(
+        dumps({"session_id": record["session_id"], "status": "ok", "score": 7, "enough_data": True}) + b"\n"
+        for record in records
+    )
+    return func.HttpResponse(lines, status_code=200, mimetype="application/x-ndjson")
+
+
+Handler = Callable[[func.HttpRequest], func.HttpResponse]
+
+SCENARIOS: Dict[str, Tuple[Handler, Handler, Any]] = {
+    "analyze_turn": (legacy_analyze_turn, pipeline_analyze_turn, {
+        "session_id": "bench-1",
+        "message": "I haven't slept properly in about three months and I worry all the time.",
+        "context": "user: hi\nassistant: hello, how can I help?\n" * 5,
+    }),
+    "analyze_turn_invalid": (legacy_analyze_turn, pipeline_analyze_turn, {"session_id": "bench-1", "message": 42}),
+    "save_session_summary": (legacy_save_summary, pipeline_save_summary, {
+        "session_id": "bench-1",
+        "summary": "The user described persistent anxiety and poor sleep. " * 20,
+    }),
+    "save_session_summary_invalid": (legacy_save_summary, pipeline_save_summary, {"session_id": "bench-1"}),
+    "evaluate_batch_200": (legacy_evaluate_batch, pipeline_evaluate_batch, [
+        {"session_id": f"bench-{index}", "fields": FIELDS} for index in range(200)
+    ]),
+}
+
+
+def cpu_us_per_request(handler: Handler, request: func.HttpRequest, iterations: int) -> float:
+    """CPU time per call, best of three rounds."""
+    rounds = []
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(iterations):
+            handler(request)
+        rounds.append((time.process_time() - started) / iterations * 1e6)
+    return min(rounds)
+
+
+def run(iterations: int) -> List[Dict[str, Any]]:
+    results = []
+    for name, (legacy, pipeline, body) in SCENARIOS.items():
+        request = make_request(body)
+        # Both paths must answer alike before their cost is compared
+        legacy_status = legacy(request).status_code
+        pipeline_status = pipeline(request).status_code
+        if legacy_status != pipeline_status:
+            raise SystemExit(f"{name}: legacy answered {legacy_status}, pipeline {pipeline_status}")
+
+        scenario_iterations = max(1, iterations // 100) if name.startswith("evaluate_batch") else iterations
+        legacy_us = cpu_us_per_request(legacy, request, scenario_iterations)
+        pipeline_us = cpu_us_per_request(pipeline, request, scenario_iterations)
+        results.append({
+            "scenario": name,
+            "status": pipeline_status,
+            "legacy_us": round(legacy_us, 2),
+            "pipeline_us": round(pipeline_us, 2),
+            "speedup": round(legacy_us / pipeline_us, 2) if pipeline_us else None,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="Requests per round (batch scenarios use 1%%)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps({"codec": JSON_CODEC, "results": results}, indent=2))
+        return
+
+    print(f"JSON codec: {JSON_CODEC}")
+    print(f"{'scenario':<30} {'status':>6} {'legacy µs':>11} {'pipeline µs':>12} {'speedup':>8}")
+    for result in results:
+        print(
+            f"{result['scenario']:<30} {result['status']:>6} {result['legacy_us']:>11.2f} "
+            f"{result['pipeline_us']:>12.2f} {result['speedup']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Cold-import cost of the function modules, measured with ``python -X importtime``.
+
+Each module is imported in a fresh interpreter (several times, keeping the
+median), so the numbers match what a new worker pays before the first request.
+The report lists each module's total and the most expensive modules it pulled in.
+
+Usage (from the repository root):
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --top 20 extract_fields_from_input
+    python -m benchmarks.import_time --check --budget-ms 250
+
+With --check, the run exits with status 1 if a module's cold import exceeds its
+budget (--budget-ms, or MODULE_BUDGETS_MS for function_app), or if it imports
+one of the --forbid packages (by default the OpenAI SDK, NumPy and httpx, which
+must only be loaded on first use). The deploy workflow runs the check on every
+build.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+
+FUNCTION_MODULES = [
+    "analyze_turn",
+    "extract_fields_from_input",
+    "risk_escalation_check",
+    "switch_chat_mode",
+    "evaluate_intake_progress",
+    "save_session_summary",
+    "function_app",
+]
+
+# Modules whose budget differs from --budget-ms: the v2 app object needs the
+# Durable Functions SDK (and its aiohttp client) at import time
+MODULE_BUDGETS_MS = {"function_app": 600.0}
+
+# Packages that are loaded lazily and must not appear in a cold import
+DEFAULT_FORBIDDEN = ["openai", "numpy", "httpx"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportEntry(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> List[ImportEntry]:
+    """Parse the ``import time: self | cumulative | name`` lines written by -X importtime."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        entries.append(ImportEntry(parts[2].strip(), int(parts[0]), int(parts[1])))
+    return entries
+
+
+def measure_module(module: str, python: str = sys.executable) -> List[ImportEntry]:
+    """Import ``module`` in a fresh interpreter and return its import-time entries."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def profile_module(module: str, repeat: int, top: int) -> Dict[str, object]:
+    """Median cold-import time of ``module`` over ``repeat`` runs, plus its heaviest imports."""
+    totals = []
+    runs = []
+    for _ in range(repeat):
+        entries = measure_module(module)
+        total = next((entry.cumulative_us for entry in entries if entry.name == module), 0)
+        totals.append(total)
+        runs.append((total, entries))
+
+    median_total = statistics.median(totals)
+    # Detail comes from the run closest to the median, not the slowest outlier
+    _, entries = min(runs, key=lambda run: abs(run[0] - median_total))
+    heaviest = sorted(entries, key=lambda entry: entry.cumulative_us, reverse=True)
+    imported = {entry.name for entry in entries}
+    return {
+        "module": module,
+        "total_ms": round(median_total / 1000, 1),
+        "runs_ms": [round(total / 1000, 1) for total in totals],
+        "imported": imported,
+        "top": [
+            {
+                "name": entry.name,
+                "cumulative_ms": round(entry.cumulative_us / 1000, 1),
+                "self_ms": round(entry.self_us / 1000, 1),
+            }
+            for entry in heaviest[1:top + 1]
+        ],
+    }
+
+
+def check_budget(report: Dict[str, object], budget_ms: float, forbidden: List[str]) -> List[str]:
+    """Return one message per budget or lazy-import violation of a module report."""
+    problems = []
+    if report["total_ms"] > budget_ms:
+        problems.append(f"{report['module']}: cold import {report['total_ms']} ms > budget {budget_ms} ms")
+    for package in forbidden:
+        if package in report["imported"]:
+            problems.append(f"{report['module']}: imports {package!r} at import time")
+    return problems
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure cold-import time of the function modules.")
+    parser.add_argument("modules", nargs="*", default=FUNCTION_MODULES, help="Modules to import (default: all functions)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest imports listed per module")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a budget is exceeded")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Cold-import budget per module")
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBIDDEN, help="Packages that must not be imported eagerly")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    reports = [profile_module(module, max(1, args.repeat), args.top) for module in args.modules]
+
+    if args.json:
+        print(json.dumps([{k: v for k, v in report.items() if k != "imported"} for report in reports], indent=2))
+    else:
+        for report in reports:
+            print(f"{report['module']}: {report['total_ms']} ms (runs: {report['runs_ms']})")
+            for entry in report["top"]:
+                print(f"    {entry['cumulative_ms']:>8} ms  {entry['self_ms']:>7} ms self  {entry['name']}")
+
+    if not args.check:
+        return 0
+    problems = [
+        problem
+        for report in reports
+        for problem in check_budget(report, MODULE_BUDGETS_MS.get(report["module"], args.budget_ms), args.forbid)
+    ]
+    if problems:
+        print("\nImport budget exceeded:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print(f"\nAll modules within budget and free of eager {', '.join(args.forbid) or 'imports'}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
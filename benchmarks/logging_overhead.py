@@ -0,0 +1,171 @@
+"""
+Request latency with a slow logging sink, with and without the log pipeline.
+
+The sink stands in for a synchronous exporter (network, gRPC, a contended file):
+every emitted record blocks for --sink-latency-ms. The same handler is run
+against it three ways:
+
+- none: no logging handler at all (the floor)
+- direct: the sink attached to the root logger, as without shared.log_pipeline
+- pipeline: the sink behind configure_logging()'s queue and listener thread
+
+A second table compares the cost of one logging call on the request thread:
+the old f-string with json.dumps against deferred arguments with lazy_json and
+sensitive(), each directly and through the pipeline.
+
+Usage (from the repository root):
+
+    python -m benchmarks.logging_overhead
+    python -m benchmarks.logging_overhead --sink-latency-ms 5 --requests 500 --concurrency 20 --json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# Stand-in credentials must be present before the shared clients are built
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+os.environ.setdefault("NOCODB_API_URL", "http://nocodb.local")
+os.environ.setdefault("NOCODB_API_KEY", "benchmark-key")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+from benchmarks.harness import run_load  # noqa: E402
+from benchmarks.stubs import LatencyModel, OpenAIStub, install_stubs  # noqa: E402
+from shared.log_pipeline import configure_logging, get_logging_stats, lazy_json, sensitive, shutdown_logging  # noqa: E402
+
+
+RECORD = {
+    "session_id": "bench-1",
+    "user_message": "I've been feeling overwhelmed for a few weeks. It gets worse at work.",
+    "assistant_reply": "Processed your message: I've been feeling overwhelmed for a few weeks.",
+    "routing_decision": "intake",
+    "timestamp": "2024-01-01T00:00:00",
+}
+
+
+class SlowSink(logging.Handler):
+    """Formats each record and blocks for a fixed time, like a synchronous exporter."""
+
+    def __init__(self, latency_ms: float):
+        super().__init__(logging.INFO)
+        self.latency = latency_ms / 1000.0
+        self.emitted = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.format(record)
+        if self.latency:
+            time.sleep(self.latency)
+        self.emitted += 1
+
+
+def _message(index: int) -> str:
+    return f"I feel anxious most nights and can't sleep. (#{index})"
+
+
+async def run_scenario(handler: Any, requests: int, concurrency: int) -> Dict[str, Any]:
+    return await run_load(
+        handler,
+        lambda i: {"session_id": f"bench-{i}", "message": _message(i)},
+        requests,
+        concurrency,
+        "/api/extract_fields_from_input",
+    )
+
+
+def call_cost_us(iterations: int) -> Dict[str, float]:
+    """Request-thread cost of one logging call, in microseconds."""
+    logger = logging.getLogger("benchmarks.logging_overhead")
+
+    def eager() -> None:
+        logger.info(f"[save_session_summary] {json.dumps(RECORD)}")
+
+    def deferred() -> None:
+        fields = {key: sensitive(value) if key in ("user_message", "assistant_reply") else value
+                  for key, value in RECORD.items()}
+        logger.info("[save_session_summary] %s", lazy_json(fields))
+
+    results = {}
+    for name, call in (("eager", eager), ("deferred", deferred)):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        results[name] = round((time.perf_counter() - started) / iterations * 1e6, 2)
+    return results
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    install_stubs(openai=OpenAIStub(LatencyModel(args.openai_latency_ms)))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    # A handler that discards records; with none at all, logging.info() would install a console handler
+    root.addHandler(logging.NullHandler())
+    root.setLevel(logging.INFO)
+    # The handler module must not configure the pipeline on import; the scenarios below do it
+    os.environ["LOG_PIPELINE_ENABLED"] = "false"
+    import extract_fields_from_input
+    del os.environ["LOG_PIPELINE_ENABLED"]
+
+    handler = extract_fields_from_input.main
+    # Warm-up: client construction and first-call imports are not what is measured
+    await run_scenario(handler, 5, 1)
+
+    report: Dict[str, Any] = {"latency": {}, "call_cost_us": {}}
+    report["latency"]["none"] = await run_scenario(handler, args.requests, args.concurrency)
+
+    sink = SlowSink(args.sink_latency_ms)
+    root.addHandler(sink)
+    report["latency"]["direct"] = await run_scenario(handler, args.requests, args.concurrency)
+
+    if not configure_logging():
+        raise SystemExit("The log pipeline did not start (is LOG_PIPELINE_ENABLED off?)")
+    report["latency"]["pipeline"] = await run_scenario(handler, args.requests, args.concurrency)
+    report["pipeline_stats"] = get_logging_stats()
+    shutdown_logging()
+
+    # Call cost against a sink that is fast, so only the request-thread work is compared
+    sink.latency = 0.0
+    report["call_cost_us"]["direct"] = call_cost_us(args.iterations)
+    configure_logging()
+    report["call_cost_us"]["pipeline"] = call_cost_us(args.iterations)
+    shutdown_logging()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sink-latency-ms", type=float, default=2.0, help="Time each emitted record blocks")
+    parser.add_argument("--openai-latency-ms", type=float, default=20.0)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=5000, help="Logging calls per call-cost measurement")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"extract_fields_from_input, {args.requests} requests at concurrency {args.concurrency}, "
+          f"sink blocking {args.sink_latency_ms} ms per record")
+    print(f"{'logging':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, result in report["latency"].items():
+        print(f"{name:<10}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+              f"{result['throughput_rps']:>10}")
+    stats = report["pipeline_stats"]
+    print(f"pipeline: {stats['enqueued']} records queued, {stats['dropped']} dropped")
+    print(f"\nRequest-thread cost per logging call (µs):")
+    print(f"{'handler':<10}{'eager':>10}{'deferred':>10}")
+    for name, result in report["call_cost_us"].items():
+        print(f"{name:<10}{result['eager']:>10}{result['deferred']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Regression check of the deterministic extraction pre-pass (shared.pre_extract).
+
+Every corpus record pairs a message with the fields the LLM extraction returns
+for it. The check fails when a shortcut would change the result:
+
+- a message the pre-pass calls content-free has a non-null expected field
+- a cue value (duration, frequency, intensity) differs from the expected one
+  (compared case- and whitespace-insensitively)
+
+It also reports the share of corpus messages answered without OpenAI and the
+cue fields filled. The shipped corpus is a hand-labeled seed that only checks the
+rules against their author's labels; --record refreshes the expected fields from
+the live model (needs OPENAI_API_KEY), which must be done before
+PRE_EXTRACT_ENABLED or PRE_EXTRACT_CUES_ENABLED is turned on.
+
+Usage (from the repository root):
+
+    python -m benchmarks.pre_extract_check
+    python -m benchmarks.pre_extract_check --corpus my_corpus.jsonl --json
+    python -m benchmarks.pre_extract_check --record
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from shared.pre_extract import CUE_FIELDS, pre_extract
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpora", "pre_extract.jsonl")
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def _same(first: Optional[str], second: Optional[str]) -> bool:
+    def normalize(value: Optional[str]) -> Optional[str]:
+        return " ".join(value.casefold().split()) if isinstance(value, str) else value
+    return normalize(first) == normalize(second)
+
+
+def check(corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    failures = []
+    content_free = 0
+    with_cues = 0
+    cue_fields = 0
+    for record in corpus:
+        message, expected = record["message"], record["fields"]
+        result = pre_extract(message)
+        if result.content_free:
+            content_free += 1
+            extracted = {name: value for name, value in expected.items() if value is not None}
+            if extracted:
+                failures.append(f"{message!r}: treated as content-free but the LLM extracts {extracted}")
+            continue
+        if result.fields:
+            with_cues += 1
+        for name in CUE_FIELDS:
+            if name not in result.fields:
+                continue
+            cue_fields += 1
+            if not _same(result.fields[name], expected.get(name)):
+                failures.append(
+                    f"{message!r}: {name} cue {result.fields[name]!r}, the LLM extracts {expected.get(name)!r}"
+                )
+    total = len(corpus)
+    return {
+        "messages": total,
+        "content_free": content_free,
+        "avoided_rate": round(content_free / total, 4) if total else None,
+        "messages_with_cues": with_cues,
+        "cue_fields": cue_fields,
+        "failures": failures,
+    }
+
+
+async def record_expected(corpus: List[Dict[str, Any]]) -> None:
+    """Replace the expected fields with the live LLM extraction of each message."""
+    from shared.common import close_openai_client
+    from shared.turn_analysis import analyze_turn
+
+    try:
+        for record in corpus:
+            record["fields"] = (await analyze_turn(record["message"]))["fields"]
+    finally:
+        await close_openai_client()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON Lines of message and expected fields")
+    parser.add_argument("--record", action="store_true", help="Re-record the expected fields from OpenAI first")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    if args.record:
+        asyncio.run(record_expected(corpus))
+        with open(args.corpus, "w", encoding="utf-8") as handle:
+            handle.writelines(json.dumps(record) + "\n" for record in corpus)
+        print(f"Recorded {len(corpus)} extractions into {args.corpus}")
+
+    report = check(corpus)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['messages']} messages: {report['content_free']} content-free "
+              f"({report['avoided_rate']:.1%} of calls avoided), {report['messages_with_cues']} with cues "
+              f"({report['cue_fields']} cue fields)")
+        for failure in report["failures"]:
+            print(f"  FAIL {failure}")
+        if not report["failures"]:
+            print("The pre-pass agrees with the corpus extractions on every message.")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
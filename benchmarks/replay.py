@@ -0,0 +1,470 @@
+"""
+Trace-replay load generator for capacity planning.
+
+A trace is a JSON Lines file with one recorded request per line:
+
+    {"t": 12.35, "function": "analyze_turn", "body": {"session_id": "s1", "message": "..."}}
+
+"t" is the request's offset in seconds from the start of the recording. The
+replay is open-loop: requests are sent on schedule whether or not earlier ones
+have finished, so queueing shows up as latency and errors the way it would in
+production. Three schedules are available:
+
+- original inter-arrival timing, optionally sped up (--speed 2 replays twice as fast)
+- a fixed rate (--rps 40), cycling through the trace's requests
+- a stepped ramp (--ramp 10:100:10) that reports where each function saturates
+
+Requests go to the handlers in-process (default) or to a running Functions host
+(--target http://localhost:7071). In-process, OpenAI and NocoDB are the local
+stand-ins from benchmarks.stubs, with latencies from recorded samples
+(--openai-latency-file, one millisecond value per line) or a base and jitter.
+A host-wide concurrency limit stands in for httpWorkerOptions.maxConcurrentRequests
+in host.json (--host-concurrency, read from host.json by default), so the
+limit can be tuned against the trace before a peak.
+
+Usage (from the repository root):
+
+    python -m benchmarks.replay benchmarks/traces/sample.jsonl
+    python -m benchmarks.replay trace.jsonl --speed 4 --openai-latency-file openai_ms.txt
+    python -m benchmarks.replay trace.jsonl --ramp 10:200:10 --step-seconds 15 --slo-p95-ms 800
+    python -m benchmarks.replay trace.jsonl --rps 50 --duration 60 --target http://localhost:7071
+    python -m benchmarks.replay --synthesize trace.jsonl --sessions 50 --turns 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Stand-in credentials must be present before the shared clients are built
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+os.environ.setdefault("NOCODB_API_URL", "http://nocodb.local")
+os.environ.setdefault("NOCODB_API_KEY", "benchmark-key")
+
+from benchmarks.harness import Handler, invoke, make_request, summarize_latencies  # noqa: E402
+from benchmarks.stubs import LatencyModel, NocoDBStub, OpenAIStub, install_stubs, load_latency_samples  # noqa: E402
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Status recorded for requests that never got a response (transport errors)
+NO_RESPONSE = 0
+
+
+class TraceEntry(NamedTuple):
+    offset: float
+    function: str
+    body: Any
+
+
+class Sample(NamedTuple):
+    function: str
+    latency_ms: float
+    status: int
+    lag_ms: float
+
+
+Send = Callable[[str, Any], Awaitable[int]]
+
+
+def load_trace(path: str) -> List[TraceEntry]:
+    """Read a trace file, ordered by offset."""
+    entries = []
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                entries.append(TraceEntry(float(record["t"]), str(record["function"]), record.get("body")))
+            except (ValueError, KeyError, TypeError) as e:
+                raise SystemExit(f"{path}:{number}: not a trace record ({e}); expected t, function and body")
+    if not entries:
+        raise SystemExit(f"{path}: the trace is empty")
+    entries.sort(key=lambda entry: entry.offset)
+    return entries
+
+
+def original_schedule(trace: List[TraceEntry], speed: float) -> List[Tuple[float, TraceEntry]]:
+    """The recorded inter-arrival timing, compressed by ``speed``."""
+    start = trace[0].offset
+    return [((entry.offset - start) / speed, entry) for entry in trace]
+
+
+def fixed_rate_schedule(trace: List[TraceEntry], rps: float, duration: float) -> List[Tuple[float, TraceEntry]]:
+    """Evenly spaced requests at ``rps`` for ``duration`` seconds, cycling through the trace."""
+    count = max(1, int(rps * duration))
+    return [(index / rps, trace[index % len(trace)]) for index in range(count)]
+
+
+class InProcessTarget:
+    """Calls the function handlers directly, behind a host-wide concurrency limit."""
+
+    def __init__(self, host_concurrency: int):
+        self._handlers: Dict[str, Handler] = {}
+        self._slots = asyncio.Semaphore(host_concurrency)
+
+    def _handler(self, function: str) -> Handler:
+        handler = self._handlers.get(function)
+        if handler is None:
+            if function == "orchestrate_mental_health_functions":
+                import function_app
+                handler = function_app.orchestrate_mental_health_functions
+            else:
+                handler = __import__(function).main
+            self._handlers[function] = handler
+        return handler
+
+    def preload(self, functions: List[str]) -> None:
+        """Import the handlers up front so module loading does not stall the schedule."""
+        for function in functions:
+            self._handler(function)
+
+    async def __call__(self, function: str, body: Any) -> int:
+        handler = self._handler(function)
+        request = make_request(body, f"/api/{function}")
+        # Requests beyond the host limit wait here, as they would in the Functions host
+        async with self._slots:
+            response = await invoke(handler, request)
+        return response.status_code
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpTarget:
+    """POSTs to a running Functions host (func start, or a deployed app)."""
+
+    def __init__(self, base_url: str, function_key: Optional[str], timeout: float, max_connections: int):
+        import httpx
+
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"x-functions-key": function_key} if function_key else None,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def __call__(self, function: str, body: Any) -> int:
+        try:
+            response = await self._client.post(f"/api/{function}", json=body)
+        except self._httpx.HTTPError:
+            return NO_RESPONSE
+        return response.status_code
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+async def replay(schedule: List[Tuple[float, TraceEntry]], send: Send, max_in_flight: int) -> Tuple[List[Sample], int]:
+    """
+    Send every request at its scheduled time without waiting for earlier ones.
+
+    Returns:
+        The samples and the number of requests dropped because ``max_in_flight``
+        were already outstanding (the load generator's own limit)
+    """
+    loop = asyncio.get_running_loop()
+    samples: List[Sample] = []
+    tasks = set()
+    dropped = 0
+
+    async def fire(entry: TraceEntry, due: float) -> None:
+        started = loop.time()
+        try:
+            status = await send(entry.function, entry.body)
+        except Exception as e:
+            logging.error("%s raised %s: %s", entry.function, type(e).__name__, e)
+            status = NO_RESPONSE
+        samples.append(Sample(entry.function, (loop.time() - started) * 1000, status, (started - due) * 1000))
+
+    start = loop.time()
+    for offset, entry in schedule:
+        due = start + offset
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_in_flight:
+            dropped += 1
+            continue
+        task = loop.create_task(fire(entry, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return samples, dropped
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Dict[str, Any]]:
+    """Per-function latency percentiles, throughput, error rate and status counts."""
+    by_function: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        by_function.setdefault(sample.function, []).append(sample)
+
+    report = {}
+    for function, items in sorted(by_function.items()):
+        statuses = Counter(sample.status for sample in items)
+        # 5xx and missing responses are errors; admission rejections (503) are reported on their own too
+        errors = sum(count for status, count in statuses.items() if status >= 500 or status == NO_RESPONSE)
+        report[function] = {
+            "requests": len(items),
+            "throughput_rps": round(len(items) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / len(items), 4),
+            "rejected_503": statuses.get(503, 0),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            "max_lag_ms": round(max(sample.lag_ms for sample in items), 1),
+            **summarize_latencies([sample.latency_ms for sample in items]),
+        }
+    return report
+
+
+def find_saturation(
+    levels: List[Dict[str, Any]],
+    slo_p95_ms: float,
+    max_error_rate: float
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """First ramp level at which each function broke its p95 SLO or error budget."""
+    saturation: Dict[str, Optional[Dict[str, Any]]] = {}
+    for level in levels:
+        for function, result in level["functions"].items():
+            if saturation.get(function) is not None:
+                continue
+            reasons = []
+            if result["p95_ms"] > slo_p95_ms:
+                reasons.append(f"p95 {result['p95_ms']}ms > {slo_p95_ms}ms")
+            if result["error_rate"] > max_error_rate:
+                reasons.append(f"error rate {result['error_rate']:.1%} > {max_error_rate:.1%}")
+            saturation[function] = {"rps": level["rps"], "reasons": reasons} if reasons else None
+    return saturation
+
+
+def synthesize_trace(path: str, sessions: int, turns: int, think_seconds: float, seed: int) -> None:
+    """
+    Write a synthetic trace of chat sessions.
+
+    Each turn analyzes the message and checks it for risk, every third turn
+    re-scores the intake, and sessions end by saving their summary. Sessions
+    start at random over the first half of the recording.
+    """
+    from benchmarks.run import MESSAGES
+
+    rng = random.Random(seed)
+    span = sessions * think_seconds * turns / 10
+    records = []
+    for number in range(sessions):
+        session_id = f"trace-{number}"
+        clock = rng.uniform(0, span)
+        for turn in range(turns):
+            message = f"{rng.choice(MESSAGES)} (#{number}.{turn})"
+            records.append({"t": clock, "function": "analyze_turn",
+                            "body": {"session_id": session_id, "message": message}})
+            records.append({"t": clock + 0.001, "function": "risk_escalation_check",
+                            "body": {"session_id": session_id, "message": message}})
+            if turn % 3 == 2:
+                records.append({"t": clock + 0.5, "function": "evaluate_intake_progress",
+                                "body": {"session_id": session_id,
+                                         "fields": {"symptoms": "anxious", "triggers": "work" if turn > 2 else None}}})
+            clock += rng.expovariate(1 / think_seconds)
+        records.append({"t": clock, "function": "save_session_summary",
+                        "body": {"session_id": session_id, "summary": "The user described stress at work. " * 3}})
+    records.sort(key=lambda record: record["t"])
+    with open(path, "w", encoding="utf-8") as handle:
+        for record in records:
+            record["t"] = round(record["t"], 3)
+            handle.write(json.dumps(record) + "\n")
+    print(f"Wrote {len(records)} requests over {records[-1]['t']:.0f}s to {path}")
+
+
+def host_json_concurrency(default: int = 100) -> int:
+    """httpWorkerOptions.maxConcurrentRequests from host.json."""
+    try:
+        with open(os.path.join(REPO_ROOT, "host.json"), encoding="utf-8") as handle:
+            return int(json.load(handle).get("httpWorkerOptions", {}).get("maxConcurrentRequests", default))
+    except (OSError, ValueError):
+        return default
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="?", help="Trace file (JSON Lines of t, function, body)")
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument("--speed", type=float, default=1.0, help="Replay the original timing this many times faster")
+    schedule.add_argument("--rps", type=float, help="Open-loop fixed rate instead of the original timing")
+    schedule.add_argument("--ramp", metavar="START:STOP:STEP", help="Stepped fixed-rate ramp to find saturation")
+    parser.add_argument("--duration", type=float, help="Seconds per fixed-rate run (default: one pass of the trace)")
+    parser.add_argument("--step-seconds", type=float, default=10.0, help="Seconds per ramp step")
+    parser.add_argument("--slo-p95-ms", type=float, default=1000.0, help="p95 above this marks saturation")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate above this marks saturation")
+    parser.add_argument("--max-in-flight", type=int, default=5000, help="Load generator's own outstanding limit")
+    parser.add_argument("--target", help="Base URL of a Functions host; default is in-process")
+    parser.add_argument("--function-key", help="x-functions-key for --target")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout for --target")
+    parser.add_argument("--host-concurrency", type=int, help="In-process host limit (default: host.json)")
+    parser.add_argument("--openai-latency-file", help="Recorded OpenAI latencies, one millisecond value per line")
+    parser.add_argument("--openai-latency-ms", type=float, default=400.0)
+    parser.add_argument("--openai-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rpm", type=int, help="Enforce a requests-per-minute limit per OpenAI endpoint")
+    parser.add_argument("--nocodb-latency-file", help="Recorded NocoDB latencies, one millisecond value per line")
+    parser.add_argument("--nocodb-latency-ms", type=float, default=60.0)
+    parser.add_argument("--nocodb-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--nocodb-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false",
+                        help="Skip the unrecorded warm-up request per function")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--with-cache", action="store_true", help="Leave the LLM response cache enabled")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--synthesize", metavar="PATH", help="Write a synthetic trace to PATH and exit")
+    parser.add_argument("--sessions", type=int, default=40, help="Sessions in a synthetic trace")
+    parser.add_argument("--turns", type=int, default=6, help="Turns per session in a synthetic trace")
+    parser.add_argument("--think-seconds", type=float, default=8.0, help="Mean pause between a session's turns")
+    args = parser.parse_args(argv)
+    if not args.synthesize and not args.trace:
+        parser.error("a trace file is required (or --synthesize PATH)")
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    return args
+
+
+def _latency_model(path: Optional[str], base_ms: float, jitter_ms: float, seed: int) -> LatencyModel:
+    if path:
+        return LatencyModel(samples_ms=load_latency_samples(path), seed=seed)
+    return LatencyModel(base_ms, jitter_ms, seed=seed)
+
+
+def _parse_ramp(value: str) -> List[float]:
+    try:
+        start, stop, step = (float(part) for part in value.split(":"))
+    except ValueError:
+        raise SystemExit(f"--ramp expects START:STOP:STEP, got {value!r}")
+    if start <= 0 or step <= 0 or stop < start:
+        raise SystemExit("--ramp needs 0 < START <= STOP and STEP > 0")
+    levels = []
+    rps = start
+    while rps <= stop + 1e-9:
+        levels.append(round(rps, 3))
+        rps += step
+    return levels
+
+
+async def run(args: argparse.Namespace, trace: List[TraceEntry]) -> Dict[str, Any]:
+    if args.target:
+        target: Any = HttpTarget(args.target, args.function_key, args.timeout, args.max_in_flight)
+    else:
+        install_stubs(
+            openai=OpenAIStub(
+                _latency_model(args.openai_latency_file, args.openai_latency_ms, args.openai_jitter_ms, args.seed),
+                error_rate=args.openai_error_rate,
+                seed=args.seed,
+                requests_per_minute=args.openai_rpm,
+            ),
+            nocodb=NocoDBStub(
+                _latency_model(args.nocodb_latency_file, args.nocodb_latency_ms, args.nocodb_jitter_ms, args.seed),
+                error_rate=args.nocodb_error_rate,
+                seed=args.seed,
+            ),
+        )
+        target = InProcessTarget(args.host_concurrency or host_json_concurrency())
+        target.preload(sorted({entry.function for entry in trace}))
+
+    if args.warmup:
+        # One unrecorded request per function builds the shared clients before the clock starts
+        first_calls = {entry.function: entry for entry in reversed(trace)}
+        await asyncio.gather(*(target(entry.function, entry.body) for entry in first_calls.values()))
+
+    report: Dict[str, Any] = {"trace_requests": len(trace)}
+    try:
+        if args.ramp:
+            levels = []
+            for rps in _parse_ramp(args.ramp):
+                started = time.perf_counter()
+                samples, dropped = await replay(
+                    fixed_rate_schedule(trace, rps, args.step_seconds), target, args.max_in_flight
+                )
+                levels.append({
+                    "rps": rps,
+                    "dropped": dropped,
+                    "functions": summarize(samples, time.perf_counter() - started),
+                })
+            report["mode"] = "ramp"
+            report["levels"] = levels
+            report["saturation"] = find_saturation(levels, args.slo_p95_ms, args.max_error_rate)
+        else:
+            if args.rps:
+                duration = args.duration or len(trace) / args.rps
+                schedule = fixed_rate_schedule(trace, args.rps, duration)
+                report["mode"] = f"fixed {args.rps} rps"
+            else:
+                schedule = original_schedule(trace, args.speed)
+                report["mode"] = f"original timing x{args.speed:g}"
+            started = time.perf_counter()
+            samples, dropped = await replay(schedule, target, args.max_in_flight)
+            report["elapsed_s"] = round(time.perf_counter() - started, 2)
+            report["dropped"] = dropped
+            report["functions"] = summarize(samples, report["elapsed_s"])
+    finally:
+        await target.close()
+    return report
+
+
+def print_functions(functions: Dict[str, Dict[str, Any]], prefix: str = "") -> None:
+    for function, result in functions.items():
+        print(
+            f"{prefix}{function:<38}{result['requests']:>7}{result['throughput_rps']:>9}"
+            f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+            f"{result['error_rate']:>8.1%}{result['max_lag_ms']:>10}"
+        )
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = (
+        f"{'function':<38}{'reqs':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'errors':>8}{'lag ms':>10}"
+    )
+    print(f"Replaying {report['trace_requests']} trace requests, {report['mode']}")
+    if report["mode"] != "ramp":
+        print(header)
+        print("-" * len(header))
+        print_functions(report["functions"])
+        print(f"\nElapsed {report['elapsed_s']}s, {report['dropped']} dropped by the load generator")
+        return
+
+    for level in report["levels"]:
+        print(f"\n{level['rps']} rps ({level['dropped']} dropped)")
+        print(header)
+        print_functions(level["functions"])
+    print("\nSaturation:")
+    for function, point in report["saturation"].items():
+        if point is None:
+            print(f"  {function}: not saturated within the ramp")
+        else:
+            print(f"  {function}: {point['rps']} rps ({'; '.join(point['reasons'])})")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.synthesize:
+        synthesize_trace(args.synthesize, args.sessions, args.turns, args.think_seconds, args.seed)
+        return 0
+    if not args.with_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args, load_trace(args.trace)))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
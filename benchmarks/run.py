@@ -0,0 +1,262 @@
+"""
+Offline micro-benchmarks for every function handler and the orchestrator.
+
+OpenAI and NocoDB are replaced by in-process stand-ins with configurable latency
+and error rates, so results depend only on our code and the injected delays.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run
+    python -m benchmarks.run --functions risk_escalation_check switch_chat_mode \\
+        --openai-latency-ms 80 --concurrency 1 10 50 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --max-regression 0.15
+
+With --compare, the run exits with status 1 if any scenario's p95 latency or
+throughput regressed by more than --max-regression (a fraction) against the
+baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Stand-in credentials must be present before the shared clients are built
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-key")
+os.environ.setdefault("NOCODB_API_URL", "http://nocodb.local")
+os.environ.setdefault("NOCODB_API_KEY", "benchmark-key")
+
+from benchmarks.harness import Handler, measure_allocations, run_load  # noqa: E402
+from benchmarks.stubs import LatencyModel, NocoDBStub, OpenAIStub, install_stubs  # noqa: E402
+
+
+MESSAGES = [
+    "Hello, how are you today?",
+    "I've been feeling overwhelmed for a few weeks. It gets worse at work.",
+    "I feel anxious most nights and can't sleep.",
+    "What can I do when it happens?",
+    "Thanks, I think that's all for now, bye.",
+]
+
+
+class Scenario(NamedTuple):
+    name: str
+    load_handler: Callable[[], Handler]
+    make_body: Callable[[int], Any]
+
+
+def _message(index: int) -> str:
+    # A per-request suffix keeps response caches from answering benchmark traffic
+    return f"{MESSAGES[index % len(MESSAGES)]} (#{index})"
+
+
+def _orchestrator() -> Handler:
+    import function_app
+    return function_app.orchestrate_mental_health_functions
+
+
+def _handler(module_name: str) -> Callable[[], Handler]:
+    def load() -> Handler:
+        module = __import__(module_name)
+        return module.main
+    return load
+
+
+SCENARIOS = [
+    Scenario(
+        "extract_fields_from_input",
+        _handler("extract_fields_from_input"),
+        lambda i: {"session_id": f"bench-{i}", "message": _message(i)},
+    ),
+    Scenario(
+        "analyze_turn",
+        _handler("analyze_turn"),
+        lambda i: {"session_id": f"bench-{i}", "message": _message(i)},
+    ),
+    Scenario(
+        "risk_escalation_check",
+        _handler("risk_escalation_check"),
+        lambda i: {"session_id": f"bench-{i}", "message": _message(i)},
+    ),
+    Scenario(
+        "switch_chat_mode",
+        _handler("switch_chat_mode"),
+        lambda i: {"session_id": f"bench-{i}", "context": _message(i)},
+    ),
+    Scenario(
+        "evaluate_intake_progress",
+        _handler("evaluate_intake_progress"),
+        lambda i: {
+            "session_id": f"bench-{i}",
+            "fields": {"symptoms": "anxious", "duration": "a few weeks" if i % 2 else None},
+        },
+    ),
+    Scenario(
+        "evaluate_intake_progress_batch",
+        _handler("evaluate_intake_progress"),
+        lambda i: [
+            {"session_id": f"bench-{i}-{j}", "fields": {"symptoms": "anxious", "triggers": "work" if j % 3 else None}}
+            for j in range(500)
+        ],
+    ),
+    Scenario(
+        "save_session_summary",
+        _handler("save_session_summary"),
+        lambda i: {"session_id": f"bench-{i}", "summary": "The user reported anxiety at work. " * 4},
+    ),
+    Scenario(
+        "orchestrate_mental_health_functions",
+        _orchestrator,
+        lambda i: {"session_id": f"bench-{i}", "message": _message(i)},
+    ),
+]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the function handlers against local stand-ins.")
+    parser.add_argument("--functions", nargs="*", help="Scenario names to run (default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 10, 50], help="Concurrency levels")
+    parser.add_argument("--warmup", type=int, default=10, help="Warm-up requests per scenario")
+    parser.add_argument("--alloc-requests", type=int, default=50, help="Requests traced for allocations (0 disables)")
+    parser.add_argument("--openai-latency-ms", type=float, default=50.0)
+    parser.add_argument("--openai-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rpm", type=int, help="Enforce a requests-per-minute limit per OpenAI endpoint")
+    parser.add_argument("--nocodb-latency-ms", type=float, default=20.0)
+    parser.add_argument("--nocodb-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--nocodb-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--with-cache", action="store_true", help="Leave the LLM response cache enabled")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare results with a saved baseline")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Allowed regression fraction")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+    return parser.parse_args(argv)
+
+
+async def run_scenarios(args: argparse.Namespace) -> Dict[str, Any]:
+    openai_stub = OpenAIStub(
+        LatencyModel(args.openai_latency_ms, args.openai_jitter_ms, seed=args.seed),
+        error_rate=args.openai_error_rate,
+        seed=args.seed,
+        requests_per_minute=args.openai_rpm,
+    )
+    nocodb_stub = NocoDBStub(
+        LatencyModel(args.nocodb_latency_ms, args.nocodb_jitter_ms, seed=args.seed),
+        error_rate=args.nocodb_error_rate,
+        seed=args.seed,
+    )
+    install_stubs(openai=openai_stub, nocodb=nocodb_stub)
+
+    selected = [s for s in SCENARIOS if not args.functions or s.name in args.functions]
+    results: Dict[str, Any] = {}
+    for scenario in selected:
+        handler = scenario.load_handler()
+        await run_load(handler, scenario.make_body, args.warmup, min(args.warmup, 10))
+
+        calls_before = openai_stub.total_calls + nocodb_stub.total_calls
+        levels = []
+        for concurrency in args.concurrency:
+            levels.append(await run_load(handler, scenario.make_body, args.requests, concurrency))
+        outbound = openai_stub.total_calls + nocodb_stub.total_calls - calls_before
+
+        result: Dict[str, Any] = {
+            "levels": levels,
+            "outbound_calls_per_request": round(outbound / (args.requests * len(args.concurrency)), 3),
+        }
+        if args.alloc_requests:
+            result["allocations"] = await measure_allocations(handler, scenario.make_body, args.alloc_requests)
+        results[scenario.name] = result
+
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Return one message per metric that regressed beyond the allowed fraction."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        previous_levels = {level["concurrency"]: level for level in previous["levels"]}
+        for level in result["levels"]:
+            before = previous_levels.get(level["concurrency"])
+            if not before:
+                continue
+            if before["p95_ms"] and level["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+                regressions.append(
+                    f"{name} c={level['concurrency']}: p95 {before['p95_ms']}ms -> {level['p95_ms']}ms"
+                )
+            if before["throughput_rps"] and level["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+                regressions.append(
+                    f"{name} c={level['concurrency']}: throughput "
+                    f"{before['throughput_rps']} -> {level['throughput_rps']} req/s"
+                )
+    return regressions
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    header = f"{'scenario':<38}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        for level in result["levels"]:
+            print(
+                f"{name:<38}{level['concurrency']:>6}{level['throughput_rps']:>10}"
+                f"{level['p50_ms']:>10}{level['p95_ms']:>10}{level['p99_ms']:>10}{level['errors']:>6}"
+            )
+        allocations = result.get("allocations")
+        if allocations:
+            print(
+                f"{'':<38}alloc peak {allocations['peak_kib_per_request']} KiB/req, "
+                f"retained {allocations['retained_kib']} KiB, "
+                f"{result['outbound_calls_per_request']} outbound calls/req"
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if not args.with_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(run_scenarios(args))
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "compare", "json")},
+        "results": results,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
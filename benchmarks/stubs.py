@@ -0,0 +1,258 @@
+"""
+Local stand-ins for OpenAI and NocoDB used by the benchmarks.
+
+Each stand-in is an async httpx handler served through httpx.MockTransport and
+installed with shared.common.use_transport(), so the handlers under test run
+their real code paths (client pool, SDK parsing, retries) without the network.
+Latency and error injection are configurable per service.
+"""
+
+import asyncio
+import json
+import random
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import httpx
+
+from shared.common import use_transport
+
+
+INTAKE_FIELDS = [
+    "symptoms", "duration", "triggers", "intensity",
+    "frequency", "impact_on_life", "coping_mechanisms",
+]
+
+
+class LatencyModel:
+    """
+    Response delay for a stand-in.
+
+    Either a base delay with uniform jitter, or an empirical distribution sampled
+    from recorded latencies (milliseconds).
+    """
+
+    def __init__(
+        self,
+        base_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        samples_ms: Optional[Sequence[float]] = None,
+        seed: Optional[int] = None
+    ):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self.samples_ms = list(samples_ms) if samples_ms else None
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        """Delay in seconds for one request."""
+        if self.samples_ms:
+            return self._random.choice(self.samples_ms) / 1000.0
+        return max(0.0, self.base_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+
+class StubService:
+    """Shared latency, error injection and request accounting for a stand-in."""
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls: Dict[str, int] = {}
+        self._random = random.Random(seed)
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        route = f"{request.method} {request.url.path}"
+        self.calls[route] = self.calls.get(route, 0) + 1
+        delay = self.latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return httpx.Response(self.error_status, json={"error": {"message": "injected failure"}})
+        return self.respond(request)
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        raise NotImplementedError
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+class OpenAIStub(StubService):
+    """
+    Answers chat completions (turn analysis: fields and mode, or the fields-only
+    extraction) and moderations.
+
+    With requests_per_minute set, each endpoint enforces that limit like OpenAI:
+    responses carry x-ratelimit-* headers and requests over the limit get a 429.
+    """
+
+    def __init__(self, *args: Any, requests_per_minute: Optional[int] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.requests_per_minute = requests_per_minute
+        self.throttled = 0
+        self._windows: Dict[str, List[float]] = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if not self.requests_per_minute:
+            return await super().__call__(request)
+        now = asyncio.get_running_loop().time()
+        window = [t for t in self._windows.get(request.url.path, []) if now - t < 60.0]
+        self._windows[request.url.path] = window
+        if len(window) >= self.requests_per_minute:
+            self.throttled += 1
+            reset = 60.0 - (now - window[0])
+            return httpx.Response(429, headers=self._limit_headers(0, reset), json={"error": {"message": "rate limited"}})
+        window.append(now)
+        response = await super().__call__(request)
+        response.headers.update(self._limit_headers(self.requests_per_minute - len(window), 60.0 / self.requests_per_minute))
+        return response
+
+    def _limit_headers(self, remaining: int, reset_seconds: float) -> Dict[str, str]:
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(max(0, remaining)),
+            "x-ratelimit-reset-requests": f"{reset_seconds:.3f}s",
+        }
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content or b"{}")
+        if request.url.path.endswith("/moderations"):
+            inputs = body.get("input")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            return httpx.Response(200, json={
+                "id": "modr-stub",
+                "model": "omni-moderation-latest",
+                "results": [self._moderation(str(text)) for text in inputs],
+            })
+        return httpx.Response(200, json={
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self._completion(body)},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    @staticmethod
+    def _moderation(text: str) -> Dict[str, Any]:
+        lowered = text.lower()
+        self_harm = "hurt myself" in lowered or "end it" in lowered
+        violence = "hurt someone" in lowered
+        return {
+            "flagged": self_harm or violence,
+            "categories": {"self-harm": self_harm, "violence": violence},
+            "category_scores": {"self-harm": float(self_harm), "violence": float(violence)},
+        }
+
+    @staticmethod
+    def _completion(body: Dict[str, Any]) -> str:
+        messages = body.get("messages") or [{}]
+        system = str(messages[0].get("content", ""))
+        user = str(messages[-1].get("content", "")).lower()
+        schema = ((body.get("response_format") or {}).get("json_schema") or {})
+        if "turn analyzer" not in system and schema.get("name") != "intake_fields":
+            return "intake"
+        fields: Dict[str, Optional[str]] = {name: None for name in INTAKE_FIELDS}
+        if "overwhelmed" in user or "anxious" in user:
+            fields["symptoms"] = "overwhelmed" if "overwhelmed" in user else "anxious"
+        if "weeks" in user:
+            fields["duration"] = "a few weeks"
+        if "work" in user:
+            fields["triggers"] = "work"
+        if schema.get("name") == "intake_fields":
+            return json.dumps({name: fields[name] for name in schema["schema"]["required"]})
+        if "summar" in user or "bye" in user:
+            mode = "summary"
+        elif "?" in user:
+            mode = "advice"
+        else:
+            mode = "intake"
+        return json.dumps({"fields": fields, "mode": mode})
+
+
+class NocoDBStub(StubService):
+    """
+    Keeps the session ids of the rows written to it and answers like NocoDB:
+    updates of unknown rows get 404, duplicate creates 400, and listings page
+    through the known ids.
+    """
+
+    def __init__(self, *args: Any, existing: Iterable[str] = (), **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.rows: Dict[str, Dict[str, Any]] = {session_id: {"session_id": session_id} for session_id in existing}
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return self._list(request)
+        payload = json.loads(request.content or b"null")
+        if "/bulk/" in request.url.path:
+            for row in payload if isinstance(payload, list) else []:
+                if request.method == "POST" and row.get("session_id") is not None:
+                    self.rows[str(row["session_id"])] = row
+            return httpx.Response(200, json=payload)
+
+        if request.method == "PATCH":
+            session_id = _where_session_id(request) or request.url.path.rsplit("/", 1)[-1]
+            if session_id not in self.rows:
+                return httpx.Response(404, json={"msg": "Record not found"})
+            self.rows[session_id].update(payload or {})
+            return httpx.Response(200, json=self.rows[session_id])
+
+        session_id = str((payload or {}).get("session_id"))
+        if session_id in self.rows:
+            return httpx.Response(400, json={"msg": f"Duplicate entry '{session_id}'"})
+        self.rows[session_id] = payload or {}
+        return httpx.Response(200, json={"Id": len(self.rows), **(payload or {})})
+
+    def _list(self, request: httpx.Request) -> httpx.Response:
+        where = request.url.params.get("where") or ""
+        if where.startswith("(session_id,in,"):
+            wanted = where[len("(session_id,in,"):-1].split(",")
+            found = [{"Id": index, "session_id": session_id} for index, session_id in enumerate(wanted)
+                     if session_id in self.rows]
+            return httpx.Response(200, json={"list": found, "pageInfo": {"isLastPage": True}})
+        offset = int(request.url.params.get("offset") or 0)
+        limit = int(request.url.params.get("limit") or 25)
+        session_ids = list(self.rows)[offset:offset + limit]
+        return httpx.Response(200, json={
+            "list": [{"session_id": session_id} for session_id in session_ids],
+            "pageInfo": {"isLastPage": offset + limit >= len(self.rows)},
+        })
+
+
+def _where_session_id(request: httpx.Request) -> Optional[str]:
+    where = request.url.params.get("where") or ""
+    if where.startswith("(session_id,eq,"):
+        return where[len("(session_id,eq,"):-1]
+    return None
+
+
+def install_stubs(openai: Optional[OpenAIStub] = None, nocodb: Optional[NocoDBStub] = None) -> None:
+    """Route the pooled OpenAI / NocoDB clients through the given stand-ins."""
+    if openai is not None:
+        use_transport("openai", httpx.MockTransport(openai))
+    if nocodb is not None:
+        use_transport("nocodb", httpx.MockTransport(nocodb))
+
+
+def uninstall_stubs() -> None:
+    """Restore the network transports."""
+    use_transport("openai", None)
+    use_transport("nocodb", None)
+
+
+def load_latency_samples(path: str) -> List[float]:
+    """Read recorded latencies (one number of milliseconds per line) for LatencyModel."""
+    with open(path, encoding="utf-8") as handle:
+        return [float(line) for line in handle if line.strip()]
@@ -0,0 +1,201 @@
+"""
+Durable end-of-session processing.
+
+POST /api/end_session starts (or finds) the session's orchestration and returns
+202 with the Durable Functions status URLs at once, so the chat UI never waits
+for it. The orchestration fans out in parallel to activity functions that wrap
+the existing logic:
+
+- score_intake_activity: final intake score (shared.intake / session state)
+- risk_recheck_activity: moderation of the whole transcript (risk_escalation_check)
+- save_summary_activity: summary persistence through nocodb_upsert; without a
+  summary in the request, the session's rolling transcript summary is brought up
+  to date and saved instead (SESSION_LOG_SINK=transcript)
+
+Activity results are checkpointed in the task hub, so after a worker restart or
+a failed attempt the orchestration replays and only re-runs the activities that
+had not completed. Failing activities are retried (ACTIVITY_RETRY).
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import azure.durable_functions as df
+import azure.functions as func
+
+from risk_escalation_check import moderate_batch
+from shared.common import nocodb_upsert
+from shared.http import Field, HttpError, Schema, error_body, json_response
+from shared.intake import calculate_intake_score, is_field_non_empty
+from shared.session_state import get_session_state_store
+from shared.storage import flush_session_log
+from shared.transcripts import get_transcript_store, is_transcript_store_enabled, update_rolling_summary
+
+
+bp = df.Blueprint()
+
+ORCHESTRATOR_NAME = "end_of_session_orchestrator"
+SUMMARY_MAX_LENGTH = 2000
+# Transcript messages moderated per API request
+TRANSCRIPT_CHUNK_SIZE = 32
+
+ACTIVITY_RETRY = df.RetryOptions(first_retry_interval_in_milliseconds=5000, max_number_of_attempts=4)
+
+# Higher-severity flags win when several transcript messages are flagged
+FLAG_SEVERITY = {"self-harm": 2, "violence": 1}
+
+REQUEST_SCHEMA = Schema(
+    Field("session_id", str, required=True, strip=True, non_empty=True),
+    Field("summary", str),
+    Field("transcript", list, default=()),
+    Field("fields", dict),
+)
+INVALID_TRANSCRIPT_BODY = error_body("Invalid 'transcript' field: must be an array of strings.")
+
+_ACTIVE_STATUSES = {
+    df.OrchestrationRuntimeStatus.Pending,
+    df.OrchestrationRuntimeStatus.Running,
+    df.OrchestrationRuntimeStatus.ContinuedAsNew,
+}
+
+
+@bp.route(route="end_session", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+async def start_end_of_session(req: func.HttpRequest, client: df.DurableOrchestrationClient) -> func.HttpResponse:
+    """
+    Start end-of-session processing in the background.
+
+    Expected input JSON:
+    {
+        "session_id": "abc123",
+        "summary": "Optional final summary to persist",
+        "transcript": ["user message", "..."],
+        "fields": {"symptoms": "..."}
+    }
+
+    "fields" is optional; the session's accumulated intake state is used when it
+    is omitted. Without "summary", the rolling summary of the session's recorded
+    transcript is saved, if there is one. Returns 202 with statusQueryGetUri and
+    the other management URLs. A session whose processing is still running is not
+    started twice.
+    """
+    try:
+        payload = REQUEST_SCHEMA.parse(req)
+    except HttpError as e:
+        return e.to_response()
+
+    session_id = payload["session_id"]
+    summary = payload["summary"]
+    transcript = payload["transcript"]
+    if not all(isinstance(message, str) for message in transcript):
+        return json_response(INVALID_TRANSCRIPT_BODY, status_code=400)
+
+    fields = payload["fields"]
+    if fields is None:
+        state = get_session_state_store().get_state(session_id)
+        fields = state["fields"] if state else {}
+
+    # Without a summary, save the rolling summary of the recorded transcript
+    rolling_summary = (
+        not summary and is_transcript_store_enabled() and get_transcript_store().turn_count(session_id) > 0
+    )
+
+    # One instance per session: a repeated request reports the running orchestration
+    instance_id = f"end-of-session-{session_id}"
+    existing = await client.get_status(instance_id)
+    if existing and existing.runtime_status in _ACTIVE_STATUSES:
+        logging.info("[end_session] processing already running for session: %s", session_id)
+        return client.create_check_status_response(req, instance_id)
+
+    await client.start_new(ORCHESTRATOR_NAME, instance_id, {
+        "session_id": session_id,
+        "summary": summary,
+        "transcript": [message for message in transcript if message.strip()],
+        "fields": fields,
+        "rolling_summary": rolling_summary,
+    })
+    logging.info("[end_session] started %s", instance_id)
+    return client.create_check_status_response(req, instance_id)
+
+
+@bp.orchestration_trigger(context_name="context")
+def end_of_session_orchestrator(context: df.DurableOrchestrationContext):
+    """Fan out scoring, the transcript risk re-check and summary persistence, then join."""
+    data = context.get_input() or {}
+    session_id = data["session_id"]
+
+    stages = ["scoring"]
+    tasks = [context.call_activity_with_retry("score_intake_activity", ACTIVITY_RETRY, {
+        "session_id": session_id,
+        "fields": data.get("fields") or {},
+    })]
+    if data.get("transcript"):
+        stages.append("risk")
+        tasks.append(context.call_activity_with_retry("risk_recheck_activity", ACTIVITY_RETRY, {
+            "transcript": data["transcript"],
+        }))
+    if data.get("summary") or data.get("rolling_summary"):
+        stages.append("summary")
+        # Timestamps come from the orchestration clock so replays send the same row
+        updated_at = context.current_utc_datetime.strftime("%Y-%m-%dT%H:%M:%SZ")
+        tasks.append(context.call_activity_with_retry("save_summary_activity", ACTIVITY_RETRY, {
+            "session_id": session_id,
+            "summary": data.get("summary"),
+            "updated_at": updated_at,
+        }))
+
+    context.set_custom_status({"stage": "fan_out", "pending": stages})
+    results = yield context.task_all(tasks)
+    outcome = dict(zip(stages, results))
+
+    context.set_custom_status({"stage": "completed", "pending": []})
+    return {
+        "session_id": session_id,
+        "intake": outcome["scoring"],
+        "risk": outcome.get("risk", {"flag": None, "flagged_messages": [], "checked_messages": 0}),
+        "summary_saved": outcome.get("summary", {}).get("status") == "ok",
+    }
+
+
+@bp.activity_trigger(input_name="payload")
+def score_intake_activity(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Final intake score of the session, folding in any fields sent with the request."""
+    session_id = payload["session_id"]
+    fields = {name: value for name, value in (payload.get("fields") or {}).items() if is_field_non_empty(value)}
+    store = get_session_state_store()
+    if store.get_state(session_id) is not None:
+        state = store.merge_fields(session_id, fields)
+        return {"score": state["score"], "enough_data": state["enough_data"], "fields": state["fields"]}
+    # Activities can run on another worker than the chat turns; score what was sent
+    score, enough_data = calculate_intake_score(fields)
+    return {"score": score, "enough_data": enough_data, "fields": fields}
+
+
+@bp.activity_trigger(input_name="payload")
+async def risk_recheck_activity(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Moderate the whole transcript and report the most severe flag found."""
+    transcript: List[str] = payload.get("transcript") or []
+    flags: List[Optional[str]] = []
+    for start in range(0, len(transcript), TRANSCRIPT_CHUNK_SIZE):
+        flags.extend(await moderate_batch(transcript[start:start + TRANSCRIPT_CHUNK_SIZE]))
+
+    flagged = [index for index, flag in enumerate(flags) if flag]
+    flag = max((flags[index] for index in flagged), key=FLAG_SEVERITY.get, default=None)
+    return {"flag": flag, "flagged_messages": flagged, "checked_messages": len(transcript)}
+
+
+@bp.activity_trigger(input_name="payload")
+async def save_summary_activity(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist the session summary through nocodb_upsert (an upsert, so retries are safe)."""
+    summary = payload.get("summary")
+    if not summary:
+        # Turns of this worker may still sit in the write-behind buffer
+        await asyncio.to_thread(flush_session_log)
+        summary = await update_rolling_summary(payload["session_id"])
+        if not summary:
+            return {"status": "skipped"}
+    summary = summary.strip()[:SUMMARY_MAX_LENGTH]
+    await nocodb_upsert(payload["session_id"], summary, payload.get("updated_at"))
+    return {"status": "ok"}
+
@@ -1,118 +1,113 @@
-import json
 import logging
-import httpx
 import azure.functions as func
+from shared.admission import admission_controlled
+from shared.http import Field, HttpError, Schema, dumps, error_body, json_handler, json_response, parse_json
+from shared.intake import (
+    calculate_intake_score,
+    get_intake_config,
+    iter_batch_results,
+    iter_ndjson,
+)
+from shared.session_state import get_session_state_store
+from shared.timing import mark, stage, timed_handler
 
+FUNCTION_NAME = "evaluate_intake_progress"
 
+REQUEST_SCHEMA = Schema(
+    Field("session_id", (str, int), required=True, coerce=str),
+    Field("fields", dict),
+    Field("merge", bool, default=True),
+)
+
+MISSING_FIELDS_BODY = error_body("Missing required field: 'fields'.")
+INVALID_SESSIONS_BODY = error_body("Invalid input: 'sessions' must be an array.")
+
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME, "Internal server error occurred.")
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     Azure Function to evaluate intake progress based on collected fields.
     
     Calculates a weighted score and determines if enough data has been collected.
+    By default fields are merged into the server-side state of the session, so
+    "fields" may carry only what changed, or be omitted to score what has been
+    collected so far. That state is kept per worker (or in the SQLite file of
+    SESSION_STATE_BACKEND=sqlite), and merging never clears a value. With
+    "merge": false the sent fields are scored exactly as given, without reading
+    or updating any state: the original contract, for clients that resend the
+    full object.
+    
+    Batch mode scores many sessions in one request. The body is either a JSON
+    array of {"session_id", "fields"} records, an NDJSON stream of them
+    (Content-Type: application/x-ndjson), or {"sessions": [...], "weights": {...},
+    "threshold": n}. Results are returned as NDJSON, one line per record in
+    input order.
     """
     logging.info('evaluate_intake_progress function processed a request.')
     
-    try:
-        # Parse JSON input
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Invalid JSON in request body."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        if not req_body:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Request body is required."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Validate required fields
-        if "session_id" not in req_body:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing required field: 'session_id'."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        if "fields" not in req_body:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing required field: 'fields'."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        fields = req_body["fields"]
-        if not isinstance(fields, dict):
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Invalid input: 'fields' must be an object."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Define field weights
-        field_weights = {
-            "symptoms": 3,
-            "duration": 2,
-            "triggers": 2,
-            "intensity": 1,
-            "frequency": 1,
-            "impact_on_life": 2,
-            "coping_mechanisms": 1
-        }
-        
-        # Calculate score
-        score = 0
-        for field_name, weight in field_weights.items():
-            field_value = fields.get(field_name)
-            if is_field_non_empty(field_value):
-                score += weight
-        
-        # Determine if enough data collected (threshold: 6 out of 12)
-        enough_data = score >= 6
-        
-        # Return success response
-        return func.HttpResponse(
-            json.dumps({
-                "status": "ok",
-                "score": score,
-                "enough_data": enough_data
-            }),
-            status_code=200,
-            mimetype="application/json"
-        )
-        
-    except Exception as e:
-        logging.error(f"Unexpected error in evaluate_intake_progress: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({
-                "status": "error",
-                "message": "Internal server error occurred."
-            }),
-            status_code=500,
-            mimetype="application/json"
+    if "ndjson" in (req.headers.get("Content-Type") or "").lower():
+        return evaluate_batch(iter_ndjson(req.get_body()))
+    
+    with stage("parse"):
+        req_body = parse_json(req)
+    
+    # Batch mode: a JSON array of records, or an object with a "sessions" list
+    if isinstance(req_body, list):
+        return evaluate_batch(req_body)
+    
+    if isinstance(req_body, dict) and "sessions" in req_body:
+        return evaluate_batch(
+            req_body["sessions"],
+            req_body.get("weights"),
+            req_body.get("threshold")
         )
+    
+    payload = REQUEST_SCHEMA.validate(req_body)
+    session_id = payload["session_id"]
+    fields = payload["fields"]
+    mark("validate")
+    
+    if not payload["merge"]:
+        if fields is None:
+            raise HttpError(400, MISSING_FIELDS_BODY)
+        with stage("score"):
+            score, enough_data = calculate_intake_score(fields)
+        return json_response({"status": "ok", "score": score, "enough_data": enough_data})
+    
+    store = get_session_state_store()
+    
+    # Without fields, score the state accumulated on the server for this session
+    if fields is None:
+        state = store.get_state(session_id)
+        if state is None:
+            raise HttpError(400, MISSING_FIELDS_BODY)
+    else:
+        with stage("score"):
+            state = store.merge_fields(session_id, fields)
+    
+    return json_response({
+        "status": "ok",
+        "score": state["score"],
+        "enough_data": state["enough_data"]
+    })
 
 
-def is_field_non_empty(value) -> bool:
-    """Check if a field value is non-empty (non-null, non-whitespace string)."""
-    return value is not None and isinstance(value, str) and value.strip() != ""
-
+def evaluate_batch(records, weights=None, threshold=None) -> func.HttpResponse:
+    """Score a batch of sessions chunk by chunk (NumPy weighting per chunk), returning NDJSON."""
+    if not isinstance(records, list) and not hasattr(records, "__next__"):
+        raise HttpError(400, INVALID_SESSIONS_BODY)
+    
+    try:
+        config = get_intake_config(weights, threshold)
+    except ValueError as e:
+        raise HttpError(400, error_body(f"Invalid scoring configuration: {str(e)}")) from None
+    
+    with stage("score"):
+        lines = b"".join(dumps(result) + b"\n" for result in iter_batch_results(records, config))
+    return func.HttpResponse(
+        lines,
+        status_code=200,
+        mimetype="application/x-ndjson"
+    )
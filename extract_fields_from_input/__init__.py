@@ -1,79 +1,80 @@
 import azure.functions as func
-import json
 import logging
-from shared.common import get_openai_client
+from shared.admission import admission_controlled
+from shared.http import Field, Schema, json_handler, json_response
+from shared.pre_extract import are_cues_enabled, get_pre_extract_stats, is_pre_extract_enabled, pre_extract
+from shared.resilience import ServiceUnavailableError
+from shared.session_state import get_session_state_store
+from shared.timing import mark, stage, timed_handler
+from shared.turn_analysis import INTAKE_FIELDS, analyze_turn, empty_fields, extract_fields
 
 
+FUNCTION_NAME = "extract_fields_from_input"
+
+REQUEST_SCHEMA = Schema(
+    Field("message", str, required=True, strip=True, non_empty=True),
+    Field("session_id", (str, int), coerce=str),
+)
+
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME, "Field extraction failed.")
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     """Extract structured fields from user messages using OpenAI gpt-4o-mini."""
+    payload = REQUEST_SCHEMA.parse(req)
+    message = payload["message"]
+    session_id = payload["session_id"]
+    mark("validate")
+    
+    # Log session_id but not message content for privacy
+    logging.info("Processing field extraction for session: %s", session_id)
+    
+    # Extract fields using OpenAI; while it is unavailable, answer with nothing extracted
     try:
-        # Parse and validate request
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            return func.HttpResponse(
-                json.dumps({"status": "error", "message": "Missing 'message' field or OpenAI call failed."}),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        if not req_body or not req_body.get("message"):
-            return func.HttpResponse(
-                json.dumps({"status": "error", "message": "Missing 'message' field or OpenAI call failed."}),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        message = req_body["message"]
-        session_id = req_body.get("session_id")
-        
-        # Log session_id but not message content for privacy
-        logging.info(f"Processing field extraction for session: {session_id}")
-        
-        # Extract fields using OpenAI
         fields = await extract_fields_with_openai(message)
-        
-        return func.HttpResponse(
-            json.dumps({"status": "ok", "fields": fields}),
-            status_code=200,
-            mimetype="application/json"
-        )
-        
-    except Exception as e:
-        logging.error(f"Error in extract_fields_from_input: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"status": "error", "message": "Missing 'message' field or OpenAI call failed."}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        result = {"status": "ok", "fields": fields}
+    except ServiceUnavailableError as e:
+        logging.warning("Field extraction degraded for session %s: %s", session_id, e)
+        fields = empty_fields()
+        result = {"status": "ok", "fields": fields, "degraded": True}
+    
+    # Fold this turn into the session's accumulated intake state
+    if session_id:
+        with stage("state"):
+            state = get_session_state_store().merge_fields(session_id, fields)
+        result["accumulated_fields"] = state["fields"]
+        result["score"] = state["score"]
+        result["enough_data"] = state["enough_data"]
+    
+    return json_response(result)
 
 
 async def extract_fields_with_openai(message: str) -> dict:
-    """Extract structured fields from user message using OpenAI."""
-    
-    system_prompt = """You are a data extractor for a mental health assistant. Based on the user's message, extract the following fields in this order and with these exact names: symptoms, duration, triggers, intensity, frequency, impact_on_life, coping_mechanisms. If a field is not clearly mentioned, return null. Output the result as a flat JSON object. Do not guess, infer, or fabricate.
+    """
+    Extract structured fields from a user message via the combined turn analysis.
 
-Examples:
-User: "I've been feeling overwhelmed for a few weeks. It gets worse at work."
-Output: {"symptoms": "overwhelmed", "duration": "a few weeks", "triggers": "work", "intensity": null, "frequency": null, "impact_on_life": null, "coping_mechanisms": null}
+    With PRE_EXTRACT_ENABLED, the deterministic pre-pass answers content-free
+    messages without OpenAI and, with PRE_EXTRACT_CUES_ENABLED as well, fills the
+    easy cue fields so only the others are asked for.
+    """
+    if not is_pre_extract_enabled():
+        analysis = await analyze_turn(message, function_name=FUNCTION_NAME)
+        return analysis["fields"]
 
-User: "Hello, how are you today?"
-Output: {"symptoms": null, "duration": null, "triggers": null, "intensity": null, "frequency": null, "impact_on_life": null, "coping_mechanisms": null}"""
-    
-    client = get_openai_client()
-    
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ],
-        temperature=0.3,
-        max_tokens=500,
-        timeout=10
-    )
-    
-    # Parse and return the JSON response
-    content = response.choices[0].message.content.strip()
-    return json.loads(content)
+    stats = get_pre_extract_stats()
+    with stage("pre_extract"):
+        pre = pre_extract(message)
+    if pre.content_free:
+        stats.record("content_free")
+        return empty_fields()
+
+    if pre.fields and are_cues_enabled():
+        remaining = [name for name in INTAKE_FIELDS if name not in pre.fields]
+        fields = await extract_fields(message, remaining, function_name=FUNCTION_NAME)
+        stats.record("narrowed", len(pre.fields))
+        return {name: pre.fields.get(name, fields.get(name)) for name in INTAKE_FIELDS}
 
+    analysis = await analyze_turn(message, function_name=FUNCTION_NAME)
+    stats.record("full")
+    return analysis["fields"]
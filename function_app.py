@@ -1,35 +1,195 @@
+import azure.durable_functions as df
 import azure.functions as func
-import json
+import asyncio
 import logging
+import time
 from datetime import datetime
-from shared.storage import save_session_summary
+from typing import Any, Awaitable, Dict, Optional
+from end_of_session import bp as end_of_session_bp
+from risk_escalation_check import moderate_message
+from shared.admission import admission_controlled, get_admission_stats
+from shared.common import get_nocodb_pool_stats, get_openai_pool_stats
+from shared.config import env_float
+from shared.existence import get_existence_stats
+from shared.http import HttpError, dumps, json_response, parse_json
+from shared.intake import calculate_intake_score, is_field_non_empty
+from shared.log_pipeline import get_logging_stats, sensitive
+from shared.mode_classifier import get_mode_classifier_stats
+from shared.pre_extract import get_pre_extract_stats
+from shared.rate_limit import get_rate_limiter
+from shared.resilience import ServiceUnavailableError, get_resilience_stats
+from shared.session_state import get_session_state_store
+from shared.storage import save_session_summary_async
+from shared.timing import record, stage, timed_handler
+from shared.turn_analysis import VALID_MODES, analyze_turn
 
-app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
+app = df.DFApp(http_auth_level=func.AuthLevel.FUNCTION)
+# Durable end-of-session orchestration (HTTP starter, orchestrator, activities)
+app.register_functions(end_of_session_bp)
+
+# Per-stage timeouts in seconds; a stage that runs out reports "timeout" and the
+# turn continues with whatever the other stages produced.
+STAGE_TIMEOUTS = {
+    "risk": ("ORCHESTRATOR_RISK_TIMEOUT", 5.0),
+    "analysis": ("ORCHESTRATOR_ANALYSIS_TIMEOUT", 10.0),
+}
+
+ORCHESTRATOR_NAME = "orchestrate_mental_health_functions"
+
+INVALID_JSON_BODY = dumps({"error": "Invalid JSON"})
+INTERNAL_ERROR_BODY = dumps({"error": "Internal server error"})
+
+
+def _stage_timeout(stage: str) -> float:
+    setting, default = STAGE_TIMEOUTS[stage]
+    return env_float(setting, default)
+
+
+async def _run_stage(stage: str, coro: Awaitable[Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Await one pipeline stage, turning timeouts and errors into a stage result."""
+    started = time.perf_counter()
+    try:
+        if timeout is None:
+            value = await coro
+        else:
+            value = await asyncio.wait_for(coro, timeout)
+        result = {"status": "ok", "value": value}
+    except asyncio.TimeoutError:
+        logging.warning("[orchestrate] stage %s timed out after %ss", stage, timeout)
+        result = {"status": "timeout"}
+    except ServiceUnavailableError as e:
+        logging.warning("[orchestrate] stage %s unavailable: %s", stage, e)
+        result = {"status": "unavailable"}
+    except Exception as e:
+        logging.error("[orchestrate] stage %s failed: %s", stage, e)
+        result = {"status": "error"}
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def _analyze_and_score(
+    message: str,
+    context: str,
+    session_id: str,
+    known_fields: Dict[str, Any]
+) -> Dict[str, Dict[str, Any]]:
+    """Run the combined turn analysis, then score intake as soon as the fields are available."""
+    analysis = await _run_stage(
+        "analysis", analyze_turn(message, context, function_name=ORCHESTRATOR_NAME), _stage_timeout("analysis")
+    )
+    extracted = analysis["value"]["fields"] if analysis["status"] == "ok" else {}
+    scoring = await _run_stage("scoring", _score(session_id, known_fields, extracted))
+    fields = (scoring.get("value") or {}).pop("fields", dict(known_fields))
+    return {"analysis": analysis, "scoring": scoring, "fields": fields}
+
+
+async def _score(
+    session_id: str,
+    known_fields: Dict[str, Any],
+    extracted: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Newly extracted values win, but a null never erases an earlier answer
+    if session_id:
+        store = get_session_state_store()
+        if known_fields:
+            store.merge_fields(session_id, known_fields)
+        state = store.merge_fields(session_id, extracted)
+        return {"score": state["score"], "enough_data": state["enough_data"], "fields": state["fields"]}
+
+    fields = dict(known_fields)
+    fields.update({name: value for name, value in extracted.items() if is_field_non_empty(value)})
+    score, enough_data = calculate_intake_score(fields)
+    return {"score": score, "enough_data": enough_data, "fields": fields}
+
+
+async def run_turn_pipeline(
+    message: str,
+    context: str,
+    session_id: str,
+    known_fields: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Run the per-turn stages in-process.
+
+    The risk check and the turn analysis (field extraction and mode decision in
+    one LLM call) start together; intake scoring follows the analysis directly
+    and is folded into the session's server-side state, so the client does not
+    need to resend earlier fields. A risk flag cancels the remaining stages,
+    which are then reported as "skipped".
+    """
+    risk_task = asyncio.ensure_future(
+        _run_stage("risk", moderate_message(message), _stage_timeout("risk"))
+    )
+    intake_task = asyncio.ensure_future(_analyze_and_score(message, context, session_id, known_fields))
+
+    risk = await risk_task
+    if risk["status"] == "ok" and risk["value"]:
+        intake_task.cancel()
+        await asyncio.gather(intake_task, return_exceptions=True)
+        skipped = {"status": "skipped"}
+        return {
+            "risk": risk,
+            "analysis": skipped,
+            "scoring": skipped,
+            "fields": _known_session_fields(session_id, known_fields),
+        }
+
+    intake = await intake_task
+    return {"risk": risk, **intake}
+
+
+def _known_session_fields(session_id: str, known_fields: Dict[str, Any]) -> Dict[str, Any]:
+    state = get_session_state_store().get_state(session_id) if session_id else None
+    fields = state["fields"] if state else {}
+    fields.update(known_fields)
+    return fields
 
 
 @app.route(route="orchestrate_mental_health_functions", methods=["POST"])
-def orchestrate_mental_health_functions(req: func.HttpRequest) -> func.HttpResponse:
+@timed_handler(ORCHESTRATOR_NAME)
+@admission_controlled(ORCHESTRATOR_NAME)
+async def orchestrate_mental_health_functions(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("[orchestrate] Invocation started")
     try:
         # --- Parse input body ---
         try:
-            req_body = req.get_json()
-        except ValueError:
+            with stage("parse"):
+                req_body = parse_json(req)
+        except HttpError:
             logging.warning("[orchestrate] Invalid JSON payload")
-            return func.HttpResponse(
-                json.dumps({"error": "Invalid JSON"}),
-                status_code=400,
-                headers={"Content-Type": "application/json"}
-            )
+            return json_response(INVALID_JSON_BODY, status_code=400)
 
         message = req_body.get('message', '')
         session_id = req_body.get('session_id', '')
+        context = req_body.get('context') or message
+        current_mode = req_body.get('current_mode')
+        known_fields = req_body.get('fields') or {}
+        if not isinstance(known_fields, dict):
+            known_fields = {}
+
+        logging.info("[orchestrate] session=%s message=%s", session_id, sensitive(message))
+
+        # --- Risk check in parallel with turn analysis (fields + mode) and scoring ---
+        stages = await run_turn_pipeline(message, context, session_id, known_fields)
+        # The stages overlap, so their durations add up to more than the total
+        for name in ("risk", "analysis", "scoring"):
+            if "duration_ms" in stages[name]:
+                record(name, stages[name]["duration_ms"])
 
-        logging.info(f"[orchestrate] session={session_id} message={message!r}")
+        risk_flag = stages["risk"].get("value")
+        intake = stages["scoring"].get("value") or {}
+        if risk_flag:
+            routing_decision = "risk_escalation"
+        elif stages["analysis"]["status"] == "ok":
+            routing_decision = stages["analysis"]["value"]["mode"]
+        elif current_mode in VALID_MODES:
+            # Analysis unavailable or timed out: stay in the current mode
+            routing_decision = current_mode
+        else:
+            routing_decision = "default_assistant"
 
-        # --- Placeholder de lógica de enrutamiento/orquestación ---
+        # --- Placeholder de generación de respuesta ---
         assistant_response = f"Processed your message: {message}"
-        routing_decision = "default_assistant"
         # ==========================================================
 
         # --- Construir payload de respuesta completo ---
@@ -41,13 +201,26 @@ def orchestrate_mental_health_functions(req: func.HttpRequest) -> func.HttpRespo
             "session_id": session_id,
             "routing": {
                 "next_assistant": routing_decision
+            },
+            "risk": {
+                "flag": risk_flag,
+                "moderation_available": stages["risk"]["status"] == "ok"
+            },
+            "fields": stages["fields"],
+            "intake": {
+                "score": intake.get("score"),
+                "enough_data": intake.get("enough_data")
+            },
+            "stages": {
+                name: {key: value for key, value in stages[name].items() if key != "value"}
+                for name in ("risk", "analysis", "scoring")
             }
         }
 
         # --- Intentar grabar el resumen de sesión (stub) ---
         timestamp = datetime.utcnow().isoformat()
         try:
-            save_session_summary(
+            await save_session_summary_async(
                 session_id=session_id,
                 user_message=message,
                 assistant_reply=assistant_response,
@@ -55,19 +228,26 @@ def orchestrate_mental_health_functions(req: func.HttpRequest) -> func.HttpRespo
                 timestamp=timestamp
             )
         except Exception as save_err:
-            logging.error(f"[save_session_summary] failed: {save_err}")
+            logging.error("[save_session_summary] failed: %s", save_err)
 
         # --- Responder OK ---
-        return func.HttpResponse(
-            json.dumps(response_payload),
-            status_code=200,
-            headers={"Content-Type": "application/json"}
-        )
+        return json_response(response_payload)
 
-    except Exception as e:
+    except Exception:
         logging.exception("[orchestrate] Unhandled exception")
-        return func.HttpResponse(
-            json.dumps({"error": "Internal server error"}),
-            status_code=500,
-            headers={"Content-Type": "application/json"}
-        )
+        return json_response(INTERNAL_ERROR_BODY, status_code=500)
+
+
+@app.route(route="metrics", methods=["GET"])
+async def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Live load metrics of this worker: admission queues, outbound pools, rate limits, circuits."""
+    return json_response({
+        "admission": get_admission_stats(),
+        "logging": get_logging_stats(),
+        "pools": {"openai": get_openai_pool_stats(), "nocodb": get_nocodb_pool_stats()},
+        "mode_classifier": get_mode_classifier_stats(),
+        "nocodb_existence": get_existence_stats(),
+        "pre_extract": get_pre_extract_stats().snapshot(),
+        "rate_limits": get_rate_limiter().stats(),
+        "resilience": get_resilience_stats(),
+    })
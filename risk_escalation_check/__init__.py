@@ -1,9 +1,39 @@
-import json
 import logging
+from typing import List, Optional
 import azure.functions as func
+from shared.admission import admission_controlled
+from shared.batching import MicroBatcher
+from shared.cache import get_response_cache, is_cache_enabled, make_cache_key
 from shared.common import get_openai_client
+from shared.config import env_bool, env_float, env_int
+from shared.http import Field, HttpError, Schema, dumps, error_body, json_handler, json_response
+from shared.rate_limit import PRIORITY_RISK, estimate_tokens, get_rate_limiter
+from shared.resilience import ServiceUnavailableError, counts_as_failure, get_endpoint
+from shared.timing import mark, stage, timed_handler
 
 
+FUNCTION_NAME = "risk_escalation_check"
+# The moderation call does not pin a model, so the SDK default is part of the key
+MODERATION_MODEL = "default"
+FLAG_MAPPING_VERSION = "flags-v1"
+
+REQUEST_SCHEMA = Schema(
+    Field("message", str, required=True, strip=True, non_empty=True),
+    Field("session_id", (str, int), default=""),
+)
+
+MODERATION_UNAVAILABLE_BODY = dumps({
+    "status": "unavailable",
+    "flag": None,
+    "moderation_available": False,
+    "message": "Moderation is temporarily unavailable; the message was not checked."
+})
+MODERATION_FAILED_BODY = error_body("Moderation API failed or invalid input.")
+
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME)
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     Azure Function: risk_escalation_check
@@ -22,102 +52,122 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         "status": "ok",
         "flag": "self-harm" | "violence" | null
     }
+    
+    When the moderation endpoint is unavailable (circuit open or timed out) the
+    response is a 503 with "status": "unavailable" and "moderation_available":
+    false, so callers never mistake an unchecked message for a safe one.
     """
     
+    payload = REQUEST_SCHEMA.parse(req)
+    message = payload["message"]
+    session_id = payload["session_id"]
+    mark("validate")
+    
+    # Call OpenAI moderation API
     try:
-        # Parse request body
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Invalid JSON in request body."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Validate required fields
-        if not req_body or "message" not in req_body:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing required field: message."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        message = req_body.get("message", "").strip()
-        session_id = req_body.get("session_id", "")
-        
-        if not message:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Message cannot be empty."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Get OpenAI client
-        client = get_openai_client()
-        
-        # Call OpenAI moderation API
-        try:
-            moderation_response = await client.moderations.create(input=message)
-            
-            # Extract moderation results
-            results = moderation_response.results[0]
-            categories = results.categories
-            flagged = results.flagged
-            
-            # Determine risk flag based on categories
-            flag = None
-            
-            if flagged:
-                # Check for self-harm related categories (maps to user's "self-harm" and "suicide")
-                if (getattr(categories, 'self_harm', False) or 
-                    getattr(categories, 'self_harm_intent', False)):
-                    flag = "self-harm"
-                # Check for violence related categories (maps to user's "violence" and "threatening")
-                elif (getattr(categories, 'violence', False) or 
-                      getattr(categories, 'harassment_threatening', False)):
-                    flag = "violence"
-            
-            # Log session info (but not message content)
-            logging.info(f"Risk check completed for session: {session_id}, flag: {flag}")
-            
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "ok",
-                    "flag": flag
-                }),
-                status_code=200,
-                mimetype="application/json"
-            )
-            
-        except Exception as openai_error:
-            logging.error(f"OpenAI moderation API error: {str(openai_error)}")
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Moderation API failed or invalid input."
-                }),
-                status_code=500,
-                mimetype="application/json"
-            )
-    
-    except Exception as e:
-        logging.error(f"Unexpected error in risk_escalation_check: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({
-                "status": "error",
-                "message": "Internal server error."
-            }),
-            status_code=500,
-            mimetype="application/json"
-        )
+        flag = await moderate_message(message)
+    except ServiceUnavailableError as unavailable:
+        logging.warning("Moderation unavailable for session: %s: %s", session_id, unavailable)
+        raise HttpError(503, MODERATION_UNAVAILABLE_BODY) from None
+    except Exception as openai_error:
+        logging.error("OpenAI moderation API error: %s", openai_error)
+        raise HttpError(500, MODERATION_FAILED_BODY) from None
+    
+    # Log session info (but not message content)
+    logging.info("Risk check completed for session: %s, flag: %s", session_id, flag)
+    
+    return json_response({"status": "ok", "flag": flag})
+
+
+async def moderate_message(message: str) -> Optional[str]:
+    """
+    Run a message through the OpenAI moderation endpoint and map it to a risk flag.
+    
+    Concurrent calls are coalesced into batched moderation requests, see
+    get_moderation_batcher().
+    
+    Returns:
+        "self-harm", "violence" or None
+    """
+    cache = None
+    cache_key = None
+    if is_cache_enabled(FUNCTION_NAME):
+        cache = get_response_cache()
+        cache_key = make_cache_key("moderations", MODERATION_MODEL, FLAG_MAPPING_VERSION, message)
+        cached = await cache.get_async(FUNCTION_NAME, cache_key)
+        if cached is not None:
+            return cached["flag"]
+    
+    # Timed from the caller's side: includes waiting for the batch window
+    with stage("openai"):
+        if env_bool("MODERATION_BATCHING_ENABLED", True):
+            flag = await get_moderation_batcher().submit(message)
+        else:
+            flag = (await moderate_batch([message]))[0]
+    
+    if cache is not None:
+        cache.set(FUNCTION_NAME, cache_key, {"flag": flag})
+    
+    return flag
 
+
+async def moderate_batch(messages: List[str]) -> List[Optional[str]]:
+    """Moderate several messages in one API call, returning one flag per message."""
+    # Get OpenAI client
+    client = get_openai_client()
+    
+    # Risk checks are served first when the rate-limit budget runs low
+    await get_rate_limiter().acquire("moderations", estimate_tokens(messages), PRIORITY_RISK)
+    
+    moderation_response = await get_endpoint("openai.moderations").call(
+        lambda timeout: client.moderations.create(input=messages, timeout=timeout)
+    )
+    
+    return [map_moderation_flag(result) for result in moderation_response.results]
+
+
+def map_moderation_flag(result) -> Optional[str]:
+    """Map one moderation result to the "self-harm" / "violence" / None risk flag."""
+    categories = result.categories
+    flagged = result.flagged
+    
+    # Determine risk flag based on categories
+    flag = None
+    
+    if flagged:
+        # Check for self-harm related categories (maps to user's "self-harm" and "suicide")
+        if (getattr(categories, 'self_harm', False) or 
+            getattr(categories, 'self_harm_intent', False)):
+            flag = "self-harm"
+        # Check for violence related categories (maps to user's "violence" and "threatening")
+        elif (getattr(categories, 'violence', False) or 
+              getattr(categories, 'harassment_threatening', False)):
+            flag = "violence"
+    
+    return flag
+
+
+_moderation_batcher: Optional[MicroBatcher] = None
+
+
+def get_moderation_batcher() -> MicroBatcher:
+    """
+    Get the worker's moderation coalescer.
+    
+    Requests arriving within MODERATION_BATCH_WINDOW_MS (default 10 ms) of each
+    other, up to MODERATION_BATCH_MAX_ITEMS (default 32), share one call. A
+    call rejected as a client error is retried in halves, so one bad message
+    fails only its own check; health errors (429, 5xx, timeouts, an open
+    circuit) fail the whole batch at once.
+    """
+    global _moderation_batcher
+    if _moderation_batcher is None:
+        _moderation_batcher = MicroBatcher(
+            moderate_batch,
+            window=env_float("MODERATION_BATCH_WINDOW_MS", 10.0) / 1000.0,
+            max_items=env_int("MODERATION_BATCH_MAX_ITEMS", 32),
+            name="moderation",
+            # Only a rejected input is worth isolating; health errors fail the whole batch
+            split_on=lambda error: not counts_as_failure(error)
+        )
+    return _moderation_batcher
@@ -5,13 +5,33 @@ Persists a finalized summary of the session, provided by the Assistant Summary a
 into a NocoDB table called `summaries`.
 """
 
-import json
 import logging
 import datetime
 import azure.functions as func
+from shared.admission import admission_controlled
 from shared.common import nocodb_upsert
+from shared.http import OK_BODY, Field, HttpError, Schema, error_body, json_handler, json_response
+from shared.resilience import ServiceUnavailableError
+from shared.timing import mark, stage, timed_handler
 
+FUNCTION_NAME = "save_session_summary"
+SUMMARY_MAX_LENGTH = 2000
 
+REQUEST_SCHEMA = Schema(
+    Field("session_id", str, required=True, strip=True, non_empty=True),
+    Field("summary", str, required=True, strip=True, non_empty=True),
+)
+
+NOCODB_UNAVAILABLE_BODY = error_body(
+    "NocoDB is temporarily unavailable; the summary was not saved.", status="unavailable"
+)
+# Status and wording of the original contract
+NOCODB_FAILED_BODY = error_body("Missing 'summary' field or NocoDB request failed.")
+
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME, "Internal server error while saving the summary.")
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     Save session summary to NocoDB.
@@ -29,92 +49,31 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     logging.info('Processing save_session_summary request')
     
-    try:
-        # Parse request body
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Invalid JSON in request body"
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        if not req_body:
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Request body is required"
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Validate required fields
-        session_id = req_body.get("session_id")
-        summary = req_body.get("summary")
-        
-        if not session_id or not isinstance(session_id, str) or not session_id.strip():
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing 'session_id' field or NocoDB request failed."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        if not summary or not isinstance(summary, str) or not summary.strip():
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing 'summary' field or NocoDB request failed."
-                }),
-                status_code=400,
-                mimetype="application/json"
-            )
-        
-        # Truncate summary if longer than 2000 characters
-        if len(summary) > 2000:
-            summary = summary[:2000]
-            logging.info('Summary truncated to 2000 characters')
-        
-        # Generate updated_at timestamp
-        updated_at = datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z'
-        
-        # Save to NocoDB using shared function
-        try:
-            await nocodb_upsert(session_id.strip(), summary.strip(), updated_at)
-            logging.info('Successfully saved summary')
-            
-            return func.HttpResponse(
-                json.dumps({"status": "ok"}),
-                status_code=200,
-                mimetype="application/json"
-            )
-            
-        except Exception as e:
-            logging.error(f'Failed to save summary: {str(e)}')
-            return func.HttpResponse(
-                json.dumps({
-                    "status": "error",
-                    "message": "Missing 'summary' field or NocoDB request failed."
-                }),
-                status_code=500,
-                mimetype="application/json"
-            )
+    payload = REQUEST_SCHEMA.parse(req)
+    session_id = payload["session_id"]
+    summary = payload["summary"]
+    
+    # Truncate summary if longer than 2000 characters
+    if len(summary) > SUMMARY_MAX_LENGTH:
+        summary = summary[:SUMMARY_MAX_LENGTH].rstrip()
+        logging.info('Summary truncated to 2000 characters')
     
+    mark("validate")
+    
+    # Generate updated_at timestamp
+    updated_at = datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z'
+    
+    # Save to NocoDB using shared function
+    try:
+        with stage("nocodb"):
+            await nocodb_upsert(session_id, summary, updated_at)
+    except ServiceUnavailableError as e:
+        # Fail fast instead of holding the request while NocoDB is down
+        logging.warning('NocoDB unavailable, summary not saved: %s', e)
+        raise HttpError(503, NOCODB_UNAVAILABLE_BODY) from None
     except Exception as e:
-        logging.error(f'Unexpected error in save_session_summary: {str(e)}')
-        return func.HttpResponse(
-            json.dumps({
-                "status": "error",
-                "message": "Missing 'summary' field or NocoDB request failed."
-            }),
-            status_code=500,
-            mimetype="application/json"
-        )
-
+        logging.error('Failed to save summary: %s', e)
+        raise HttpError(500, NOCODB_FAILED_BODY) from None
+    
+    logging.info('Successfully saved summary')
+    return json_response(OK_BODY)
@@ -0,0 +1,228 @@
+"""
+Admission control for the HTTP handlers.
+
+host.json lets a worker accept 100 concurrent requests, more than the outbound
+pools and rate limits can serve without long queueing inside httpx. Each
+function therefore gets its own concurrency limit and a bounded wait queue:
+a request beyond the limit waits for a slot; when the queue is full, or the
+wait passes the queue deadline, it is rejected at once with 503 and a
+Retry-After estimate instead of timing out slowly.
+
+Configuration is handled via environment variables; every setting can be
+overridden per function with ADMISSION_<FUNCTION_NAME>_<SETTING>, e.g.
+ADMISSION_EXTRACT_FIELDS_FROM_INPUT_MAX_CONCURRENCY:
+- ADMISSION_ENABLED: Master switch (defaults to true)
+- ADMISSION_MAX_CONCURRENCY: Requests handled at once per function (defaults to 32)
+- ADMISSION_MAX_QUEUE: Requests allowed to wait for a slot (defaults to 64)
+- ADMISSION_QUEUE_TIMEOUT_MS: Longest wait for a slot before rejecting (defaults to 2000)
+"""
+
+import asyncio
+import functools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import azure.functions as func
+
+from shared.config import env_bool, env_float, env_int
+from shared.http import error_body, json_response
+from shared.timing import record
+
+SERVER_BUSY_BODY = error_body("Server busy, please retry later.")
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, function_name: str, reason: str, retry_after: int):
+        super().__init__(f"{function_name} rejected request: {reason}")
+        self.function_name = function_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue for one function.
+
+    A finishing request hands its slot directly to the oldest waiter, so a burst
+    cannot overtake requests that are already queued.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 32, max_queue: int = 64, queue_timeout: float = 2.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # Moving average of how long an admitted request holds its slot
+        self._service_seconds = 0.5
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "max_queue_depth": 0,
+            "queue_wait_seconds": 0.0,
+        }
+
+    async def acquire(self) -> float:
+        """
+        Take a slot, waiting in the queue if needed.
+
+        Returns:
+            float: Seconds spent waiting for the slot
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                self._stats["admitted"] += 1
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                raise AdmissionRejected(self.name, "queue full", self._retry_after())
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            self._stats["queued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._stats["queue_wait_seconds"] += waited
+            if waiter.granted:
+                self._stats["admitted"] += 1
+                return waited
+            self._waiters.remove(waiter)
+            self._stats["rejected_timeout"] += 1
+            raise AdmissionRejected(self.name, "queue timeout", self._retry_after())
+
+    def release(self, held_seconds: Optional[float] = None) -> None:
+        """Free a slot, handing it to the oldest waiter if there is one."""
+        with self._lock:
+            if held_seconds is not None:
+                self._service_seconds += 0.1 * (held_seconds - self._service_seconds)
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                return
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["in_flight"] = self.in_flight
+            stats["queue_depth"] = len(self._waiters)
+            stats["max_concurrency"] = self.max_concurrency
+            stats["max_queue"] = self.max_queue
+            stats["mean_service_ms"] = round(self._service_seconds * 1000, 1)
+        queued = stats["queued"]
+        stats["mean_queue_wait_ms"] = round(stats.pop("queue_wait_seconds") / queued * 1000, 1) if queued else 0.0
+        return stats
+
+    def _retry_after(self) -> int:
+        # Time for the queue ahead (plus this request) to drain through the slots
+        drain = self._service_seconds * (len(self._waiters) + 1) / max(1, self.max_concurrency)
+        return max(1, min(30, math.ceil(drain)))
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _setting(function_name: str, setting: str) -> str:
+    return f"ADMISSION_{function_name.upper()}_{setting}"
+
+
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(function_name: str) -> AdmissionController:
+    """Get the worker-wide controller of a function, configured on first use."""
+    controller = _controllers.get(function_name)
+    if controller is None:
+        with _controllers_lock:
+            controller = _controllers.get(function_name)
+            if controller is None:
+                controller = AdmissionController(
+                    function_name,
+                    max_concurrency=env_int(
+                        _setting(function_name, "MAX_CONCURRENCY"), env_int("ADMISSION_MAX_CONCURRENCY", 32)
+                    ),
+                    max_queue=env_int(_setting(function_name, "MAX_QUEUE"), env_int("ADMISSION_MAX_QUEUE", 64)),
+                    queue_timeout=env_float(
+                        _setting(function_name, "QUEUE_TIMEOUT_MS"), env_float("ADMISSION_QUEUE_TIMEOUT_MS", 2000.0)
+                    ) / 1000.0,
+                )
+                _controllers[function_name] = controller
+    return controller
+
+
+def get_admission_stats() -> Dict[str, Dict[str, Any]]:
+    """Live in-flight counts, queue depths and rejection counters per function."""
+    return {name: controller.stats() for name, controller in list(_controllers.items())}
+
+
+def admission_controlled(function_name: str) -> Callable:
+    """
+    Decorate an async HTTP handler with the function's admission control.
+
+    Rejected requests get a 503 with a Retry-After header. Place it below
+    timed_handler so the queue wait shows up as the "admission" stage.
+    """
+    def decorator(handler: Callable[..., Awaitable[func.HttpResponse]]) -> Callable[..., Awaitable[func.HttpResponse]]:
+        @functools.wraps(handler)
+        async def wrapper(*args: Any, **kwargs: Any) -> func.HttpResponse:
+            if not env_bool("ADMISSION_ENABLED", True):
+                return await handler(*args, **kwargs)
+
+            controller = get_admission_controller(function_name)
+            try:
+                waited = await controller.acquire()
+            except AdmissionRejected as e:
+                logging.warning(
+                    "[admission] %s rejected (%s), retry after %ss", function_name, e.reason, e.retry_after,
+                    extra={"custom_dimensions": {"function": function_name, **controller.stats()}}
+                )
+                return json_response(SERVER_BUSY_BODY, status_code=503, headers={"Retry-After": str(e.retry_after)})
+
+            record("admission", waited * 1000)
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                controller.release(time.perf_counter() - started)
+        return wrapper
+    return decorator
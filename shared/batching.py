@@ -0,0 +1,146 @@
+"""
+Async micro-batching for endpoints that accept a list of inputs.
+
+Concurrent callers submit single items; items arriving within a short window (or
+until a size cap is reached) are sent as one batched call and each caller gets
+the result at its own index back. A batch rejected because of its inputs can be
+split in halves and retried, so one bad input fails only its own caller.
+"""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _LoopBatchState:
+    """Pending items and timer for one event loop."""
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[Any, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Coalesce concurrent single-item calls into batched calls.
+
+    Args:
+        batch_fn: Coroutine taking a list of items and returning one result per
+                  item, in the same order
+        window: Seconds to wait for more items after the first one arrives
+        max_items: Batch size that triggers an immediate dispatch
+        name: Label used in logs and statistics
+        split_on: Predicate for errors caused by the inputs rather than by the
+                  endpoint (e.g. a 400 for one bad item). A batch failing with
+                  such an error is split in halves, which are retried
+                  separately, until the failing items are isolated; only their
+                  callers get the exception. Any other error (and every error
+                  when no predicate is given) is raised to every caller in the
+                  batch without retrying, so an overloaded endpoint is not sent
+                  more calls.
+
+    Futures are bound to the loop that created them, so state is kept per loop.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[T]], Awaitable[List[R]]],
+        window: float = 0.01,
+        max_items: int = 32,
+        name: str = "batch",
+        split_on: Optional[Callable[[Exception], bool]] = None
+    ):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_items = max_items
+        self.name = name
+        self.split_on = split_on
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopBatchState]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "items": 0, "max_batch": 0, "failed_batches": 0, "split_batches": 0}
+
+    async def submit(self, item: T) -> R:
+        """Queue one item and wait for its result from the next batched call."""
+        loop = asyncio.get_running_loop()
+        state = self._state_for(loop)
+        future = loop.create_future()
+        state.pending.append((item, future))
+
+        if len(state.pending) >= self.max_items:
+            self._dispatch(loop, state)
+        elif state.timer is None:
+            state.timer = loop.call_later(self.window, self._dispatch, loop, state)
+
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for dispatched batches and items, with the mean batch size."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["mean_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _state_for(self, loop: asyncio.AbstractEventLoop) -> _LoopBatchState:
+        with self._lock:
+            state = self._states.get(loop)
+            if state is None:
+                state = self._states[loop] = _LoopBatchState()
+            return state
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop, state: _LoopBatchState) -> None:
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        # Callers that were cancelled while waiting do not need a slot in the batch
+        batch = [(item, future) for item, future in state.pending if not future.done()]
+        state.pending = []
+        if not batch:
+            return
+        task = loop.create_task(self._run_batch(batch))
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        await self._call(batch)
+
+    async def _call(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"{self.name} batch returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            # Callers cancelled in the meantime need no retry
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if len(batch) > 1 and self.split_on is not None and self.split_on(e):
+                logging.warning("%s batch of %d failed, retrying in halves: %s", self.name, len(batch), e)
+                with self._lock:
+                    self._stats["split_batches"] += 1
+                middle = len(batch) // 2
+                await asyncio.gather(self._call(batch[:middle]), self._call(batch[middle:]))
+                return
+            logging.error("%s batch of %d failed: %s", self.name, len(batch), e)
+            with self._lock:
+                self._stats["failed_batches"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,276 @@
+"""
+Tiered response cache for the OpenAI call sites.
+
+Entries are keyed by a SHA-256 digest of (endpoint, model, prompt version,
+normalized input), so user messages never appear in the cache as plaintext keys.
+The first tier is an in-memory LRU with TTL; an optional SQLite file on local disk
+forms a second tier shared by the worker processes of one instance.
+
+Values are not encrypted, so only call sites whose values carry no user content
+write them to disk: get() and set() with ``persist=False`` use the memory tier
+alone. The turn analysis and field extraction results (which quote the user's
+symptoms, triggers and coping) are cached that way; the SQLite tier only ever
+holds risk flags and chat mode names.
+
+The SQLite tier never runs on the event loop: async callers look it up with
+get_async(), which reads the file on the cache's own thread, and set() hands
+the disk write to that thread without waiting for it. A lookup that finds the
+file busy counts as a miss.
+
+Configuration is handled via environment variables:
+- LLM_CACHE_ENABLED: Master switch (defaults to true)
+- LLM_CACHE_DISABLED_FUNCTIONS: Comma-separated function names that opt out
+- LLM_CACHE_MAX_ENTRIES: In-memory capacity (defaults to 2048)
+- LLM_CACHE_TTL_SECONDS: Entry lifetime (defaults to 3600)
+- LLM_CACHE_SQLITE_PATH: Enables the SQLite tier at this path (disabled by default)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from shared.config import env_bool, env_float, env_int, env_str
+
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 3600.0
+
+
+def normalize_input(text: str, casefold: bool = False) -> str:
+    """Collapse whitespace (and optionally case) so trivially different inputs share a key."""
+    normalized = " ".join(text.split())
+    return normalized.casefold() if casefold else normalized
+
+
+def make_cache_key(
+    endpoint: str,
+    model: str,
+    prompt_version: str,
+    text: str,
+    casefold: bool = False
+) -> str:
+    """
+    Build the cache key for one OpenAI request.
+
+    Args:
+        endpoint: API endpoint, e.g. "chat.completions" or "moderations"
+        model: Model name the request targets
+        prompt_version: Version tag of the system prompt, bumped whenever it changes
+        text: User input sent to the model
+        casefold: Whether the call site treats input case-insensitively
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    material = "\x1f".join((endpoint, model, prompt_version, normalize_input(text, casefold)))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class _SQLiteTier:
+    """Second cache tier stored in a local SQLite file shared between processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT, value TEXT, expires_at REAL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= time.time():
+            self.delete(key)
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, namespace: str, value: str, expires_at: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, namespace, value, expires_at)
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock, self._connection:
+            cursor = self._connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+
+class ResponseCache:
+    """
+    Two-tier LRU + TTL cache with per-namespace hit/miss/eviction counters.
+
+    Namespaces are the function names of the call sites, which is also the unit for
+    opting out. Values must be JSON-serializable; they are stored serialized so
+    callers always receive a fresh copy.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        sqlite_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._sqlite: Optional[_SQLiteTier] = None
+        self._disk_executor: Optional[ThreadPoolExecutor] = None
+        if sqlite_path:
+            try:
+                self._sqlite = _SQLiteTier(sqlite_path)
+            except sqlite3.Error as e:
+                logging.warning("LLM cache SQLite tier disabled: %s", e)
+            else:
+                # One thread: the tier serializes on its connection anyway
+                self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-cache")
+
+    def get(self, namespace: str, key: str, persist: bool = True) -> Optional[Any]:
+        """
+        Return the cached value for a key, or None on a miss (``persist=False`` skips the SQLite tier).
+
+        Reads the SQLite tier on the calling thread; coroutines use get_async().
+        """
+        found, value = self._get_memory(namespace, key)
+        if found:
+            return value
+        return self._finish_get(namespace, key, self._read_disk(key) if persist else None)
+
+    async def get_async(self, namespace: str, key: str, persist: bool = True) -> Optional[Any]:
+        """Like get(), but the SQLite tier is read on the cache's thread instead of the event loop."""
+        found, value = self._get_memory(namespace, key)
+        if found:
+            return value
+        stored = None
+        if persist and self._disk_executor is not None:
+            stored = await asyncio.get_running_loop().run_in_executor(self._disk_executor, self._read_disk, key)
+        return self._finish_get(namespace, key, stored)
+
+    def set(self, namespace: str, key: str, value: Any, persist: bool = True) -> None:
+        """
+        Store a value in every enabled tier.
+
+        With ``persist=False`` the value stays in memory; pass it for values that
+        contain user content, which must not reach the disk in plaintext.
+        """
+        serialized = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(namespace, key, serialized, expires_at)
+        if persist and self._disk_executor is not None:
+            # Written in the background; the memory tier already answers this worker
+            self._disk_executor.submit(self._write_disk, key, namespace, serialized, expires_at)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries (the SQLite tier is left to expire)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-namespace counters plus the current in-memory size."""
+        with self._lock:
+            snapshot = {namespace: dict(counters) for namespace, counters in self._stats.items()}
+            snapshot["_memory"] = {"entries": len(self._entries), "max_entries": self.max_entries}
+        return snapshot
+
+    def _get_memory(self, namespace: str, key: str) -> Tuple[bool, Optional[Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self._count(namespace, "hits")
+                    return True, json.loads(entry[1])
+                del self._entries[key]
+                self._count(entry[0], "evictions")
+        return False, None
+
+    def _finish_get(self, namespace: str, key: str, stored: Optional[Tuple[str, float]]) -> Optional[Any]:
+        with self._lock:
+            if stored is None:
+                self._count(namespace, "misses")
+                return None
+            value, expires_at = stored
+            self._store(namespace, key, value, expires_at)
+            self._count(namespace, "hits")
+            self._count(namespace, "sqlite_hits")
+        return json.loads(value)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        if self._sqlite is None:
+            return None
+        try:
+            return self._sqlite.get(key)
+        except sqlite3.Error as e:
+            # Includes "database is locked": a busy file is a miss
+            logging.warning("LLM cache SQLite read failed: %s", e)
+            return None
+
+    def _write_disk(self, key: str, namespace: str, serialized: str, expires_at: float) -> None:
+        try:
+            self._sqlite.set(key, namespace, serialized, expires_at)
+        except sqlite3.Error as e:
+            logging.warning("LLM cache SQLite write failed: %s", e)
+
+    def _store(self, namespace: str, key: str, serialized: str, expires_at: float) -> None:
+        self._entries[key] = (namespace, serialized, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            _, (evicted_namespace, _, _) = self._entries.popitem(last=False)
+            self._count(evicted_namespace, "evictions")
+
+    def _count(self, namespace: str, counter: str) -> None:
+        counters = self._stats.setdefault(
+            namespace, {"hits": 0, "misses": 0, "evictions": 0, "sqlite_hits": 0}
+        )
+        counters[counter] += 1
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the worker-wide response cache, created from configuration on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=env_int("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+                    ttl_seconds=env_float("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+                    sqlite_path=env_str("LLM_CACHE_SQLITE_PATH")
+                )
+    return _cache
+
+
+def is_cache_enabled(function_name: str) -> bool:
+    """Whether the named function may use the response cache."""
+    if not env_bool("LLM_CACHE_ENABLED", True):
+        return False
+    disabled = env_str("LLM_CACHE_DISABLED_FUNCTIONS", "") or ""
+    return function_name not in {name.strip() for name in disabled.split(",") if name.strip()}
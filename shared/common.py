@@ -4,34 +4,196 @@ Provides OpenAI client configuration and NocoDB persistence logic.
 
 This module follows project-wide standards and provides async, reusable functions
 for all Azure Functions in the mhtp-chat-backend project.
+
+The openai and httpx packages are imported on first use rather than at import
+time, so a cold start only pays for them once a client is actually needed.
 """
 
 import os
+import asyncio
 import logging
-from typing import Dict, Any
-import httpx
-from openai import AsyncOpenAI
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from shared.config import env_float, env_int
+from shared.existence import PREDICT_CREATE, PREDICT_UPDATE, get_existence_index
+from shared.log_pipeline import sensitive
+from shared.rate_limit import record_rate_limit_headers
+from shared.resilience import ServiceUnavailableError, get_endpoint
+from shared.timing import stage
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+
+# Pool sizing defaults mirror host.json (httpWorkerOptions.maxConcurrentRequests = 100)
+# so the outbound pool is never narrower than the number of requests a worker accepts.
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Return the running event loop, or None when called from synchronous code."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _PooledClient(NamedTuple):
+    loop: Optional[asyncio.AbstractEventLoop]
+    client: Any
+    http_client: "httpx.AsyncClient"
+
+
+class _LoopBoundClientRegistry:
+    """
+    Per-worker registry of pooled HTTP clients, one per event loop.
+
+    httpx connection pools are bound to the event loop that first uses them, so a
+    client is cached per loop and rebuilt transparently when its loop has been
+    closed or replaced (e.g. after ``asyncio.run`` in a synchronous caller) or when
+    the client itself was closed.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Tuple[Any, "httpx.AsyncClient"]]):
+        self._name = name
+        self._factory = factory
+        self._entries: Dict[Optional[int], _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        loop = _current_loop()
+        key = id(loop) if loop is not None else None
+        with stage("client"), self._lock:
+            self._prune()
+            entry = self._entries.get(key)
+            if entry is not None and entry.loop is loop and not entry.http_client.is_closed:
+                return entry.client
+            if entry is not None:
+                logging.info("Rebuilding %s client (loop changed or client closed)", self._name)
+            client, http_client = self._factory()
+            self._entries[key] = _PooledClient(loop, client, http_client)
+            return client
+
+    async def aclose(self) -> None:
+        """Close the client bound to the running loop and forget clients of dead loops."""
+        loop = _current_loop()
+        key = id(loop) if loop is not None else None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            self._prune()
+        if entry is not None and not entry.http_client.is_closed:
+            await entry.http_client.aclose()
+
+    def reset(self) -> None:
+        """Forget every cached client so the next get() builds a fresh one."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Aggregate connection pool statistics across every live client."""
+        totals = {
+            "clients": 0,
+            "active_connections": 0,
+            "idle_connections": 0,
+            "active_requests": 0,
+            "queued_requests": 0,
+        }
+        with self._lock:
+            self._prune()
+            entries = list(self._entries.values())
+        for entry in entries:
+            totals["clients"] += 1
+            for key, value in _pool_stats(entry.http_client).items():
+                totals[key] += value
+        return totals
+
+    def _prune(self) -> None:
+        # Clients of closed loops can no longer be awaited; dropping the reference
+        # lets the sockets be reclaimed instead of accumulating on warm workers.
+        stale = [
+            key for key, entry in self._entries.items()
+            if entry.loop is not None and entry.loop.is_closed()
+        ]
+        for key in stale:
+            del self._entries[key]
+
+
+def _pool_stats(http_client: "httpx.AsyncClient") -> Dict[str, int]:
+    """Read connection and request counts from the httpcore pool behind a client."""
+    stats = {
+        "active_connections": 0,
+        "idle_connections": 0,
+        "active_requests": 0,
+        "queued_requests": 0,
+    }
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    if pool is None:
+        return stats
+    for connection in list(getattr(pool, "connections", [])):
+        if connection.is_idle():
+            stats["idle_connections"] += 1
+        else:
+            stats["active_connections"] += 1
+    for request in list(getattr(pool, "_requests", [])):
+        if request.is_queued():
+            stats["queued_requests"] += 1
+        else:
+            stats["active_requests"] += 1
+    return stats
 
 
-def get_openai_client() -> AsyncOpenAI:
+# Custom transports installed through use_transport(), keyed by client prefix
+_transport_overrides: Dict[str, "httpx.AsyncBaseTransport"] = {}
+
+
+def _build_http_client(
+    prefix: str,
+    timeout: "httpx.Timeout",
+    event_hooks: Optional[Dict[str, List[Callable]]] = None
+) -> "httpx.AsyncClient":
+    """
+    Build a keep-alive httpx client whose pool limits come from configuration.
+
+    Reads ``{prefix}_MAX_CONNECTIONS``, ``{prefix}_MAX_KEEPALIVE_CONNECTIONS`` and
+    ``{prefix}_KEEPALIVE_EXPIRY`` from the environment.
     """
-    Get configured OpenAI client with retry and timeout settings.
+    import httpx
     
-    Returns:
-        AsyncOpenAI: Configured OpenAI client instance with proper retry,
-                    timeout, and connection pooling settings
+    max_connections = env_int(f"{prefix}_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+    max_keepalive = min(
+        env_int(f"{prefix}_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+        max_connections,
+    )
+    return httpx.AsyncClient(
+        timeout=timeout,
+        transport=_transport_overrides.get(prefix),
+        event_hooks=event_hooks,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=env_float(f"{prefix}_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY),
+        ),
+    )
+
+
+def _create_openai_client() -> Tuple["AsyncOpenAI", "httpx.AsyncClient"]:
+    # Importing the SDK costs about half a second, so it happens with the first client
+    import httpx
+    from openai import AsyncOpenAI
     
-    Raises:
-        ValueError: If OPENAI_API_KEY environment variable is missing
-    """
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable is required")
     
     # Configure HTTP client with timeout and connection limits
-    http_client = httpx.AsyncClient(
-        timeout=httpx.Timeout(30.0, connect=10.0),  # 30s total, 10s connect
-        limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+    http_client = _build_http_client(
+        "OPENAI",
+        httpx.Timeout(30.0, connect=10.0),  # 30s total, 10s connect
+        # Every response (retries included) updates the client-side rate-limit buckets
+        event_hooks={"response": [record_rate_limit_headers]},
     )
     
     # Configure OpenAI client with retry settings
@@ -41,31 +203,134 @@ def get_openai_client() -> AsyncOpenAI:
         max_retries=3
     )
     
-    return client
+    return client, http_client
+
 
+_openai_clients = _LoopBoundClientRegistry("OpenAI", _create_openai_client)
 
-async def nocodb_upsert(session_id: str, summary: str) -> Dict[str, Any]:
+
+def get_openai_client() -> "AsyncOpenAI":
     """
-    Upsert session summary to NocoDB using their REST API.
+    Get the pooled OpenAI client for the current worker and event loop.
     
-    Implements proper upsert logic by attempting to update an existing record first,
-    and creating a new record if the update fails with 404 (not found).
+    The client (and its keep-alive connection pool) is built once per event loop
+    and reused across invocations. Pool size is configurable through
+    OPENAI_MAX_CONNECTIONS (default 100, matching host.json),
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS and OPENAI_KEEPALIVE_EXPIRY.
     
-    Configuration is handled via environment variables:
-    - NOCODB_TABLE_NAME: Table name to use (defaults to "sessions")
-    - NOCODB_AUTH_METHOD: Auth method to use ("xc-token" or "bearer", defaults to "xc-token")
+    Returns:
+        AsyncOpenAI: Configured OpenAI client instance with proper retry,
+                    timeout, and connection pooling settings
+    
+    Raises:
+        ValueError: If OPENAI_API_KEY environment variable is missing
+    """
+    return _openai_clients.get()
+
+
+async def close_openai_client() -> None:
+    """Close the pooled OpenAI client bound to the running event loop, if any."""
+    await _openai_clients.aclose()
+
+
+def get_openai_pool_stats() -> Dict[str, int]:
+    """
+    Get connection pool statistics for the pooled OpenAI clients of this worker.
+    
+    Returns:
+        Dict[str, int]: Counts of clients, active/idle connections and
+                        active/queued requests
+    """
+    return _openai_clients.stats()
+
+
+# NocoDB caps bulk payloads; 100 rows per request keeps bodies small while turning
+# an end-of-day flush of N sessions into a handful of calls.
+DEFAULT_NOCODB_BULK_CHUNK_SIZE = 100
+
+# Statuses NocoDB returns when a PATCH targets a row that does not exist yet.
+_NOCODB_MISSING_ROW_STATUSES = (404, 409, 400)
+
+# Statuses NocoDB returns when a POST duplicates an existing unique session_id.
+_NOCODB_DUPLICATE_ROW_STATUSES = (400, 409, 422)
+
+
+def _create_nocodb_client() -> Tuple["httpx.AsyncClient", "httpx.AsyncClient"]:
+    import httpx
+    
+    http_client = _build_http_client("NOCODB", httpx.Timeout(30.0))
+    return http_client, http_client
+
+
+_nocodb_clients = _LoopBoundClientRegistry("NocoDB", _create_nocodb_client)
+
+
+def use_transport(service: str, transport: Optional["httpx.AsyncBaseTransport"]) -> None:
+    """
+    Route a service's pooled client through a custom httpx transport.
+    
+    Intended for benchmarks and local runs that replace OpenAI or NocoDB with an
+    in-process stand-in (e.g. httpx.MockTransport). Clients already built for the
+    service are discarded so the next call picks up the new transport.
     
     Args:
-        session_id: Unique session identifier
-        summary: Session summary text to store
-        
+        service: "openai" or "nocodb"
+        transport: Transport to use, or None to restore the network transport
+    """
+    registries = {"OPENAI": _openai_clients, "NOCODB": _nocodb_clients}
+    prefix = service.upper()
+    if prefix not in registries:
+        raise ValueError(f"Unknown service: {service!r}")
+    if transport is None:
+        _transport_overrides.pop(prefix, None)
+    else:
+        _transport_overrides[prefix] = transport
+    registries[prefix].reset()
+
+
+def get_nocodb_client() -> "httpx.AsyncClient":
+    """
+    Get the pooled httpx client used for NocoDB calls in the current event loop.
+    
+    Pool size is configurable through NOCODB_MAX_CONNECTIONS,
+    NOCODB_MAX_KEEPALIVE_CONNECTIONS and NOCODB_KEEPALIVE_EXPIRY.
+    
     Returns:
-        Dict[str, Any]: Response from NocoDB API containing the created/updated record
-        
+        httpx.AsyncClient: Shared keep-alive client with a 30s timeout
+    """
+    return _nocodb_clients.get()
+
+
+async def close_nocodb_client() -> None:
+    """Close the pooled NocoDB client bound to the running event loop, if any."""
+    await _nocodb_clients.aclose()
+
+
+def get_nocodb_pool_stats() -> Dict[str, int]:
+    """Get connection pool statistics for the pooled NocoDB clients of this worker."""
+    return _nocodb_clients.stats()
+
+
+class _NocoDBSettings(NamedTuple):
+    api_url: str
+    table_name: str
+    headers: Dict[str, str]
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.api_url}/api/v1/db/data/noco/{self.table_name}"
+
+    @property
+    def bulk_url(self) -> str:
+        return f"{self.api_url}/api/v1/db/data/bulk/noco/{self.table_name}"
+
+
+def _nocodb_settings(table_name: Optional[str] = None) -> _NocoDBSettings:
+    """
+    Resolve NocoDB connection settings from environment variables.
+    
     Raises:
-        ValueError: If required environment variables (NOCODB_API_URL, NOCODB_API_KEY) are missing
-        httpx.HTTPError: If the API request fails after retry attempts
-        Exception: For any other unexpected errors during the operation
+        ValueError: If NOCODB_API_URL or NOCODB_API_KEY is missing
     """
     api_url = os.environ.get("NOCODB_API_URL")
     api_key = os.environ.get("NOCODB_API_KEY")
@@ -74,7 +339,7 @@ async def nocodb_upsert(session_id: str, summary: str) -> Dict[str, Any]:
         raise ValueError("NOCODB_API_URL and NOCODB_API_KEY environment variables are required")
     
     # Get configuration from environment variables
-    table_name = os.environ.get("NOCODB_TABLE_NAME", "sessions")
+    table_name = table_name or os.environ.get("NOCODB_TABLE_NAME", "sessions")
     auth_method = os.environ.get("NOCODB_AUTH_METHOD", "xc-token")
     
     # Prepare headers based on authentication method
@@ -89,65 +354,350 @@ async def nocodb_upsert(session_id: str, summary: str) -> Dict[str, Any]:
             "xc-token": api_key
         }
     
-    # Prepare data payload
+    return _NocoDBSettings(api_url.rstrip('/'), table_name, headers)
+
+
+def _summary_row(
+    session_id: str,
+    summary: str,
+    updated_at: Optional[str],
+    table_name: str
+) -> Dict[str, Any]:
+    """Build the NocoDB row payload for a session summary."""
     data = {
         "session_id": session_id,
         "summary": summary
     }
     
-    # Add updated_at field based on table type
-    if table_name == "sessions":
-        data["updated_at"] = None  # NocoDB will auto-populate this for sessions table
-    # For summaries table, we could add current timestamp, but keeping it simple per spec
+    # NocoDB auto-populates updated_at for the sessions table when it is left empty
+    if updated_at is not None or table_name == "sessions":
+        data["updated_at"] = updated_at
+    
+    return data
+
+
+async def nocodb_upsert(
+    session_id: str,
+    summary: str,
+    updated_at: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Upsert session summary to NocoDB using their REST API.
+    
+    The worker's existence index (shared.existence) predicts whether the row
+    exists. A known row is updated and a new one is created, so the common case
+    takes one round trip. A wrong guess falls back to the other call: an update
+    of a missing row (404) becomes a create, and a create rejected as a
+    duplicate becomes an update. Requests go through the pooled NocoDB client,
+    so repeated calls reuse keep-alive connections.
+    
+    Configuration is handled via environment variables:
+    - NOCODB_TABLE_NAME: Table name to use (defaults to "sessions")
+    - NOCODB_AUTH_METHOD: Auth method to use ("xc-token" or "bearer", defaults to "xc-token")
+    
+    Args:
+        session_id: Unique session identifier
+        summary: Session summary text to store
+        updated_at: Optional ISO-8601 timestamp of the change
+        
+    Returns:
+        Dict[str, Any]: Response from NocoDB API containing the created/updated record
+        
+    Raises:
+        ValueError: If required environment variables (NOCODB_API_URL, NOCODB_API_KEY) are missing
+        httpx.HTTPError: If the API request fails after retry attempts
+        ServiceUnavailableError: If NocoDB is timing out or its circuit is open
+        Exception: For any other unexpected errors during the operation
+    """
+    settings = _nocodb_settings()
+    data = _summary_row(session_id, summary, updated_at, settings.table_name)
+    client = get_nocodb_client()
+    import httpx  # already loaded by the client; needed for the except clause
+    
+    # For summaries table, use query parameter approach; for sessions table, direct ID
+    if settings.table_name == "summaries":
+        update_url = f"{settings.base_url}?where=(session_id,eq,{session_id})"
+    else:
+        update_url = f"{settings.base_url}/{session_id}"
+    
+    index = get_existence_index(settings.table_name)
+    if index is not None:
+        index.start_warmup(lambda offset, limit: _nocodb_list_session_ids(settings, offset, limit))
+    prediction = index.predict(session_id) if index is not None else PREDICT_UPDATE
+    
+    async def update(timeout: float) -> "httpx.Response":
+        return await client.patch(update_url, headers=settings.headers, json=data, timeout=timeout)
+    
+    async def create(timeout: float) -> "httpx.Response":
+        return await client.post(settings.base_url, headers=settings.headers, json=data, timeout=timeout)
+    
+    async def upsert(timeout: float) -> "httpx.Response":
+        if prediction == PREDICT_CREATE:
+            # Believed new: create directly; a duplicate is rejected, so fall back to an update
+            response = await create(timeout)
+            if response.status_code in _NOCODB_DUPLICATE_ROW_STATUSES:
+                logging.info("Session %s already exists, updating the record", session_id)
+                if index is not None:
+                    index.wrong_guess()
+                response = await update(timeout)
+        else:
+            # Believed to exist: update it; if the row doesn't exist (404) or conflict (409), create it
+            response = await update(timeout)
+            if response.status_code in _NOCODB_MISSING_ROW_STATUSES:
+                logging.info("Session %s not found or conflict, creating new record", session_id)
+                if index is not None:
+                    index.discard(session_id)
+                    index.wrong_guess()
+                response = await create(timeout)
+        
+        # Raise exception for any HTTP errors
+        response.raise_for_status()
+        return response
+    
+    try:
+        response = await get_endpoint("nocodb").call(upsert)
+        if index is not None:
+            index.add(session_id)
+        logging.info("Successfully upserted session %s to NocoDB %s table", session_id, settings.table_name)
+        return response.json()
+        
+    except ServiceUnavailableError as e:
+        logging.warning("NocoDB unavailable for session %s: %s", session_id, e)
+        raise
+    except httpx.HTTPError as e:
+        error_msg = f"NocoDB API error for session {session_id}: {str(e)}"
+        logging.error(error_msg)
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error("Response status: %s, body: %s", e.response.status_code, sensitive(e.response.text))
+        raise
+    except Exception as e:
+        error_msg = f"Unexpected error in nocodb_upsert for session {session_id}: {str(e)}"
+        logging.error(error_msg)
+        raise
+
+
+async def _nocodb_list_session_ids(settings: _NocoDBSettings, offset: int, limit: int) -> Dict[str, Any]:
+    """One page of a table's session ids, for warming the existence index."""
+    response = await get_nocodb_client().get(
+        settings.base_url,
+        headers=settings.headers,
+        params={"fields": "session_id", "limit": limit, "offset": offset}
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def nocodb_bulk_upsert(
+    rows: Iterable[Tuple[str, str, Optional[str]]],
+    chunk_size: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Upsert many session summaries through NocoDB's bulk endpoints.
+    
+    Rows are processed in chunks. For each chunk, one listing call finds which
+    sessions already exist, then one bulk PATCH updates those and one bulk POST
+    creates the rest, so N rows cost about 3 * ceil(N / chunk_size) requests instead
+    of up to 2 * N. Session ids that cannot be expressed in a NocoDB where filter
+    fall back to nocodb_upsert and are reported as "upserted". When the same
+    session_id appears more than once, the last row wins and the earlier ones are
+    reported as "superseded".
+    
+    Configuration is handled via environment variables:
+    - NOCODB_TABLE_NAME: Table name to use (defaults to "sessions")
+    - NOCODB_PRIMARY_KEY: Primary key column used by bulk updates (defaults to "Id")
+    - NOCODB_BULK_CHUNK_SIZE: Rows per chunk (defaults to 100)
     
-    # Configure HTTP client with timeout
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    Args:
+        rows: Iterable of (session_id, summary, updated_at) tuples
+        chunk_size: Optional override for the number of rows per chunk
+        
+    Returns:
+        List[Dict[str, Any]]: One result per input row, in input order, with
+                              "session_id", "status" ("created", "updated",
+                              "upserted", "superseded" or "error") and "error"
+                              on failure
+        
+    Raises:
+        ValueError: If required environment variables (NOCODB_API_URL, NOCODB_API_KEY) are missing
+    """
+    settings = _nocodb_settings()
+    rows = list(rows)
+    chunk_size = chunk_size or env_int("NOCODB_BULK_CHUNK_SIZE", DEFAULT_NOCODB_BULK_CHUNK_SIZE)
+    results: List[Dict[str, Any]] = [
+        {"session_id": session_id, "status": "superseded"} for session_id, _, _ in rows
+    ]
+    
+    # Keep only the last row per session, remembering its position in the input
+    latest: Dict[str, int] = {}
+    for index, (session_id, _, _) in enumerate(rows):
+        latest[session_id] = index
+    pending = sorted(latest.values())
+    
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        await _nocodb_bulk_upsert_chunk(settings, rows, chunk, results)
+    
+    # Rows written here exist now; later single upserts of them can update directly
+    index = get_existence_index(settings.table_name)
+    if index is not None:
+        for result in results:
+            if result["status"] in ("created", "updated"):
+                index.add(result["session_id"])
+    
+    created = sum(1 for result in results if result["status"] == "created")
+    updated = sum(1 for result in results if result["status"] == "updated")
+    failed = sum(1 for result in results if result["status"] == "error")
+    logging.info(
+        "Bulk upserted %s rows to NocoDB %s table: %s created, %s updated, %s failed",
+        len(rows), settings.table_name, created, updated, failed
+    )
+    return results
+
+
+def _is_listable_session_id(session_id: str) -> bool:
+    # NocoDB's where syntax has no escaping, so ids containing separators cannot be
+    # looked up in a single "in" filter.
+    return not any(char in session_id for char in ",()~")
+
+
+async def _nocodb_bulk_upsert_chunk(
+    settings: _NocoDBSettings,
+    rows: List[Tuple[str, str, Optional[str]]],
+    chunk: List[int],
+    results: List[Dict[str, Any]]
+) -> None:
+    """Upsert one chunk of rows, recording the outcome of each row in ``results``."""
+    client = get_nocodb_client()
+    primary_key = os.environ.get("NOCODB_PRIMARY_KEY", "Id")
+    
+    listable = [index for index in chunk if _is_listable_session_id(rows[index][0])]
+    for index in set(chunk).difference(listable):
+        session_id, summary, updated_at = rows[index]
         try:
-            # Construct URLs based on table name
-            base_url = f"{api_url.rstrip('/')}/api/v1/db/data/noco/{table_name}"
-            
-            # First, try to update existing record
-            if table_name == "summaries":
-                # For summaries table, use query parameter approach
-                update_url = f"{base_url}?where=(session_id,eq,{session_id})"
-                response = await client.patch(
-                    update_url,
-                    headers=headers,
-                    json=data
-                )
-            else:
-                # For sessions table, use direct ID approach
-                update_url = f"{base_url}/{session_id}"
-                response = await client.patch(
-                    update_url,
-                    headers=headers,
-                    json=data
-                )
-            
-            # If record doesn't exist (404) or conflict (409), create a new one
-            if response.status_code in [404, 409, 400]:
-                logging.info(f"Session {session_id} not found or conflict, creating new record")
-                create_url = base_url
-                response = await client.post(
-                    create_url,
-                    headers=headers,
-                    json=data
-                )
-            
-            # Raise exception for any HTTP errors
-            response.raise_for_status()
-            
-            logging.info(f"Successfully upserted session {session_id} to NocoDB {table_name} table")
-            return response.json()
-            
-        except httpx.HTTPError as e:
-            error_msg = f"NocoDB API error for session {session_id}: {str(e)}"
-            logging.error(error_msg)
-            if hasattr(e, 'response') and e.response is not None:
-                logging.error(f"Response status: {e.response.status_code}, body: {e.response.text}")
-            raise
+            await nocodb_upsert(session_id, summary, updated_at)
+            results[index] = {"session_id": session_id, "status": "upserted"}
         except Exception as e:
-            error_msg = f"Unexpected error in nocodb_upsert for session {session_id}: {str(e)}"
-            logging.error(error_msg)
-            raise
+            results[index] = {"session_id": session_id, "status": "error", "error": str(e)}
+    
+    if not listable:
+        return
+    
+    # One listing call tells us which sessions already have a row
+    session_ids = [rows[index][0] for index in listable]
+    try:
+        response = await client.get(
+            settings.base_url,
+            headers=settings.headers,
+            params={
+                "where": f"(session_id,in,{','.join(session_ids)})",
+                "fields": f"{primary_key},session_id",
+                "limit": len(session_ids),
+            }
+        )
+        response.raise_for_status()
+        existing = {
+            record.get("session_id"): record.get(primary_key)
+            for record in response.json().get("list", [])
+        }
+    except Exception as e:
+        logging.error("NocoDB lookup failed for bulk upsert chunk: %s", e)
+        for index in listable:
+            results[index] = {"session_id": rows[index][0], "status": "error", "error": str(e)}
+        return
+    
+    updates: List[int] = []
+    creates: List[int] = []
+    for index in listable:
+        (updates if rows[index][0] in existing else creates).append(index)
+    
+    if updates:
+        payload = []
+        for index in updates:
+            session_id, summary, updated_at = rows[index]
+            data = _summary_row(session_id, summary, updated_at, settings.table_name)
+            data[primary_key] = existing[session_id]
+            payload.append(data)
+        await _nocodb_bulk_request(client, "PATCH", settings, payload, rows, updates, "updated", results)
+    
+    if creates:
+        payload = [
+            _summary_row(session_id, summary, updated_at, settings.table_name)
+            for session_id, summary, updated_at in (rows[index] for index in creates)
+        ]
+        await _nocodb_bulk_request(client, "POST", settings, payload, rows, creates, "created", results)
+
 
+async def _nocodb_bulk_request(
+    client: "httpx.AsyncClient",
+    method: str,
+    settings: _NocoDBSettings,
+    payload: List[Dict[str, Any]],
+    rows: List[Tuple[str, str, Optional[str]]],
+    indexes: List[int],
+    status: str,
+    results: List[Dict[str, Any]]
+) -> None:
+    """Send one bulk request and record the same outcome for every row it carried."""
+    import httpx
+    
+    try:
+        response = await client.request(
+            method,
+            settings.bulk_url,
+            headers=settings.headers,
+            json=payload
+        )
+        response.raise_for_status()
+        outcome: Dict[str, Any] = {"status": status}
+    except httpx.HTTPError as e:
+        logging.error("NocoDB bulk %s failed for %s rows: %s", method, len(indexes), e)
+        if hasattr(e, 'response') and e.response is not None:
+            logging.error("Response status: %s, body: %s", e.response.status_code, sensitive(e.response.text))
+        outcome = {"status": "error", "error": str(e)}
+    except Exception as e:
+        logging.error("Unexpected error in NocoDB bulk %s: %s", method, e)
+        outcome = {"status": "error", "error": str(e)}
+    
+    for index in indexes:
+        results[index] = {"session_id": rows[index][0], **outcome}
+
+
+async def nocodb_bulk_insert(
+    records: List[Dict[str, Any]],
+    table_name: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> int:
+    """
+    Append records to a NocoDB table through the bulk create endpoint.
+    
+    Intended for append-only tables such as the per-turn session log, where no
+    existence check is needed and every chunk costs exactly one request.
+    
+    Args:
+        records: Row payloads to insert
+        table_name: Target table (defaults to NOCODB_TABLE_NAME)
+        chunk_size: Optional override for the number of rows per request
+        
+    Returns:
+        int: Number of rows inserted
+        
+    Raises:
+        ValueError: If required environment variables (NOCODB_API_URL, NOCODB_API_KEY) are missing
+        httpx.HTTPError: If a bulk request fails; earlier chunks stay inserted
+    """
+    settings = _nocodb_settings(table_name)
+    chunk_size = chunk_size or env_int("NOCODB_BULK_CHUNK_SIZE", DEFAULT_NOCODB_BULK_CHUNK_SIZE)
+    client = get_nocodb_client()
+    
+    inserted = 0
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        response = await client.post(
+            settings.bulk_url,
+            headers=settings.headers,
+            json=chunk
+        )
+        response.raise_for_status()
+        inserted += len(chunk)
+    
+    return inserted
@@ -0,0 +1,52 @@
+"""
+Environment-driven configuration helpers shared by the Azure Functions.
+
+Every tunable in the project is read from app settings (environment variables);
+these helpers parse them consistently and fall back to defaults on bad input.
+"""
+
+import os
+import logging
+from typing import Optional
+
+
+def env_int(name: str, default: int) -> int:
+    """Read a positive integer from the environment, falling back to a default."""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        logging.warning("Ignoring invalid integer for %s: %r", name, value)
+        return default
+    return parsed if parsed > 0 else default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a positive float from the environment, falling back to a default."""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        parsed = float(value)
+    except ValueError:
+        logging.warning("Ignoring invalid number for %s: %r", name, value)
+        return default
+    return parsed if parsed > 0 else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean flag ("1", "true", "yes", "on") from the environment."""
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a stripped, non-empty string from the environment."""
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
@@ -0,0 +1,288 @@
+"""
+Token-aware windowing of the conversation context sent with mode decisions.
+
+Clients send the whole conversation as a "context" string, so without a window
+the prompt, latency and cost grow with the session. build_context_window()
+splits the context into turns (lines starting with a "role:" prefix, or single
+lines when there are none), counts tokens locally and keeps the most recent
+turns that fit CONTEXT_TOKEN_BUDGET. The newest turn is always kept and, when it
+alone is over budget, cut to its tail. With CONTEXT_DIGEST_ENABLED, the omitted
+turns are replaced by a short extractive digest (the opening sentence of each
+omitted user turn, newest first, within CONTEXT_DIGEST_TOKENS, which are only
+taken from the budget when some turns are omitted). Digests are
+cached by the content of the omitted turns, so retries and the repeated calls of
+one turn reuse them.
+
+Tokens are counted with tiktoken when CONTEXT_TOKENIZER=tiktoken and its
+encoding files are already cached locally (TIKTOKEN_CACHE_DIR); it never
+downloads on the request path. Otherwise a word-piece heuristic is used, which
+slightly overcounts English text so the budget errs on the small side.
+
+Configuration is handled via environment variables:
+- CONTEXT_WINDOW_ENABLED: Master switch (defaults to true)
+- CONTEXT_TOKEN_BUDGET: Most tokens of context sent per call (defaults to 1000)
+- CONTEXT_DIGEST_ENABLED: Add a digest of the omitted turns (defaults to false)
+- CONTEXT_DIGEST_TOKENS: Budget of the digest, counted inside CONTEXT_TOKEN_BUDGET (defaults to 120)
+- CONTEXT_TOKENIZER: "heuristic" (default) or "tiktoken"
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from shared.config import env_bool, env_int, env_str
+
+
+TOKENIZER_MODEL = "gpt-4o-mini"
+DIGEST_CACHE_SIZE = 1024
+# Turns whose token counts are remembered; each call re-sends the earlier turns
+TURN_COUNT_CACHE_SIZE = 16384
+# Longest piece of one omitted turn quoted in the digest
+DIGEST_ITEM_CHARS = 120
+
+_ROLE_RE = re.compile(r"^\s*(user|assistant|system|bot|client|therapist|human|ai)\s*:", re.IGNORECASE)
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def heuristic_token_count(text: str) -> int:
+    """Approximate BPE token count: one per punctuation mark, one per word plus one per 4 letters past the fourth."""
+    return sum(1 + max(0, len(piece) - 4) // 4 for piece in _PIECE_RE.findall(text))
+
+
+_counter: Optional[Callable[[str], int]] = None
+_counter_name: Optional[str] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """The configured token counter, resolved once per worker."""
+    global _counter, _counter_name
+
+    name = (env_str("CONTEXT_TOKENIZER", "heuristic") or "heuristic").lower()
+    if _counter is not None and _counter_name == name:
+        return _counter
+    with _counter_lock:
+        if _counter is None or _counter_name != name:
+            counter = heuristic_token_count
+            if name == "tiktoken":
+                try:
+                    import tiktoken
+
+                    encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                    counter = lambda text: len(encoding.encode(text, disallowed_special=()))  # noqa: E731
+                except Exception as e:
+                    # Missing package or encoding file not in the local cache
+                    logging.warning("tiktoken unavailable, counting context tokens heuristically: %s", e)
+            _counter, _counter_name = counter, name
+            _turn_counts.clear()
+    return _counter
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter()(text)
+
+
+_turn_counts: Dict[str, int] = {}
+
+
+def _count_turn(text: str, counter: Callable[[str], int]) -> int:
+    """Token count of one turn, memoized across calls (a dict lookup for turns seen before)."""
+    count = _turn_counts.get(text)
+    if count is None:
+        count = counter(text)
+        if len(_turn_counts) >= TURN_COUNT_CACHE_SIZE:
+            _turn_counts.clear()
+        _turn_counts[text] = count
+    return count
+
+
+class Turn(NamedTuple):
+    role: Optional[str]
+    text: str
+
+
+def split_turns(context: str) -> List[Turn]:
+    """Split a context into turns; unprefixed lines continue the previous turn."""
+    lines = [line for line in context.splitlines() if line.strip()]
+    if not any(_ROLE_RE.match(line) for line in lines):
+        return [Turn(None, line) for line in lines]
+    turns: List[Turn] = []
+    for line in lines:
+        match = _ROLE_RE.match(line)
+        if match or not turns:
+            turns.append(Turn(match.group(1).lower() if match else None, line))
+        else:
+            previous = turns[-1]
+            turns[-1] = Turn(previous.role, f"{previous.text}\n{line}")
+    return turns
+
+
+class ContextWindow(NamedTuple):
+    text: str
+    # Tokens of the full context, of the text sent, and of the digest within it
+    context_tokens: int
+    window_tokens: int
+    digest_tokens: int
+    turns: int
+    kept_turns: int
+
+    def token_report(self) -> Dict[str, int]:
+        return {
+            "context": self.context_tokens,
+            "window": self.window_tokens,
+            "digest": self.digest_tokens,
+            "turns_omitted": self.turns - self.kept_turns,
+        }
+
+
+def _tail(text: str, budget: int, counter: Callable[[str], int]) -> str:
+    """The longest suffix of ``text`` (cut at a word boundary) within ``budget`` tokens."""
+    tokens = counter(text)
+    if tokens <= budget:
+        return text
+    keep = int(len(text) * budget / tokens)
+    while keep > 0:
+        tail = text[-keep:]
+        space = tail.find(" ")
+        if 0 <= space < len(tail) - 1:
+            tail = tail[space + 1:]
+        if counter(tail) <= budget:
+            return tail
+        keep = int(keep * 0.9)
+    return ""
+
+
+class DigestCache:
+    """LRU of digests keyed by a hash of the omitted turns."""
+
+    def __init__(self, max_entries: int = DIGEST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, turns: List[Turn], budget: int, counter: Callable[[str], int]) -> str:
+        key = hashlib.sha256(
+            f"{budget}\x1e".encode("utf-8") + "\x1e".join(turn.text for turn in turns).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return digest
+            self.misses += 1
+        digest = build_digest(turns, budget, counter)
+        with self._lock:
+            self._entries[key] = digest
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return digest
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def build_digest(turns: List[Turn], budget: int, counter: Callable[[str], int]) -> str:
+    """
+    Extractive digest of omitted turns: the opening sentence of each user turn
+    (all turns when there are no roles), newest first until the budget is spent,
+    then put back in conversation order.
+    """
+    header = f"[Earlier: {len(turns)} turns omitted]"
+    prefix = f"{header} The user said:"
+    remaining = budget - counter(prefix)
+    sources = [turn for turn in turns if turn.role in (None, "user", "client", "human")]
+    items: List[str] = []
+    for turn in reversed(sources):
+        text = _ROLE_RE.sub("", turn.text, count=1).strip()
+        sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0][:DIGEST_ITEM_CHARS].strip()
+        if not sentence:
+            continue
+        cost = counter(sentence) + 1
+        if cost > remaining:
+            break
+        items.append(sentence)
+        remaining -= cost
+    if not items:
+        return header
+    return f"{prefix} " + " / ".join(reversed(items))
+
+
+_digest_cache = DigestCache()
+
+
+def get_digest_cache() -> DigestCache:
+    return _digest_cache
+
+
+def _select_turns(
+    turns: List[Turn],
+    counts: List[int],
+    budget: int,
+    counter: Callable[[str], int]
+) -> Tuple[List[str], int, int]:
+    """The newest turns within ``budget``: their texts in order, their tokens and the index of the first kept."""
+    kept: List[str] = []
+    used = 0
+    start = len(turns)
+    for index in range(len(turns) - 1, -1, -1):
+        if used + counts[index] > budget:
+            break
+        kept.append(turns[index].text)
+        used += counts[index]
+        start = index
+    if not kept:
+        # The newest turn alone is over budget: keep its end, where the latest words are
+        newest = _tail(turns[-1].text, budget, counter)
+        kept.append(newest)
+        used = counter(newest)
+        start = len(turns) - 1
+    kept.reverse()
+    return kept, used, start
+
+
+def build_context_window(context: str, budget: Optional[int] = None) -> ContextWindow:
+    """
+    Window a conversation context to the token budget.
+
+    Args:
+        context: Conversation as sent by the client
+        budget: Token budget (defaults to CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        ContextWindow with the text to send and its token counts
+    """
+    counter = get_token_counter()
+    turns = split_turns(context)
+    counts = [_count_turn(turn.text, counter) for turn in turns]
+    context_tokens = sum(counts)
+    if not env_bool("CONTEXT_WINDOW_ENABLED", True):
+        return ContextWindow(context, context_tokens, context_tokens, 0, len(turns), len(turns))
+
+    budget = budget or env_int("CONTEXT_TOKEN_BUDGET", 1000)
+    # Turns are joined with newlines, which count as nothing here
+    if context_tokens <= budget:
+        return ContextWindow(context, context_tokens, context_tokens, 0, len(turns), len(turns))
+
+    kept, used, start = _select_turns(turns, counts, budget, counter)
+    digest_budget = 0
+    if start > 0 and env_bool("CONTEXT_DIGEST_ENABLED", False):
+        # Turns are omitted, so part of the budget goes to their digest instead
+        digest_budget = min(env_int("CONTEXT_DIGEST_TOKENS", 120), budget // 2)
+        kept, used, start = _select_turns(turns, counts, budget - digest_budget, counter)
+
+    digest = ""
+    digest_tokens = 0
+    if digest_budget and start > 0:
+        digest = _digest_cache.get_or_build(turns[:start], digest_budget, counter)
+        digest_tokens = counter(digest)
+
+    text = "\n".join(([digest] if digest else []) + kept)
+    return ContextWindow(text, context_tokens, used + digest_tokens, digest_tokens, len(turns), len(turns) - start)
@@ -0,0 +1,213 @@
+"""
+Per-worker index of the NocoDB rows known to exist, so nocodb_upsert can pick
+between create and update up front instead of always trying an update first.
+
+Each table has an LRU set of session ids this worker has written or seen.
+Optionally a Bloom filter is warmed in the background from a paged listing of
+the table's session ids. An id is predicted to exist when it is in the LRU set
+or the Bloom filter says it may be there; otherwise it is predicted to be new.
+A wrong guess costs the second round trip the upsert always paid before:
+a create rejected as a duplicate is retried as an update, and an update of a
+missing row as a create.
+
+Creating first is only safe when NocoDB rejects a duplicate create, i.e. when
+session_id has a unique constraint in the table. Nothing here creates or checks
+that constraint, so a table opts in with NOCODB_SESSION_ID_UNIQUE once it has
+one; until then unknown ids are updated first, and only the extra round trip
+for new rows is saved when the index knows the row exists.
+
+A warm-up that fails is retried by a later upsert, at most once per
+NOCODB_EXISTENCE_WARMUP_RETRY_SECONDS, and on the caller's event loop.
+
+Configuration is handled via environment variables:
+- NOCODB_EXISTENCE_INDEX_ENABLED: Master switch (defaults to true)
+- NOCODB_EXISTENCE_LRU_SIZE: Session ids remembered per table (defaults to 50000)
+- NOCODB_SESSION_ID_UNIQUE: session_id has a unique constraint in NOCODB_TABLE_NAME
+  (defaults to false)
+- NOCODB_EXISTENCE_BLOOM_ENABLED: Warm a Bloom filter from the table on first use (defaults to false)
+- NOCODB_EXISTENCE_BLOOM_CAPACITY / NOCODB_EXISTENCE_BLOOM_ERROR_RATE: Bloom filter
+  sizing (defaults to 100000 ids at a 1% false-positive rate)
+- NOCODB_EXISTENCE_WARMUP_PAGE_SIZE / NOCODB_EXISTENCE_WARMUP_MAX_ROWS: Listing page size
+  and the most rows read while warming (defaults to 1000 / 100000)
+- NOCODB_EXISTENCE_WARMUP_RETRY_SECONDS: Wait before retrying a failed warm-up (defaults to 60)
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from shared.config import env_bool, env_float, env_int
+
+
+PREDICT_UPDATE = "update"
+PREDICT_CREATE = "create"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing of one BLAKE2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        error_rate = min(max(error_rate, 1e-6), 0.5)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class ExistenceIndex:
+    """Known-existing session ids of one NocoDB table."""
+
+    def __init__(self, table_name: str, max_entries: int = 50000, create_first: bool = False):
+        self.table_name = table_name
+        self.max_entries = max_entries
+        # Whether a duplicate create is rejected, making "create" a safe guess
+        self.create_first = create_first
+        self.bloom: Optional[BloomFilter] = None
+        self._known: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._warmup: Optional[asyncio.Task] = None
+        self._warmup_retry_at = 0.0
+        self._stats = {
+            "predicted_update": 0,
+            "predicted_create": 0,
+            "wrong_guesses": 0,
+            "warmed_rows": 0,
+            "warmup_failures": 0,
+        }
+
+    def predict(self, session_id: str) -> str:
+        """PREDICT_UPDATE if the row is believed to exist, else PREDICT_CREATE."""
+        with self._lock:
+            if session_id in self._known:
+                self._known.move_to_end(session_id)
+                exists = True
+            elif self.bloom is not None:
+                exists = session_id in self.bloom
+            else:
+                exists = False
+            prediction = PREDICT_UPDATE if exists or not self.create_first else PREDICT_CREATE
+            self._stats[f"predicted_{prediction}"] += 1
+        return prediction
+
+    def add(self, session_id: str) -> None:
+        """Remember that a row for ``session_id`` exists."""
+        with self._lock:
+            self._known[session_id] = None
+            self._known.move_to_end(session_id)
+            while len(self._known) > self.max_entries:
+                self._known.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        """Forget a row that turned out not to exist (the Bloom filter cannot forget)."""
+        with self._lock:
+            self._known.pop(session_id, None)
+
+    def wrong_guess(self) -> None:
+        with self._lock:
+            self._stats["wrong_guesses"] += 1
+
+    def start_warmup(self, list_page: Callable[[int, int], Awaitable[Dict[str, Any]]]) -> None:
+        """
+        Warm the Bloom filter in the background from a paged listing.
+
+        ``list_page(offset, limit)`` returns a NocoDB listing ({"list": [...],
+        "pageInfo": {"isLastPage": ...}}). Upserts do not wait for it; they use
+        the filter once it is complete. A warm-up runs once per worker unless it
+        failed, or its event loop was closed before it finished.
+        """
+        if self.bloom is not None or not env_bool("NOCODB_EXISTENCE_BLOOM_ENABLED", False):
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            warmup = self._warmup
+            if warmup is not None and not warmup.done() and not warmup.get_loop().is_closed():
+                return
+            if self.bloom is not None or time.monotonic() < self._warmup_retry_at:
+                return
+            self._warmup = loop.create_task(self._warm(list_page))
+
+    async def _warm(self, list_page: Callable[[int, int], Awaitable[Dict[str, Any]]]) -> None:
+        bloom = BloomFilter(
+            env_int("NOCODB_EXISTENCE_BLOOM_CAPACITY", 100000),
+            env_float("NOCODB_EXISTENCE_BLOOM_ERROR_RATE", 0.01),
+        )
+        page_size = env_int("NOCODB_EXISTENCE_WARMUP_PAGE_SIZE", 1000)
+        max_rows = env_int("NOCODB_EXISTENCE_WARMUP_MAX_ROWS", 100000)
+        offset = 0
+        try:
+            while offset < max_rows:
+                page = await list_page(offset, min(page_size, max_rows - offset))
+                records = page.get("list") or []
+                for record in records:
+                    if record.get("session_id") is not None:
+                        bloom.add(str(record["session_id"]))
+                offset += len(records)
+                if not records or (page.get("pageInfo") or {}).get("isLastPage", True):
+                    break
+        except Exception as e:
+            # Without the filter, predictions fall back to the LRU set alone until a retry succeeds
+            logging.warning("NocoDB existence warm-up of %s failed after %s rows: %s", self.table_name, offset, e)
+            with self._lock:
+                self._warmup = None
+                self._warmup_retry_at = time.monotonic() + env_float("NOCODB_EXISTENCE_WARMUP_RETRY_SECONDS", 60.0)
+                self._stats["warmup_failures"] += 1
+            return
+        with self._lock:
+            self.bloom = bloom
+            self._stats["warmed_rows"] = bloom.count
+        logging.info("NocoDB existence index for %s warmed with %s session ids", self.table_name, bloom.count)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "known": len(self._known),
+                "create_first": self.create_first,
+                "bloom_ready": self.bloom is not None,
+            }
+
+
+_indexes: Dict[str, ExistenceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_existence_index(table_name: str) -> Optional[ExistenceIndex]:
+    """Get the worker's index for a table, or None when NOCODB_EXISTENCE_INDEX_ENABLED is off."""
+    if not env_bool("NOCODB_EXISTENCE_INDEX_ENABLED", True):
+        return None
+    index = _indexes.get(table_name)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(table_name)
+            if index is None:
+                index = _indexes[table_name] = ExistenceIndex(
+                    table_name,
+                    max_entries=env_int("NOCODB_EXISTENCE_LRU_SIZE", 50000),
+                    create_first=env_bool("NOCODB_SESSION_ID_UNIQUE", False),
+                )
+    return index
+
+
+def get_existence_stats() -> Dict[str, Dict[str, Any]]:
+    """Prediction counters and index sizes per table."""
+    return {name: index.stats() for name, index in list(_indexes.items())}
@@ -0,0 +1,233 @@
+"""
+Shared request/response pipeline for the HTTP handlers.
+
+Request bodies are declared once per handler as a Schema of Fields. Each schema
+compiles its checks into closures at import time, with the error bodies for
+every field (missing, wrong type, empty) serialized up front, so a rejected
+request costs a dictionary lookup and no JSON encoding.
+
+JSON goes through orjson when it is installed and the standard library
+otherwise. Handlers decorated with json_handler() raise HttpError for client
+errors and let anything else become a logged 500 with a constant body.
+"""
+
+import functools
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, Union
+
+import azure.functions as func
+
+from shared.timing import stage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+
+JSON_MIMETYPE = "application/json"
+
+if orjson is not None:
+    JSON_CODEC = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes."""
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+else:
+    JSON_CODEC = "json"
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes."""
+        return _encoder.encode(obj).encode("utf-8")
+
+    loads = json.loads
+
+
+OK_BODY = dumps({"status": "ok"})
+
+
+def error_body(message: str, status: str = "error") -> bytes:
+    """Pre-serialize a constant {"status": ..., "message": ...} error body."""
+    return dumps({"status": status, "message": message})
+
+
+class HttpError(Exception):
+    """
+    A client-facing error carrying a pre-serialized body.
+
+    Raise a new instance each time with one of the constant bodies; a shared
+    exception instance would collect tracebacks across requests.
+    """
+
+    def __init__(self, status_code: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+
+    def __str__(self) -> str:
+        return f"{self.status_code}: {self.body.decode('utf-8', 'replace')}"
+
+    def to_response(self) -> func.HttpResponse:
+        return func.HttpResponse(
+            self.body, status_code=self.status_code, headers=self.headers, mimetype=JSON_MIMETYPE
+        )
+
+
+INVALID_JSON_BODY = error_body("Invalid JSON in request body.")
+BODY_NOT_OBJECT_BODY = error_body("Request body must be a JSON object.")
+
+_TYPE_NAMES = {str: "a string", int: "an integer", float: "a number", bool: "a boolean",
+               dict: "an object", list: "an array"}
+
+
+class Field:
+    """
+    One top-level field of a JSON request body.
+
+    Args:
+        name: Key in the body
+        types: Accepted type or tuple of types (None accepts any value)
+        required: Whether a missing or null value is an error
+        default: Value used when an optional field is missing or null
+        strip: Strip surrounding whitespace from strings
+        non_empty: Reject empty strings, objects and arrays (after stripping)
+        coerce: Callable applied to the value after the checks, e.g. str
+        choices: Allowed values
+    """
+
+    def __init__(
+        self,
+        name: str,
+        types: Union[Type, Tuple[Type, ...], None] = str,
+        required: bool = False,
+        default: Any = None,
+        strip: bool = False,
+        non_empty: bool = False,
+        coerce: Optional[Callable[[Any], Any]] = None,
+        choices: Optional[Tuple[Any, ...]] = None
+    ):
+        self.name = name
+        self.types = types
+        self.required = required
+        self.default = default
+        self.strip = strip
+        self.non_empty = non_empty
+        self.coerce = coerce
+        self.choices = choices
+
+    def compile(self) -> Callable[[Dict[str, Any]], Any]:
+        """Build the check for this field, with its error bodies serialized once."""
+        name = self.name
+        types = self.types
+        accepted = types if isinstance(types, tuple) else (types,)
+        expected = " or ".join(_TYPE_NAMES.get(t, getattr(t, "__name__", "any")) for t in accepted)
+        missing = error_body(f"Missing required field: '{name}'.")
+        wrong_type = error_body(f"Invalid '{name}' field: must be {expected}.")
+        empty = error_body(f"'{name}' cannot be empty.")
+        not_a_choice = error_body(
+            f"Invalid '{name}' field: must be one of {', '.join(map(str, self.choices or ()))}."
+        )
+        # bool is an int subclass; an int field should not silently accept true/false
+        reject_bool = types is not None and bool not in accepted
+        required, default, strip, non_empty = self.required, self.default, self.strip, self.non_empty
+        coerce, choices = self.coerce, self.choices
+
+        def check(body: Dict[str, Any]) -> Any:
+            value = body.get(name)
+            if value is None:
+                if required:
+                    raise HttpError(400, missing)
+                return default
+            if types is not None and (not isinstance(value, types) or (reject_bool and isinstance(value, bool))):
+                raise HttpError(400, wrong_type)
+            if strip and isinstance(value, str):
+                value = value.strip()
+            if non_empty and not value and not isinstance(value, (int, float)):
+                raise HttpError(400, empty)
+            if choices is not None and value not in choices:
+                raise HttpError(400, not_a_choice)
+            return coerce(value) if coerce is not None else value
+
+        return check
+
+
+class Schema:
+    """A request body made of Fields; the checks are compiled when the schema is created."""
+
+    def __init__(self, *fields: Field):
+        self.fields = fields
+        self._checks: List[Tuple[str, Callable[[Dict[str, Any]], Any]]] = [
+            (field.name, field.compile()) for field in fields
+        ]
+
+    def validate(self, body: Any) -> Dict[str, Any]:
+        """
+        Check a decoded body and return the declared fields (unknown keys are dropped).
+
+        Raises:
+            HttpError: 400 with the pre-serialized message of the first failing field
+        """
+        if not isinstance(body, dict):
+            raise HttpError(400, BODY_NOT_OBJECT_BODY)
+        return {name: check(body) for name, check in self._checks}
+
+    def parse(self, req: func.HttpRequest) -> Dict[str, Any]:
+        """Decode and validate a request body."""
+        with stage("parse"):
+            return self.validate(parse_json(req))
+
+
+def parse_json(req: func.HttpRequest) -> Any:
+    """
+    Decode a JSON request body with the fast codec.
+
+    Raises:
+        HttpError: 400 if the body is empty or not valid JSON
+    """
+    try:
+        return loads(req.get_body())
+    except ValueError:
+        raise HttpError(400, INVALID_JSON_BODY) from None
+
+
+def json_response(
+    payload: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> func.HttpResponse:
+    """Serialize a payload with the fast codec into a JSON HttpResponse (bytes are sent as they are)."""
+    if isinstance(payload, bytes):
+        body = payload
+    else:
+        with stage("serialize"):
+            body = dumps(payload)
+    return func.HttpResponse(body, status_code=status_code, headers=headers, mimetype=JSON_MIMETYPE)
+
+
+def json_handler(function_name: str, internal_error_message: str = "Internal server error.") -> Callable:
+    """
+    Decorate an async HTTP handler with the shared error handling.
+
+    HttpError becomes its pre-serialized response; any other exception is logged
+    and answered with a 500 carrying ``internal_error_message``. Place it below
+    timed_handler and admission_controlled.
+    """
+    internal_error = error_body(internal_error_message)
+
+    def decorator(handler: Callable[..., Awaitable[func.HttpResponse]]) -> Callable[..., Awaitable[func.HttpResponse]]:
+        @functools.wraps(handler)
+        async def wrapper(*args: Any, **kwargs: Any) -> func.HttpResponse:
+            try:
+                return await handler(*args, **kwargs)
+            except HttpError as e:
+                return e.to_response()
+            except Exception as e:
+                logging.error("Unexpected error in %s: %s", function_name, e)
+                return json_response(internal_error, status_code=500)
+        return wrapper
+    return decorator
@@ -0,0 +1,221 @@
+"""
+Intake scoring shared by evaluate_intake_progress and the orchestrator.
+
+A session's score is the sum of the weights of the intake fields that have a
+non-empty value; enough data has been collected once the score reaches the
+threshold. Weights and threshold come from configuration:
+- INTAKE_FIELD_WEIGHTS: JSON object of field name to weight
+- INTAKE_SCORE_THRESHOLD: Minimum score for enough_data (defaults to 6)
+
+Batch scoring fills a NumPy presence matrix (records x fields) one column at a
+time and scores every record with one matrix-vector product. Reading the values
+out of the per-record dicts is still a Python loop over every cell (an inline
+test rather than a is_field_non_empty() call); only the weighting and the
+threshold run in NumPy.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from shared.config import env_float, env_str
+
+
+# Define field weights
+DEFAULT_FIELD_WEIGHTS = {
+    "symptoms": 3,
+    "duration": 2,
+    "triggers": 2,
+    "intensity": 1,
+    "frequency": 1,
+    "impact_on_life": 2,
+    "coping_mechanisms": 1
+}
+
+# Threshold: 6 out of 12
+DEFAULT_THRESHOLD = 6
+
+# Records scored per NumPy pass when streaming large batches
+BATCH_CHUNK_SIZE = 10000
+
+
+class IntakeConfig(NamedTuple):
+    weights: Dict[str, float]
+    threshold: float
+
+
+def is_field_non_empty(value) -> bool:
+    """Check if a field value is non-empty (non-null, non-whitespace string)."""
+    return value is not None and isinstance(value, str) and value.strip() != ""
+
+
+def get_intake_config(
+    weights: Optional[Dict[str, Any]] = None,
+    threshold: Optional[Any] = None
+) -> IntakeConfig:
+    """
+    Resolve scoring weights and threshold.
+
+    Explicit arguments win over INTAKE_FIELD_WEIGHTS / INTAKE_SCORE_THRESHOLD,
+    which win over the built-in defaults.
+
+    Raises:
+        ValueError: If explicitly supplied weights or threshold are invalid
+    """
+    if weights is None:
+        configured = env_str("INTAKE_FIELD_WEIGHTS")
+        if configured:
+            try:
+                weights = _validate_weights(json.loads(configured))
+            except ValueError as e:
+                logging.warning("Ignoring invalid INTAKE_FIELD_WEIGHTS: %s", e)
+                weights = None
+    else:
+        weights = _validate_weights(weights)
+
+    if threshold is None:
+        threshold = env_float("INTAKE_SCORE_THRESHOLD", DEFAULT_THRESHOLD)
+    elif isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+        raise ValueError("'threshold' must be a number")
+
+    return IntakeConfig(dict(weights or DEFAULT_FIELD_WEIGHTS), threshold)
+
+
+def _validate_weights(weights: Any) -> Dict[str, float]:
+    if not isinstance(weights, dict) or not weights:
+        raise ValueError("'weights' must be a non-empty object")
+    for name, weight in weights.items():
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight < 0:
+            raise ValueError(f"weight for {name!r} must be a non-negative number")
+    return weights
+
+
+def intake_config_version(config: IntakeConfig) -> str:
+    """Short digest of the weights and threshold; stored scores computed under another version are stale."""
+    return _config_version(tuple(sorted(config.weights.items())), config.threshold)
+
+
+@functools.lru_cache(maxsize=32)
+def _config_version(weights: Tuple[Tuple[str, float], ...], threshold: float) -> str:
+    material = json.dumps([weights, threshold])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:12]
+
+
+def _as_number(value: float) -> Any:
+    """Render whole-number scores as ints so single and batch output match."""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def calculate_intake_score(
+    fields: dict,
+    config: Optional[IntakeConfig] = None
+) -> Tuple[Any, bool]:
+    """Calculate the weighted intake score and whether enough data has been collected."""
+    config = config or get_intake_config()
+    score = 0
+    for field_name, weight in config.weights.items():
+        field_value = fields.get(field_name)
+        if is_field_non_empty(field_value):
+            score += weight
+
+    return _as_number(score), score >= config.threshold
+
+
+def score_batch(
+    field_sets: List[Dict[str, Any]],
+    config: Optional[IntakeConfig] = None
+) -> Tuple[List[Any], List[bool]]:
+    """
+    Score many field objects: presence column by column, then one matrix-vector product.
+
+    Returns:
+        Tuple of (scores, enough_data flags), one entry per field object
+    """
+    import numpy as np
+
+    config = config or get_intake_config()
+    names = list(config.weights)
+    weights = np.fromiter(config.weights.values(), dtype=np.float64, count=len(names))
+    presence = np.empty((len(field_sets), len(names)), dtype=np.bool_)
+    for column, name in enumerate(names):
+        # is_field_non_empty() inlined: "" and all-whitespace strings are empty
+        presence[:, column] = [
+            isinstance(value, str) and value != "" and not value.isspace()
+            for value in [fields.get(name) for fields in field_sets]
+        ]
+
+    scores = presence @ weights
+    enough = scores >= config.threshold
+    return [_as_number(score) for score in scores.tolist()], enough.tolist()
+
+
+def _validate_record(record: Any) -> Optional[str]:
+    """Return an error message for a malformed batch record, or None if it is valid."""
+    if not isinstance(record, dict):
+        return "Record must be an object."
+    if "session_id" not in record:
+        return "Missing required field: 'session_id'."
+    if "fields" not in record:
+        return "Missing required field: 'fields'."
+    if not isinstance(record["fields"], dict):
+        return "Invalid input: 'fields' must be an object."
+    return None
+
+
+def iter_batch_results(
+    records: Iterable[Any],
+    config: Optional[IntakeConfig] = None,
+    chunk_size: int = BATCH_CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Score ``{session_id, fields}`` records chunk by chunk, yielding one result each.
+
+    Malformed records yield an error result in place instead of failing the batch.
+    Records may be exceptions (e.g. unparsable NDJSON lines), which are reported
+    as errors too.
+    """
+    config = config or get_intake_config()
+    chunk: List[Any] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield from _score_chunk(chunk, config)
+            chunk = []
+    if chunk:
+        yield from _score_chunk(chunk, config)
+
+
+def _score_chunk(chunk: List[Any], config: IntakeConfig) -> Iterator[Dict[str, Any]]:
+    errors = [
+        str(record) if isinstance(record, Exception) else _validate_record(record)
+        for record in chunk
+    ]
+    valid = [record["fields"] for record, error in zip(chunk, errors) if error is None]
+    scores, enough = score_batch(valid, config) if valid else ([], [])
+
+    position = 0
+    for record, error in zip(chunk, errors):
+        session_id = record.get("session_id") if isinstance(record, dict) else None
+        if error is not None:
+            yield {"session_id": session_id, "status": "error", "message": error}
+            continue
+        yield {
+            "session_id": session_id,
+            "status": "ok",
+            "score": scores[position],
+            "enough_data": enough[position]
+        }
+        position += 1
+
+
+def iter_ndjson(body: bytes) -> Iterator[Any]:
+    """Parse an NDJSON body line by line; unparsable lines become ValueError items."""
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError(f"Invalid JSON on line {line_number}.")
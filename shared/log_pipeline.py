@@ -0,0 +1,274 @@
+"""
+Non-blocking, PII-safe logging for the function handlers.
+
+configure_logging() moves the handlers installed on the root logger (the
+Functions host's, or a local console handler) behind a QueueListener. Logging
+calls on the request path then only filter the record and put it on a bounded
+queue. Formatting, redaction and emission happen on the listener thread, and a
+full queue drops records instead of blocking a request. The caller's
+contextvars are captured with each record and restored for emission, so the
+host can still attribute log lines to their invocation.
+
+Call sites keep arguments unformatted (``logging.info("... %s", value)``) and
+wrap costly or sensitive values:
+
+- lazy_json(obj) serializes a structured field only when the record is emitted
+- sensitive(text) renders user content by LOG_REDACTION: "redact" (default)
+  shows only its length, "hash" a short digest that correlates repeated
+  messages, "off" the text itself
+
+Unless LOG_REDACTION is "off", the rendered line, and the traceback or stack
+dump attached to it, are also scrubbed of email addresses and phone numbers.
+Tracebacks are rendered to text before a record is queued, so no exception
+frames are kept alive in the queue.
+
+Warnings and errors are rate-limited per call site: past LOG_RATE_LIMIT_BURST
+records in LOG_RATE_LIMIT_WINDOW seconds they are dropped before they reach the
+queue. The next record let through reports how many were suppressed.
+
+Configuration is handled via environment variables:
+- LOG_PIPELINE_ENABLED: Master switch (defaults to true)
+- LOG_QUEUE_SIZE: Records buffered for the listener thread (defaults to 10000)
+- LOG_REDACTION: "redact" (default), "hash" or "off"
+- LOG_RATE_LIMIT_BURST / LOG_RATE_LIMIT_WINDOW: Warnings and errors allowed per
+  call site and window in seconds (defaults to 10 / 60)
+"""
+
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from shared.config import env_bool, env_float, env_int, env_str
+
+
+REDACTION_POLICIES = ("redact", "hash", "off")
+# Call sites tracked by the rate limiter before its table is reset
+_MAX_RATE_LIMIT_KEYS = 1024
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE_RE = re.compile(r"(?<![\w+-])(?:\+\d{1,3}[\s.-]?)?(?:\(?\d{2,4}\)?[\s.-]){1,3}\d{3,4}[\s.-]?\d{3,4}(?![\w-])")
+
+
+def redaction_policy() -> str:
+    policy = (env_str("LOG_REDACTION", "redact") or "redact").lower()
+    return policy if policy in REDACTION_POLICIES else "redact"
+
+
+class _Sensitive:
+    """User content, rendered by the redaction policy when the record is emitted."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: Any):
+        self.text = text
+
+    def __str__(self) -> str:
+        text = "" if self.text is None else str(self.text)
+        policy = redaction_policy()
+        if policy == "off":
+            return repr(text)
+        if policy == "hash":
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+            return f"<sha256:{digest} len={len(text)}>"
+        return f"<redacted len={len(text)}>"
+
+    __repr__ = __str__
+
+
+class _LazyJSON:
+    """A structured field, serialized when the record is emitted."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        # sensitive() values inside render through their own policy
+        return json.dumps(self.value, default=str, ensure_ascii=False)
+
+
+def sensitive(text: Any) -> _Sensitive:
+    """Wrap user content for a log record; it is rendered by the redaction policy when emitted."""
+    return _Sensitive(text)
+
+
+def lazy_json(value: Any) -> _LazyJSON:
+    """Wrap a structured log field; it is serialized to JSON only when the record is emitted."""
+    return _LazyJSON(value)
+
+
+def scrub(message: str) -> str:
+    """Mask email addresses and phone numbers in a rendered log line."""
+    message = _EMAIL_RE.sub("<email>", message)
+    return _PHONE_RE.sub("<phone>", message)
+
+
+class CallSiteRateLimiter(logging.Filter):
+    """Lets through at most ``burst`` warnings and errors per call site and window."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.suppressed = 0
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= _MAX_RATE_LIMIT_KEYS:
+                    self._sites.clear()
+                # [window start, records let through, records suppressed]
+                site = self._sites[key] = [now, 0, 0]
+            elif now - site[0] >= self.window:
+                if site[2]:
+                    record.suppressed = site[2]
+                site[:] = [now, 0, 0]
+            if site[1] >= self.burst:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+            site[1] += 1
+        return True
+
+
+class PipelineQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted, with the caller's context, and never blocks."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is formatted on the listener thread; only the context is captured here
+        record.log_context = contextvars.copy_context()
+        if record.exc_info:
+            # As the stdlib QueueHandler does: render the traceback now, so the queued
+            # record holds text instead of live frames (and their locals)
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            # Plain counters: approximate under contention, but no lock on the request path
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class PipelineQueueListener(logging.handlers.QueueListener):
+    """Renders, redacts and emits records on the listener thread."""
+
+    def enqueue_sentinel(self) -> None:
+        # The base class uses put_nowait, which fails on a full queue; the listener is draining it
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        context = record.__dict__.pop("log_context", None)
+        message = record.getMessage()
+        if redaction_policy() != "off":
+            message = scrub(message)
+            # Exception messages and stack dumps can quote user content too
+            if record.exc_text:
+                record.exc_text = scrub(record.exc_text)
+            if record.stack_info:
+                record.stack_info = scrub(record.stack_info)
+        suppressed = record.__dict__.pop("suppressed", 0)
+        if suppressed:
+            message = f"{message} ({suppressed} similar records suppressed)"
+        record.msg, record.args = message, None
+        if context is None:
+            super().handle(record)
+        else:
+            context.run(super().handle, record)
+
+
+_exception_formatter = logging.Formatter()
+_listener: Optional[PipelineQueueListener] = None
+_queue_handler: Optional[PipelineQueueHandler] = None
+_rate_limiter: Optional[CallSiteRateLimiter] = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging() -> bool:
+    """
+    Put the root logger's handlers behind the queue, once per worker.
+
+    Returns:
+        bool: Whether the pipeline is active (it is not when disabled or when the
+              root logger has no handlers to move)
+    """
+    global _listener, _queue_handler, _rate_limiter
+
+    if _listener is not None:
+        return True
+    if not env_bool("LOG_PIPELINE_ENABLED", True):
+        return False
+    with _configure_lock:
+        if _listener is not None:
+            return True
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        if not handlers:
+            return False
+        _queue_handler = PipelineQueueHandler(queue.Queue(maxsize=env_int("LOG_QUEUE_SIZE", 10000)))
+        _rate_limiter = CallSiteRateLimiter(
+            env_int("LOG_RATE_LIMIT_BURST", 10), env_float("LOG_RATE_LIMIT_WINDOW", 60.0)
+        )
+        _queue_handler.addFilter(_rate_limiter)
+        _listener = PipelineQueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return True
+
+
+def shutdown_logging() -> None:
+    """Flush the queue and give the root logger its handlers back."""
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        listener, handler = _listener, _queue_handler
+        _listener = _queue_handler = None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(handler)
+    listener.stop()
+    for original in listener.handlers:
+        root.addHandler(original)
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    handler, limiter = _queue_handler, _rate_limiter
+    if handler is None:
+        return {"pipeline": False, "redaction": redaction_policy()}
+    return {
+        "pipeline": True,
+        "redaction": redaction_policy(),
+        "enqueued": handler.enqueued,
+        "dropped": handler.dropped,
+        "suppressed": limiter.suppressed if limiter is not None else 0,
+        "queue_depth": handler.queue.qsize(),
+    }
@@ -0,0 +1,492 @@
+"""
+On-CPU chat mode classifier, the fast path of switch_chat_mode.
+
+A multinomial logistic regression over hashed word unigrams and bigrams picks
+one of the four chat modes in microseconds. When its top probability reaches
+MODE_CLASSIFIER_THRESHOLD the mode is answered locally; otherwise the turn goes
+to the LLM analysis as before. A sampled share of the confident answers is also
+sent to the LLM (shadow mode), so agreement with the LLM path is measured on the
+traffic the classifier actually answers, not only on the turns it hands over.
+
+The model is trained offline from logged (message, chosen mode) pairs, e.g. the
+session log written by the jsonl or sqlite sinks, whose records carry a single
+user message. The classifier therefore reads the same unit at serve time: of the
+windowed context it is given, only the latest user turn, without its role
+prefix (classifier_text()). Logged records that carry a whole context are
+reduced the same way for training:
+
+    python -m shared.mode_classifier train session_log.jsonl --output mode_classifier.npz
+    python -m shared.mode_classifier evaluate held_out.jsonl --model mode_classifier.npz
+
+The artifact is a NumPy .npz file carrying the weights, the feature settings and
+a version string (format version plus a digest of the weights). It is loaded on
+first use, and NumPy is only imported then.
+
+Configuration is handled via environment variables:
+- MODE_CLASSIFIER_PATH: Model artifact; the classifier is off when unset
+- MODE_CLASSIFIER_THRESHOLD: Minimum top probability for a local answer (defaults to 0.9)
+- MODE_CLASSIFIER_SHADOW_RATE: Fraction of local answers also checked against
+  the LLM (defaults to 0)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from shared.config import env_float, env_str
+from shared.context_window import split_turns
+from shared.turn_analysis import TURN_ANALYSIS_PROMPT_VERSION, VALID_MODES
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Bump when the feature extraction or the artifact layout changes
+MODEL_FORMAT_VERSION = 2
+DEFAULT_DIM_BITS = 18
+DEFAULT_THRESHOLD = 0.9
+# Longest tail of a message that is featurized
+MAX_CONTEXT_CHARS = 2000
+# Turn roles of the user in role-prefixed contexts
+USER_ROLES = ("user", "client", "human")
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def classifier_text(context: str) -> str:
+    """
+    The text the classifier reads: the latest user turn of a role-prefixed
+    context, without its prefix, or the whole text when it has no role prefixes
+    (a single logged message).
+    """
+    turns = split_turns(context)
+    if not any(turn.role for turn in turns):
+        return context.strip()
+    user_turns = [turn for turn in turns if turn.role in USER_ROLES] or turns
+    text = user_turns[-1].text
+    return text.split(":", 1)[1].strip() if user_turns[-1].role else text.strip()
+
+
+def hash_features(text: str, dim: int) -> Tuple[List[int], List[float]]:
+    """
+    Hashed, L2-normalized counts of the word unigrams and bigrams of a text.
+
+    Args:
+        text: Message to classify (only the last MAX_CONTEXT_CHARS are used)
+        dim: Feature space size, a power of two
+
+    Returns:
+        Tuple of (feature indices, values), with no repeated index
+    """
+    tokens = _TOKEN_RE.findall(text[-MAX_CONTEXT_CHARS:].casefold())
+    mask = dim - 1
+    counts: Dict[int, int] = {}
+    for gram in tokens:
+        index = zlib.crc32(gram.encode("utf-8")) & mask
+        counts[index] = counts.get(index, 0) + 1
+    for first, second in zip(tokens, tokens[1:]):
+        index = zlib.crc32(f"{first} {second}".encode("utf-8")) & mask
+        counts[index] = counts.get(index, 0) + 1
+    if not counts:
+        return [], []
+    norm = 1.0 / math.sqrt(sum(count * count for count in counts.values()))
+    return list(counts), [count * norm for count in counts.values()]
+
+
+class Prediction(NamedTuple):
+    mode: str
+    confidence: float
+    confident: bool
+
+
+class ModeClassifier:
+    """A trained model plus the runtime threshold and agreement counters."""
+
+    def __init__(
+        self,
+        weights: "np.ndarray",
+        bias: "np.ndarray",
+        labels: Sequence[str],
+        dim_bits: int,
+        version: str,
+        threshold: float = DEFAULT_THRESHOLD,
+        shadow_rate: float = 0.0,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.dim = 1 << dim_bits
+        self.dim_bits = dim_bits
+        self.version = version
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self.metadata = metadata or {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "predictions": 0,
+            "local": 0,
+            "fallback": 0,
+            "compared": 0,
+            "agreed": 0,
+            "compared_local": 0,
+            "agreed_local": 0,
+        }
+        self._classifier_ms = 0.0
+        self._llm_ms = 0.0
+        self._llm_calls = 0
+
+    def probabilities(self, text: str) -> "np.ndarray":
+        import numpy as np
+
+        indices, values = hash_features(text, self.dim)
+        logits = self.bias.copy()
+        if indices:
+            logits += np.asarray(values, dtype=self.weights.dtype) @ self.weights[indices]
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, context: str) -> Prediction:
+        """Classify the latest user turn of a context and count the outcome."""
+        started = time.perf_counter()
+        probabilities = self.probabilities(classifier_text(context))
+        best = int(probabilities.argmax())
+        confidence = float(probabilities[best])
+        prediction = Prediction(self.labels[best], confidence, confidence >= self.threshold)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["predictions"] += 1
+            self._stats["local" if prediction.confident else "fallback"] += 1
+            self._classifier_ms += elapsed_ms
+        return prediction
+
+    def should_shadow(self) -> bool:
+        """Whether a local answer should also be checked against the LLM."""
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_llm(self, prediction: Prediction, llm_mode: str, llm_ms: float) -> None:
+        """Count agreement between a prediction and the LLM's mode for the same context."""
+        agreed = prediction.mode == llm_mode
+        with self._lock:
+            self._stats["compared"] += 1
+            self._stats["agreed"] += agreed
+            if prediction.confident:
+                self._stats["compared_local"] += 1
+                self._stats["agreed_local"] += agreed
+            self._llm_ms += llm_ms
+            self._llm_calls += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            classifier_ms, llm_ms, llm_calls = self._classifier_ms, self._llm_ms, self._llm_calls
+        predictions = stats["predictions"]
+        return {
+            **stats,
+            "version": self.version,
+            "threshold": self.threshold,
+            "shadow_rate": self.shadow_rate,
+            "local_rate": round(stats["local"] / predictions, 4) if predictions else None,
+            # Agreement over all compared turns, and over the ones answered locally
+            "agreement": round(stats["agreed"] / stats["compared"], 4) if stats["compared"] else None,
+            "agreement_local": (
+                round(stats["agreed_local"] / stats["compared_local"], 4) if stats["compared_local"] else None
+            ),
+            "mean_classifier_ms": round(classifier_ms / predictions, 4) if predictions else None,
+            "mean_llm_ms": round(llm_ms / llm_calls, 2) if llm_calls else None,
+        }
+
+
+def save_model(
+    path: str,
+    weights: "np.ndarray",
+    bias: "np.ndarray",
+    labels: Sequence[str],
+    dim_bits: int,
+    metadata: Dict[str, Any]
+) -> str:
+    """
+    Write a model artifact.
+
+    Returns:
+        The artifact version ("<format>-<digest of the weights>")
+    """
+    import numpy as np
+
+    digest = hashlib.sha256(weights.tobytes() + bias.tobytes()).hexdigest()[:12]
+    version = f"{MODEL_FORMAT_VERSION}-{digest}"
+    metadata = {
+        **metadata,
+        "version": version,
+        "format": MODEL_FORMAT_VERSION,
+        "dim_bits": dim_bits,
+        "labels": list(labels),
+        "prompt_version": TURN_ANALYSIS_PROMPT_VERSION,
+    }
+    with open(path, "wb") as handle:
+        np.savez_compressed(handle, weights=weights, bias=bias, metadata=np.array(json.dumps(metadata)))
+    return version
+
+
+def load_model(path: str, threshold: float = DEFAULT_THRESHOLD, shadow_rate: float = 0.0) -> ModeClassifier:
+    """
+    Read a model artifact.
+
+    Raises:
+        ValueError: If the artifact has another format version or unknown labels
+    """
+    import numpy as np
+
+    with np.load(path, allow_pickle=False) as artifact:
+        metadata = json.loads(str(artifact["metadata"]))
+        weights = artifact["weights"]
+        bias = artifact["bias"]
+    if metadata.get("format") != MODEL_FORMAT_VERSION:
+        raise ValueError(f"Model format {metadata.get('format')} is not {MODEL_FORMAT_VERSION}")
+    labels = metadata["labels"]
+    if not set(labels) <= set(VALID_MODES):
+        raise ValueError(f"Model labels {labels} are not chat modes")
+    if metadata.get("prompt_version") != TURN_ANALYSIS_PROMPT_VERSION:
+        logging.warning(
+            "Mode classifier %s was trained on labels from prompt %s, the analysis now uses %s",
+            metadata["version"], metadata.get("prompt_version"), TURN_ANALYSIS_PROMPT_VERSION
+        )
+    return ModeClassifier(
+        weights, bias, labels, metadata["dim_bits"], metadata["version"],
+        threshold=threshold, shadow_rate=shadow_rate, metadata=metadata
+    )
+
+
+_classifier: Optional[ModeClassifier] = None
+_classifier_path: Optional[str] = None
+_classifier_lock = threading.Lock()
+
+
+def get_mode_classifier() -> Optional[ModeClassifier]:
+    """
+    Get the worker's classifier, loading MODE_CLASSIFIER_PATH on first use.
+
+    Returns None when no path is configured or the artifact cannot be loaded;
+    callers then use the LLM path only.
+    """
+    global _classifier, _classifier_path
+
+    path = env_str("MODE_CLASSIFIER_PATH")
+    if path is None:
+        return None
+    if _classifier_path == path:
+        return _classifier
+    with _classifier_lock:
+        if _classifier_path != path:
+            try:
+                _classifier = load_model(
+                    path,
+                    threshold=min(env_float("MODE_CLASSIFIER_THRESHOLD", DEFAULT_THRESHOLD), 1.0),
+                    shadow_rate=min(env_float("MODE_CLASSIFIER_SHADOW_RATE", 0.0), 1.0),
+                )
+                logging.info("Loaded mode classifier %s from %s", _classifier.version, path)
+            except (OSError, ValueError, KeyError) as e:
+                # Remember the failure too, so a bad artifact is not re-read on every request
+                logging.error("Mode classifier disabled, cannot load %s: %s", path, e)
+                _classifier = None
+            _classifier_path = path
+    return _classifier
+
+
+def get_mode_classifier_stats() -> Optional[Dict[str, Any]]:
+    """Counters of the loaded classifier, or None if none is loaded."""
+    classifier = _classifier
+    return classifier.stats() if classifier is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Offline training
+# ---------------------------------------------------------------------------
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    """
+    Read (message, mode) pairs from a log.
+
+    JSON Lines records may use "context" or "user_message" for the text and
+    "mode", "new_mode" or "routing_decision" for the label; a .db/.sqlite file is
+    read as the sqlite sink's session_log table. Each text is reduced to what the
+    classifier reads at serve time (classifier_text()). Records whose label is
+    not a chat mode (e.g. risk_escalation) are skipped.
+    """
+    examples = []
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        connection = sqlite3.connect(path)
+        try:
+            rows: Iterable[Tuple[Any, Any]] = connection.execute(
+                "SELECT user_message, routing_decision FROM session_log"
+            ).fetchall()
+        finally:
+            connection.close()
+    else:
+        rows = []
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = record.get("context") or record.get("user_message")
+                label = record.get("mode") or record.get("new_mode") or record.get("routing_decision")
+                rows.append((text, label))
+    for text, label in rows:
+        if isinstance(text, str) and text.strip() and label in VALID_MODES:
+            examples.append((classifier_text(text), label))
+    return examples
+
+
+def _design_matrix(texts: Sequence[str], dim: int) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Sparse (row, index, value) triplets of the hashed features."""
+    import numpy as np
+
+    rows: List[int] = []
+    indices: List[int] = []
+    values: List[float] = []
+    for row, text in enumerate(texts):
+        text_indices, text_values = hash_features(text, dim)
+        rows.extend([row] * len(text_indices))
+        indices.extend(text_indices)
+        values.extend(text_values)
+    return np.asarray(rows, dtype=np.int64), np.asarray(indices, dtype=np.int64), np.asarray(values)
+
+
+def train_model(
+    texts: Sequence[str],
+    labels: Sequence[str],
+    dim_bits: int = DEFAULT_DIM_BITS,
+    epochs: int = 200,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6
+) -> Tuple["np.ndarray", "np.ndarray", List[str]]:
+    """
+    Fit a softmax regression with full-batch AdaGrad on the hashed features.
+
+    Returns:
+        Tuple of (weights of shape (2**dim_bits, classes) as float32, bias, labels)
+    """
+    import numpy as np
+
+    classes = [mode for mode in VALID_MODES if mode in set(labels)]
+    dim = 1 << dim_bits
+    count = len(texts)
+    rows, indices, values = _design_matrix(texts, dim)
+    targets = np.zeros((count, len(classes)))
+    targets[np.arange(count), [classes.index(label) for label in labels]] = 1.0
+
+    weights = np.zeros((dim, len(classes)))
+    bias = np.zeros(len(classes))
+    weights_accumulator = np.full_like(weights, 1e-8)
+    bias_accumulator = np.full_like(bias, 1e-8)
+    logits = np.empty((count, len(classes)))
+    weights_gradient = np.empty_like(weights)
+
+    for _ in range(epochs):
+        for column in range(len(classes)):
+            logits[:, column] = np.bincount(rows, weights=values * weights[indices, column], minlength=count)
+        logits += bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        error = (probabilities - targets) / count
+
+        for column in range(len(classes)):
+            weights_gradient[:, column] = np.bincount(indices, weights=values * error[rows, column], minlength=dim)
+        weights_gradient += l2 * weights
+        bias_gradient = error.sum(axis=0)
+
+        weights_accumulator += weights_gradient ** 2
+        bias_accumulator += bias_gradient ** 2
+        weights -= learning_rate * weights_gradient / np.sqrt(weights_accumulator)
+        bias -= learning_rate * bias_gradient / np.sqrt(bias_accumulator)
+
+    return weights.astype(np.float32), bias.astype(np.float32), classes
+
+
+def evaluate_model(classifier: ModeClassifier, examples: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+    """Accuracy overall and, per threshold, the share answered locally and its accuracy."""
+    scored = []
+    for text, label in examples:
+        probabilities = classifier.probabilities(text)
+        best = int(probabilities.argmax())
+        scored.append((float(probabilities[best]), classifier.labels[best] == label))
+
+    thresholds = {}
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98):
+        local = [correct for confidence, correct in scored if confidence >= threshold]
+        thresholds[str(threshold)] = {
+            "local_rate": round(len(local) / len(scored), 4) if scored else None,
+            "local_accuracy": round(sum(local) / len(local), 4) if local else None,
+        }
+    return {
+        "examples": len(scored),
+        "accuracy": round(sum(correct for _, correct in scored) / len(scored), 4) if scored else None,
+        "thresholds": thresholds,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Train or evaluate the chat mode classifier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="Fit a model on logged (message, mode) pairs")
+    train.add_argument("logs", nargs="+", help="JSON Lines logs or sqlite session_log files")
+    train.add_argument("--output", default="mode_classifier.npz")
+    train.add_argument("--dim-bits", type=int, default=DEFAULT_DIM_BITS, help="Feature space of 2**bits")
+    train.add_argument("--epochs", type=int, default=200)
+    train.add_argument("--learning-rate", type=float, default=0.5)
+    train.add_argument("--l2", type=float, default=1e-6)
+    train.add_argument("--holdout", type=float, default=0.1, help="Fraction held out for the reported metrics")
+    train.add_argument("--seed", type=int, default=1234)
+
+    evaluate = commands.add_parser("evaluate", help="Report accuracy and coverage per threshold")
+    evaluate.add_argument("logs", nargs="+", help="JSON Lines logs or sqlite session_log files")
+    evaluate.add_argument("--model", default=os.environ.get("MODE_CLASSIFIER_PATH", "mode_classifier.npz"))
+
+    args = parser.parse_args(argv)
+    examples = [example for path in args.logs for example in load_examples(path)]
+    if not examples:
+        print("No (message, mode) pairs found in the logs.", file=sys.stderr)
+        return 1
+
+    if args.command == "evaluate":
+        print(json.dumps(evaluate_model(load_model(args.model), examples), indent=2))
+        return 0
+
+    random.Random(args.seed).shuffle(examples)
+    held_out = int(len(examples) * args.holdout)
+    training, holdout = examples[held_out:], examples[:held_out]
+    started = time.perf_counter()
+    weights, bias, labels = train_model(
+        [text for text, _ in training], [label for _, label in training],
+        dim_bits=args.dim_bits, epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2
+    )
+    metadata = {
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "training_examples": len(training),
+        "training_seconds": round(time.perf_counter() - started, 2),
+    }
+    if holdout:
+        classifier = ModeClassifier(weights, bias, labels, args.dim_bits, "holdout")
+        metadata["holdout"] = evaluate_model(classifier, holdout)
+    version = save_model(args.output, weights, bias, labels, args.dim_bits, metadata)
+    print(json.dumps({"output": args.output, **metadata, "version": version}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
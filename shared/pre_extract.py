@@ -0,0 +1,156 @@
+"""
+Deterministic pre-pass of intake field extraction.
+
+Before extract_fields_from_input calls OpenAI, a set of compiled rules looks at
+the message:
+
+- A content-free message, made only of greetings, pleasantries, thanks,
+  goodbyes and acknowledgements ("Hello, how are you today?"), has nothing to
+  extract. The all-null field object is returned without an LLM call.
+- Otherwise the easy cues are read off the text: a duration ("a few weeks"), a
+  frequency ("most nights", "twice a week") and a 1-10 intensity ("7/10"). A
+  cue is only taken when exactly one candidate is found. With
+  PRE_EXTRACT_CUES_ENABLED, the LLM is then asked only for the remaining fields.
+
+Both rules must agree with the LLM extraction. benchmarks/pre_extract_check.py
+fails when a shortcut would answer differently from the (message, fields) pairs
+of benchmarks/corpora/pre_extract.jsonl. The shipped corpus is a hand-labeled
+seed, written alongside the rules, so passing it does not show agreement with
+the model: both shortcuts are off by default. Re-record the corpus from the live
+model (pre_extract_check --record) and enable a shortcut only once it passes.
+
+Configuration is handled via environment variables:
+- PRE_EXTRACT_ENABLED: Answer content-free messages without OpenAI (defaults to false)
+- PRE_EXTRACT_CUES_ENABLED: Fill duration/frequency/intensity from the rules and
+  ask the LLM for the other fields only (defaults to false)
+"""
+
+import re
+import threading
+from typing import Any, Dict, NamedTuple, Optional
+
+from shared.config import env_bool
+
+
+# Whole-message phrases that carry no intake information
+_CONTENT_FREE_PHRASES = [
+    r"(?:hi|hello|hey|hiya|howdy|greetings|yo)(?: there| again)?",
+    r"good (?:morning|afternoon|evening|day)",
+    r"how are you(?: doing)?(?: today)?",
+    r"how(?:'s| is) it going",
+    r"how do you do",
+    r"what(?:'s| is) up",
+    r"nice to (?:meet|see) you",
+    r"(?:thanks|thank you|thx|ty)(?: (?:so|very) much| a lot| again)?",
+    r"many thanks",
+    r"cheers",
+    r"(?:bye|goodbye|good bye|bye bye)(?: for now)?",
+    r"see you(?: later| soon| next time)?",
+    r"take care",
+    r"have a (?:nice|good|great) (?:day|evening|night|weekend)",
+    r"good night",
+    r"(?:i think )?that(?:'s| is) (?:all|it)(?: for (?:now|today))?",
+    r"(?:ok|okay|k|sure|alright|all right|got it|i see|cool|great|yes|yeah|yep|no|nope|hmm+|um+|uh+|oh)",
+]
+
+_PHRASE = "(?:" + "|".join(_CONTENT_FREE_PHRASES) + ")"
+_CONTENT_FREE_RE = re.compile(rf"^[\W_]*{_PHRASE}(?:[\W_]+{_PHRASE})*[\W_]*$")
+
+_NUMBER_WORDS = r"(?:\d+|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)"
+_PERIOD = r"(?:day|night|morning|evening|week|weekend|month|year)"
+
+_FREQUENCY_RE = re.compile(
+    rf"\b(every (?:single )?(?:other |few )?{_PERIOD}s?"
+    rf"|(?:once|twice|{_NUMBER_WORDS} times) (?:a|per|every) {_PERIOD}"
+    r"|(?:daily|nightly|weekly)"
+    rf"|most {_PERIOD}s"
+    r"|all the time)\b"
+)
+_DURATION_RE = re.compile(
+    rf"\b((?:a|an|one|a few|a couple(?: of)?|several|{_NUMBER_WORDS})"
+    r" (?:days?|weeks?|months?|years?))\b(?! ago)"
+)
+_INTENSITY_RE = re.compile(
+    r"\b((?:10|[0-9])(?: ?/ ?| out of )10)\b"
+    r"|\b((?:10|[0-9]) on a scale (?:of|from) (?:0|1|one|zero) to (?:10|ten))\b"
+)
+
+CUE_FIELDS = ("duration", "frequency", "intensity")
+
+
+class PreExtraction(NamedTuple):
+    content_free: bool
+    # Cue fields read off the message (only those found)
+    fields: Dict[str, str]
+
+
+def _normalize(message: str) -> str:
+    return " ".join(message.replace("’", "'").casefold().split())
+
+
+def _single(matches: Any) -> Optional[str]:
+    """The matched phrase when the rule found exactly one distinct candidate."""
+    found = {next(group for group in match.groups() if group) for match in matches}
+    return found.pop() if len(found) == 1 else None
+
+
+def pre_extract(message: str) -> PreExtraction:
+    """Run the rules over one message."""
+    text = _normalize(message)
+    if _CONTENT_FREE_RE.match(text):
+        return PreExtraction(True, {})
+
+    fields: Dict[str, str] = {}
+    frequencies = list(_FREQUENCY_RE.finditer(text))
+    frequency = _single(frequencies)
+    if frequency is not None:
+        fields["frequency"] = frequency
+    # "once a week" is a frequency, not a duration of "a week"
+    for match in frequencies:
+        text = text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+    duration = _single(_DURATION_RE.finditer(text))
+    if duration is not None:
+        fields["duration"] = duration
+    intensity = _single(_INTENSITY_RE.finditer(text))
+    if intensity is not None:
+        fields["intensity"] = intensity
+    return PreExtraction(False, fields)
+
+
+class PreExtractStats:
+    """How many extraction calls the pre-pass answered or narrowed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "content_free": 0, "narrowed": 0, "full": 0, "cue_fields": 0}
+
+    def record(self, outcome: str, cue_fields: int = 0) -> None:
+        with self._lock:
+            self._counts["calls"] += 1
+            self._counts[outcome] += 1
+            self._counts["cue_fields"] += cue_fields
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        calls = counts["calls"]
+        return {
+            **counts,
+            # Share of extraction calls answered without OpenAI
+            "avoided_rate": round(counts["content_free"] / calls, 4) if calls else None,
+        }
+
+
+_stats = PreExtractStats()
+
+
+def get_pre_extract_stats() -> PreExtractStats:
+    return _stats
+
+
+def is_pre_extract_enabled() -> bool:
+    return env_bool("PRE_EXTRACT_ENABLED", False)
+
+
+def are_cues_enabled() -> bool:
+    return env_bool("PRE_EXTRACT_CUES_ENABLED", False)
@@ -0,0 +1,315 @@
+"""
+Client-side rate limiting for OpenAI calls, driven by the x-ratelimit-* headers.
+
+Every OpenAI response updates a requests bucket and a tokens bucket for its
+endpoint scope ("chat", "moderations") from x-ratelimit-limit-*,
+x-ratelimit-remaining-* and x-ratelimit-reset-*. Between responses the buckets
+refill at limit per minute. Before sending, a call estimates its token cost and
+waits until both buckets can cover it, so bursts queue here instead of turning
+into 429 storms and blind SDK retries.
+
+Waiters are served by priority (PRIORITY_RISK, then PRIORITY_ANALYSIS, then
+PRIORITY_BACKGROUND), then by arrival. Lower-priority work also leaves the last
+RATE_LIMIT_PRIORITY_RESERVE fraction of each bucket to risk checks. Until a scope
+has seen its first response its limits are unknown and calls are not delayed.
+
+Configuration is handled via environment variables:
+- RATE_LIMIT_ENABLED: Master switch (defaults to true)
+- RATE_LIMIT_MAX_WAIT_SECONDS: Longest a call queues before failing with RateLimitedError (defaults to 20)
+- RATE_LIMIT_PRIORITY_RESERVE: Bucket fraction kept for high-priority calls (defaults to 0.1)
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from shared.config import env_bool, env_float
+from shared.resilience import ServiceUnavailableError
+
+
+PRIORITY_RISK = 0
+PRIORITY_ANALYSIS = 1
+PRIORITY_BACKGROUND = 2
+
+# Waiters that are not at the head of the queue re-check at least this often
+_MAX_IDLE_WAIT = 0.5
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimitedError(ServiceUnavailableError):
+    """A call waited longer than RATE_LIMIT_MAX_WAIT_SECONDS for rate-limit budget."""
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse an OpenAI reset duration such as "1s", "6m0s" or "20ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(texts: Iterable[str], max_output_tokens: int = 0) -> int:
+    """
+    Rough token cost of a request as OpenAI counts it against the TPM limit.
+
+    Prompt tokens are estimated at four characters per token plus a small
+    per-message overhead; the requested output budget counts in full.
+    """
+    prompt = sum(len(text) // 4 + 4 for text in texts)
+    return prompt + max_output_tokens
+
+
+class TokenBucket:
+    """Level and capacity of one rate limit, refilled continuously at capacity per minute."""
+
+    def __init__(self) -> None:
+        self.capacity: Optional[float] = None
+        self.level = 0.0
+        self._updated = time.monotonic()
+
+    @property
+    def known(self) -> bool:
+        return self.capacity is not None
+
+    def refill(self, now: float) -> None:
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def observe(self, limit: Optional[float], remaining: Optional[float], now: float) -> None:
+        """Adopt the server's view of the limit from response headers."""
+        self.refill(now)
+        if limit is not None and limit > 0:
+            self.capacity = limit
+        if remaining is not None and self.capacity is not None:
+            self.level = min(self.capacity, max(0.0, remaining))
+
+    def seconds_until(self, amount: float) -> float:
+        if self.capacity is None or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+
+class _Scope:
+    """Buckets and priority-ordered waiters for one rate-limit scope."""
+
+    def __init__(self) -> None:
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.blocked_until = 0.0
+        self.waiters: List[Tuple[int, int]] = []
+        self.wakeups: Dict[Tuple[int, int], Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self.granted = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+        self.throttled_responses = 0
+
+
+class RateLimitScheduler:
+    """Priority token-bucket scheduler shared by the OpenAI call sites of a worker."""
+
+    def __init__(self) -> None:
+        self._scopes: Dict[str, _Scope] = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    async def acquire(self, scope: str, tokens: int, priority: int = PRIORITY_ANALYSIS) -> None:
+        """
+        Wait until ``scope`` has budget for one request costing ``tokens``.
+
+        Raises:
+            RateLimitedError: If the budget does not free up within
+                              RATE_LIMIT_MAX_WAIT_SECONDS
+        """
+        if not env_bool("RATE_LIMIT_ENABLED", True):
+            return
+
+        loop = asyncio.get_running_loop()
+        key = (priority, next(self._sequence))
+        started = time.monotonic()
+        deadline = started + env_float("RATE_LIMIT_MAX_WAIT_SECONDS", 20.0)
+        state = self._scope(scope)
+        with self._lock:
+            heapq.heappush(state.waiters, key)
+
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    delay = self._try_grant(state, key, tokens, now)
+                    if delay is None:
+                        state.granted += 1
+                        if queued:
+                            state.wait_seconds += now - started
+                        self._wake_head(state)
+                        return
+                    # The head knows its wait; others give up only once the deadline has passed
+                    at_head = state.waiters[0] == key
+                    if now >= deadline or (at_head and now + delay > deadline):
+                        state.rejected += 1
+                        raise RateLimitedError(
+                            f"openai.{scope}", f"OpenAI {scope} rate limit budget not available in time"
+                        )
+                    wakeup = loop.create_future()
+                    state.wakeups[key] = (loop, wakeup)
+                    if not queued:
+                        queued = True
+                        state.queued += 1
+                try:
+                    await asyncio.wait_for(wakeup, min(delay, _MAX_IDLE_WAIT, max(0.0, deadline - now)))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                state.wakeups.pop(key, None)
+                if key in state.waiters:
+                    state.waiters.remove(key)
+                    heapq.heapify(state.waiters)
+                    self._wake_head(state)
+
+    def update(self, scope: str, headers: Mapping[str, str], status_code: int = 200) -> None:
+        """Feed the rate-limit headers of an OpenAI response into the scope's buckets."""
+        state = self._scope(scope)
+        with self._lock:
+            now = time.monotonic()
+            state.requests.observe(
+                _number(headers.get("x-ratelimit-limit-requests")),
+                _number(headers.get("x-ratelimit-remaining-requests")),
+                now,
+            )
+            state.tokens.observe(
+                _number(headers.get("x-ratelimit-limit-tokens")),
+                _number(headers.get("x-ratelimit-remaining-tokens")),
+                now,
+            )
+            if status_code == 429:
+                state.throttled_responses += 1
+                retry_after = parse_reset(headers.get("retry-after")) or parse_reset(
+                    headers.get("x-ratelimit-reset-requests")
+                ) or 1.0
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+            self._wake_head(state)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Bucket levels, queue depth and wait counters per scope."""
+        result = {}
+        with self._lock:
+            now = time.monotonic()
+            for name, state in self._scopes.items():
+                state.requests.refill(now)
+                state.tokens.refill(now)
+                result[name] = {
+                    "requests_limit": state.requests.capacity,
+                    "requests_available": round(state.requests.level, 1),
+                    "tokens_limit": state.tokens.capacity,
+                    "tokens_available": round(state.tokens.level, 1),
+                    "queue_depth": len(state.waiters),
+                    "granted": state.granted,
+                    "queued": state.queued,
+                    "rejected": state.rejected,
+                    "mean_wait_ms": round(state.wait_seconds / state.queued * 1000, 1) if state.queued else 0.0,
+                    "throttled_responses": state.throttled_responses,
+                }
+        return result
+
+    def _scope(self, scope: str) -> _Scope:
+        with self._lock:
+            state = self._scopes.get(scope)
+            if state is None:
+                state = self._scopes[scope] = _Scope()
+            return state
+
+    def _try_grant(self, state: _Scope, key: Tuple[int, int], tokens: int, now: float) -> Optional[float]:
+        """Consume the budget and return None, or return the seconds to wait before retrying."""
+        if state.waiters[0] != key:
+            return _MAX_IDLE_WAIT
+        if now < state.blocked_until:
+            return state.blocked_until - now
+
+        state.requests.refill(now)
+        state.tokens.refill(now)
+        # Lower-priority calls leave a share of each bucket to risk checks
+        reserve = env_float("RATE_LIMIT_PRIORITY_RESERVE", 0.1) if key[0] > PRIORITY_RISK else 0.0
+        needed_requests = 1 + reserve * (state.requests.capacity or 0)
+        needed_tokens = min(tokens, state.tokens.capacity or tokens) + reserve * (state.tokens.capacity or 0)
+        delay = max(state.requests.seconds_until(needed_requests), state.tokens.seconds_until(needed_tokens))
+        if delay > 0:
+            return delay
+
+        if state.requests.known:
+            state.requests.level -= 1
+        if state.tokens.known:
+            state.tokens.level -= min(tokens, state.tokens.capacity)
+        heapq.heappop(state.waiters)
+        return None
+
+    @staticmethod
+    def _wake_head(state: _Scope) -> None:
+        if not state.waiters:
+            return
+        entry = state.wakeups.get(state.waiters[0])
+        if entry is None:
+            return
+        loop, future = entry
+        loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def scope_for_path(path: str) -> Optional[str]:
+    """Rate-limit scope of an OpenAI API path, e.g. "/v1/chat/completions" -> "chat"."""
+    if path.endswith("/chat/completions"):
+        return "chat"
+    if path.endswith("/moderations"):
+        return "moderations"
+    return None
+
+
+_scheduler: Optional[RateLimitScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimitScheduler:
+    """Get the worker-wide OpenAI rate-limit scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RateLimitScheduler()
+    return _scheduler
+
+
+async def record_rate_limit_headers(response: Any) -> None:
+    """httpx response hook that feeds every OpenAI response into the scheduler."""
+    scope = scope_for_path(response.request.url.path)
+    if scope is None:
+        return
+    try:
+        get_rate_limiter().update(scope, response.headers, response.status_code)
+    except Exception as e:
+        logging.debug("Could not read rate-limit headers: %s", e)
@@ -0,0 +1,299 @@
+"""
+Resilience layer for outbound calls: adaptive timeouts, hedging and circuit breaking.
+
+Every outbound endpoint (OpenAI chat, OpenAI moderations, NocoDB) keeps a rolling
+window of its recent latencies. Once enough samples exist, the timeout follows
+the observed p99 (times a multiplier, clamped per endpoint) instead of a fixed
+30 s, and an optional hedged second request is sent when the first one has not
+answered by the p95. Hedging is only enabled for idempotent endpoints.
+
+A circuit breaker per endpoint opens after consecutive failures (timeouts,
+connection errors, 5xx and 429) and fails calls fast with CircuitOpenError until
+the reset period has passed; then a single trial call is let through. Handlers
+catch ServiceUnavailableError to return a degraded response instead of piling
+requests up until the function timeout.
+
+Configuration is handled via environment variables:
+- RESILIENCE_ENABLED: Master switch (defaults to true)
+- RESILIENCE_HEDGING_ENABLED: Send hedged requests past the p95 (defaults to false)
+- RESILIENCE_TIMEOUT_MULTIPLIER: Adaptive timeout as a multiple of p99 (defaults to 2.0)
+- RESILIENCE_MIN_SAMPLES: Samples needed before timeouts adapt (defaults to 20)
+- RESILIENCE_WINDOW: Latency samples kept per endpoint (defaults to 200)
+- CIRCUIT_FAILURE_THRESHOLD: Consecutive failures that open a circuit (defaults to 5)
+- CIRCUIT_RESET_SECONDS: Seconds an open circuit fails fast before a trial (defaults to 30)
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, NamedTuple, Optional, TypeVar
+
+from shared.config import env_bool, env_float, env_int
+
+
+T = TypeVar("T")
+
+# An operation receives the timeout (seconds) to pass on to the client it calls
+Operation = Callable[[float], Awaitable[T]]
+
+
+class ServiceUnavailableError(Exception):
+    """An outbound dependency cannot answer right now; callers should degrade."""
+
+    def __init__(self, endpoint: str, message: str):
+        super().__init__(message)
+        self.endpoint = endpoint
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """The endpoint's circuit is open, so the call was not attempted."""
+
+
+class OutboundTimeoutError(ServiceUnavailableError):
+    """The endpoint did not answer within its (adaptive) timeout."""
+
+
+class EndpointPolicy(NamedTuple):
+    default_timeout: float
+    min_timeout: float
+    max_timeout: float
+    hedge: bool
+
+
+# Hedging duplicates the request, so it is only allowed for calls without side effects
+ENDPOINT_POLICIES = {
+    "openai.chat": EndpointPolicy(default_timeout=10.0, min_timeout=2.0, max_timeout=30.0, hedge=True),
+    "openai.moderations": EndpointPolicy(default_timeout=5.0, min_timeout=1.0, max_timeout=15.0, hedge=True),
+    "nocodb": EndpointPolicy(default_timeout=10.0, min_timeout=2.0, max_timeout=30.0, hedge=False),
+}
+DEFAULT_POLICY = EndpointPolicy(default_timeout=10.0, min_timeout=1.0, max_timeout=30.0, hedge=False)
+
+
+class LatencyHistogram:
+    """Rolling window of the most recent latencies (seconds) with nearest-rank percentiles."""
+
+    def __init__(self, max_samples: int = 200):
+        self._samples: Deque[float] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+        return ordered[rank]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls pass. open: calls fail fast for reset_seconds. After that the
+    breaker is half-open and lets one trial call through per reset period; a
+    success closes it, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_seconds:
+                # One trial per reset period; a cancelled trial simply waits for the next one
+                self.state = "half_open"
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class ResilientEndpoint:
+    """Adaptive timeout, optional hedging and a circuit breaker around one outbound endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        policy: EndpointPolicy = DEFAULT_POLICY,
+        breaker: Optional[CircuitBreaker] = None,
+        histogram: Optional[LatencyHistogram] = None
+    ):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker or CircuitBreaker(
+            env_int("CIRCUIT_FAILURE_THRESHOLD", 5), env_float("CIRCUIT_RESET_SECONDS", 30.0)
+        )
+        self.histogram = histogram or LatencyHistogram(env_int("RESILIENCE_WINDOW", 200))
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.short_circuits = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def current_timeout(self) -> float:
+        """p99 times the multiplier, clamped to the policy; the default until enough samples exist."""
+        if len(self.histogram) < env_int("RESILIENCE_MIN_SAMPLES", 20):
+            return self.policy.default_timeout
+        p99 = self.histogram.percentile(0.99)
+        timeout = p99 * env_float("RESILIENCE_TIMEOUT_MULTIPLIER", 2.0)
+        return min(self.policy.max_timeout, max(self.policy.min_timeout, timeout))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a hedged request is sent, or None when hedging does not apply."""
+        if not self.policy.hedge or not env_bool("RESILIENCE_HEDGING_ENABLED", False):
+            return None
+        if len(self.histogram) < env_int("RESILIENCE_MIN_SAMPLES", 20):
+            return None
+        return self.histogram.percentile(0.95)
+
+    async def call(self, operation: Operation) -> T:
+        """
+        Run an outbound operation under this endpoint's policy.
+
+        Args:
+            operation: Called with the timeout (seconds) to hand to the client;
+                       may be called twice when the request is hedged
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            OutboundTimeoutError: If no attempt answered within the timeout
+        """
+        if not env_bool("RESILIENCE_ENABLED", True):
+            return await operation(self.policy.default_timeout)
+
+        if not self.breaker.allow():
+            self.short_circuits += 1
+            raise CircuitOpenError(self.name, f"{self.name} circuit is open; failing fast")
+
+        self.calls += 1
+        timeout = self.current_timeout()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._attempt(operation, timeout), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            logging.warning("[resilience] %s timed out after %.2fs", self.name, timeout)
+            raise OutboundTimeoutError(self.name, f"{self.name} did not answer within {timeout:.2f}s") from None
+        except Exception as e:
+            if counts_as_failure(e):
+                self.failures += 1
+                self.breaker.record_failure()
+            else:
+                # The service answered (e.g. a 400), so it is up
+                self.breaker.record_success()
+            raise
+
+        self.histogram.add(time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    async def _attempt(self, operation: Operation, timeout: float) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await operation(timeout)
+
+        tasks = [asyncio.ensure_future(operation(timeout))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.append(asyncio.ensure_future(operation(timeout)))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.histogram.percentile(q) for q in (0.50, 0.95, 0.99))
+        return {
+            "state": self.breaker.state,
+            "timeout_s": round(self.current_timeout(), 3),
+            "samples": len(self.histogram),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "short_circuits": self.short_circuits,
+            "circuit_opened": self.breaker.opened,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+def counts_as_failure(error: BaseException) -> bool:
+    """Whether an error says the service is unhealthy; client errors (4xx except 429) do not."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+_endpoints: Dict[str, ResilientEndpoint] = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name: str) -> ResilientEndpoint:
+    """Get the worker-wide resilience state of an outbound endpoint."""
+    endpoint = _endpoints.get(name)
+    if endpoint is None:
+        with _endpoints_lock:
+            endpoint = _endpoints.get(name)
+            if endpoint is None:
+                endpoint = ResilientEndpoint(name, ENDPOINT_POLICIES.get(name, DEFAULT_POLICY))
+                _endpoints[name] = endpoint
+    return endpoint
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency percentiles, timeouts, breaker state and hedging counts per endpoint."""
+    return {name: endpoint.stats() for name, endpoint in list(_endpoints.items())}
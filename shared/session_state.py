@@ -0,0 +1,322 @@
+"""
+Server-side intake state per chat session.
+
+Fields extracted on each turn are merged into the session's accumulated state, so
+clients only need to send the session_id. A null or blank value never overwrites
+an earlier answer, and the weighted intake score is updated incrementally as each
+field is filled, so per-turn work does not grow with the conversation.
+
+Each state records the version of the scoring configuration (weights and
+threshold) its score was computed under. When INTAKE_FIELD_WEIGHTS or
+INTAKE_SCORE_THRESHOLD change, the score of a state is recomputed from its
+fields the next time it is read or merged.
+
+State is per worker (and per instance), unless SESSION_STATE_BACKEND=sqlite
+points every worker at one file. Each merge into the sqlite tier then reads,
+merges and writes the state in one write transaction, so workers merging into
+the same session do not overwrite each other's fields; the in-memory LRU only
+stands in when the file cannot be read or written.
+
+Merging never clears a value. Callers that need the score of exactly the fields
+they send, such as clients that resend the full object, score statelessly with
+shared.intake instead.
+
+Configuration is handled via environment variables:
+- SESSION_STATE_MAX_SESSIONS: Sessions kept in the in-memory LRU (defaults to 10000)
+- SESSION_STATE_BACKEND: "memory" (default) or "sqlite" for a persistent tier
+- SESSION_STATE_SQLITE_PATH: File used by the sqlite backend (defaults to "session_state.db")
+"""
+
+import abc
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from shared.config import env_int, env_str
+from shared.intake import (
+    IntakeConfig,
+    calculate_intake_score,
+    get_intake_config,
+    intake_config_version,
+    is_field_non_empty,
+)
+
+
+class SessionStateBackend(abc.ABC):
+    """Storage for session state dictionaries keyed by session_id."""
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The stored state, or None for an unknown session."""
+
+    @abc.abstractmethod
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Store (or replace) a session's state."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Forget a session; unknown sessions are ignored."""
+
+    def update(
+        self,
+        session_id: str,
+        apply: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Read a session's state, transform it with ``apply`` and store the result.
+
+        ``apply`` gets the stored state (None for an unknown session) and returns
+        the state to store, or None to store nothing. Backends shared between
+        processes override this to run it in one transaction; this version is
+        only atomic under the caller's lock.
+
+        Returns:
+            The state returned by ``apply``
+        """
+        state = apply(self.get(session_id))
+        if state is not None:
+            self.put(session_id, state)
+        return state
+
+
+class InMemorySessionStateBackend(SessionStateBackend):
+    """Bounded LRU of session states; the least recently used session is evicted first."""
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        state = self._states.get(session_id)
+        if state is not None:
+            self._states.move_to_end(session_id)
+        return state
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._states[session_id] = state
+        self._states.move_to_end(session_id)
+        while len(self._states) > self.max_sessions:
+            self._states.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        self._states.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SQLiteSessionStateBackend(SessionStateBackend):
+    """Persistent session states stored as JSON documents in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "session_id TEXT PRIMARY KEY, state TEXT, updated_at REAL)"
+        )
+        self._connection.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), time.time())
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    def update(
+        self,
+        session_id: str,
+        apply: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # Take the write lock before reading, so no other worker writes the
+            # session between this read and the write below
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT state FROM session_state WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                state = apply(json.loads(row[0]) if row else None)
+                if state is not None:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO session_state (session_id, state, updated_at) VALUES (?, ?, ?)",
+                        (session_id, json.dumps(state), time.time())
+                    )
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+        return state
+
+
+class SessionStateStore:
+    """
+    Accumulated intake fields and running score per session.
+
+    Without a persistent backend the in-memory LRU holds the states. With one,
+    the persistent backend is the source of truth: every read goes to it and
+    every merge is one read-merge-write update of it, so a state changed by
+    another worker is never overwritten with an older copy. The LRU then keeps
+    the last state seen per session, used only while the backend fails.
+    """
+
+    def __init__(
+        self,
+        memory: Optional[InMemorySessionStateBackend] = None,
+        persistent: Optional[SessionStateBackend] = None,
+        config: Optional[IntakeConfig] = None
+    ):
+        self.memory = memory if memory is not None else InMemorySessionStateBackend()
+        self.persistent = persistent
+        self._config = config
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> IntakeConfig:
+        return self._config or get_intake_config()
+
+    def get_state(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the session's state, or None for an unknown session."""
+        config = self.config
+
+        def rescore(stored: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if stored is None or not self._rescore_if_stale(stored, config):
+                return None
+            return stored
+
+        with self._lock:
+            state = self._read(session_id)
+            if state is None:
+                return None
+            if state.get("config_version") != intake_config_version(config):
+                state = self._update(session_id, rescore) or state
+            return _copy_state(state)
+
+    def merge_fields(self, session_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merge newly extracted fields into the session state.
+
+        Only non-empty values are applied. The score changes only when a scored
+        field goes from empty to filled, so each call costs O(len(fields)); a
+        state scored under an older configuration is rescored first.
+
+        Returns:
+            Dict[str, Any]: Copy of the updated state with "fields", "score" and
+                            "enough_data"
+        """
+        config = self.config
+
+        def merge(state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if state is None:
+                state = {"fields": {}, "score": 0, "config_version": intake_config_version(config)}
+            else:
+                self._rescore_if_stale(state, config)
+            accumulated = state["fields"]
+            for name, value in fields.items():
+                if not is_field_non_empty(value):
+                    continue
+                if not is_field_non_empty(accumulated.get(name)):
+                    state["score"] += config.weights.get(name, 0)
+                accumulated[name] = value
+            state["enough_data"] = state["score"] >= config.threshold
+            state["updated_at"] = time.time()
+            return state
+
+        with self._lock:
+            return _copy_state(self._update(session_id, merge))
+
+    def reset(self, session_id: str) -> None:
+        """Forget a session, e.g. once it has been closed and summarized."""
+        with self._lock:
+            self.memory.delete(session_id)
+            if self.persistent is not None:
+                self.persistent.delete(session_id)
+
+    @staticmethod
+    def _rescore_if_stale(state: Dict[str, Any], config: IntakeConfig) -> bool:
+        """Recompute the score if the weights or threshold changed since it was stored."""
+        version = intake_config_version(config)
+        if state.get("config_version") == version:
+            return False
+        state["score"], state["enough_data"] = calculate_intake_score(state["fields"], config)
+        state["config_version"] = version
+        return True
+
+    def _read(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if self.persistent is not None:
+            try:
+                state = self.persistent.get(session_id)
+            except Exception as e:
+                logging.warning("Session state read failed for session %s: %s", session_id, e)
+            else:
+                if state is None:
+                    self.memory.delete(session_id)
+                else:
+                    self.memory.put(session_id, state)
+                return state
+        return self.memory.get(session_id)
+
+    def _update(
+        self,
+        session_id: str,
+        apply: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        if self.persistent is not None:
+            try:
+                state = self.persistent.update(session_id, apply)
+            except Exception as e:
+                logging.warning("Session state write failed for session %s: %s", session_id, e)
+            else:
+                if state is not None:
+                    self.memory.put(session_id, state)
+                return state
+        return self.memory.update(session_id, apply)
+
+
+def _copy_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {**state, "fields": dict(state["fields"])}
+
+
+_store: Optional[SessionStateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_state_store() -> SessionStateStore:
+    """Get the worker-wide session state store, created from configuration on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                persistent = None
+                backend = (env_str("SESSION_STATE_BACKEND", "memory") or "memory").lower()
+                if backend == "sqlite":
+                    persistent = SQLiteSessionStateBackend(
+                        env_str("SESSION_STATE_SQLITE_PATH", "session_state.db")
+                    )
+                elif backend != "memory":
+                    logging.warning("Unknown SESSION_STATE_BACKEND %r, using memory only", backend)
+                _store = SessionStateStore(
+                    memory=InMemorySessionStateBackend(env_int("SESSION_STATE_MAX_SESSIONS", 10000)),
+                    persistent=persistent
+                )
+    return _store
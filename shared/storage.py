@@ -1,5 +1,430 @@
-import logging
+"""
+Session log persistence for the chat orchestrator.
+
+save_session_summary() never writes on the request path: records are placed in a
+bounded in-process queue and a background thread flushes them in batches, by size
+or by age, to a pluggable sink (logging, JSONL file, SQLite file or NocoDB).
+
+Configuration is handled via environment variables:
+- SESSION_LOG_SINK: "log" (default), "jsonl", "sqlite", "nocodb" or "transcript"
+  (the compressed per-session store in shared.transcripts)
+- SESSION_LOG_PATH: File used by the jsonl/sqlite sinks
+- SESSION_LOG_TABLE_NAME: NocoDB table used by the nocodb sink (defaults to "session_log")
+- SESSION_LOG_BATCH_SIZE: Records per flush (defaults to 100)
+- SESSION_LOG_FLUSH_INTERVAL: Maximum age in seconds of a buffered record (defaults to 1.0)
+- SESSION_LOG_MAX_QUEUE: Queue capacity (defaults to 10000)
+- SESSION_LOG_BACKPRESSURE: "drop_oldest" (default), "drop_newest" or "block"
+- SESSION_LOG_BLOCK_TIMEOUT: Seconds "block" waits for room before dropping (defaults to 0.05)
+
+On the async handlers, use save_session_summary_async(): under the "block"
+policy it awaits room for the record instead of stalling the event loop. The
+synchronous save_session_summary() never waits when called on a thread with a
+running event loop; there "block" behaves like "drop_newest".
+"""
+
+import abc
+import asyncio
+import atexit
 import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from shared.config import env_float, env_int, env_str
+from shared.log_pipeline import lazy_json, sensitive
+
+
+BACKPRESSURE_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class SessionLogSink(abc.ABC):
+    """Destination for flushed session log batches."""
+
+    @abc.abstractmethod
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Persist one batch; raising counts the whole batch as dropped."""
+
+    def close(self) -> None:
+        pass
+
+
+class LoggingSink(SessionLogSink):
+    """
+    Emit each record to the function log (the original stub behaviour).
+
+    The message texts are redacted by LOG_REDACTION and the record is only
+    serialized if the log line is emitted.
+    """
+
+    _SENSITIVE = ("user_message", "assistant_reply")
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        if not logging.getLogger().isEnabledFor(logging.INFO):
+            return
+        for record in records:
+            fields = {key: sensitive(value) if key in self._SENSITIVE else value for key, value in record.items()}
+            logging.info("[save_session_summary] %s", lazy_json(fields))
+
+
+class JSONLSink(SessionLogSink):
+    """Append records to a local JSON Lines file, mainly for local runs and testing."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.writelines(json.dumps(record) + "\n" for record in records)
+
+
+class SQLiteSink(SessionLogSink):
+    """Insert records into a local SQLite file, one transaction per batch."""
+
+    _COLUMNS = ("session_id", "user_message", "assistant_reply", "routing_decision", "timestamp")
+
+    def __init__(self, path: str):
+        self.path = path
+        # Only the flusher thread writes, but it is not the thread that built the sink
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS session_log ("
+            "session_id TEXT, user_message TEXT, assistant_reply TEXT, "
+            "routing_decision TEXT, timestamp TEXT)"
+        )
+        self._connection.commit()
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT INTO session_log ({', '.join(self._COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in self._COLUMNS)})",
+                [tuple(record.get(column) for column in self._COLUMNS) for record in records]
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class NocoDBSink(SessionLogSink):
+    """
+    Append records to a NocoDB table through the bulk create endpoint.
+
+    The sink owns a private event loop on the flusher thread so the pooled NocoDB
+    client for that loop is reused across batches.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        from shared.common import nocodb_bulk_insert
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(nocodb_bulk_insert(records, table_name=self.table_name))
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        from shared.common import close_nocodb_client
+
+        try:
+            self._loop.run_until_complete(close_nocodb_client())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+
+class TranscriptSink(SessionLogSink):
+    """
+    Append records to the per-session compressed transcript store.
+
+    With ``summary_every`` set, a session's rolling summary is folded once that
+    many of its turns are unsummarized, on a private event loop of the flusher
+    thread. Summary failures are logged; the turns stay stored and are folded
+    on the next attempt.
+    """
+
+    def __init__(self, store: Any, summary_every: int = 0):
+        self.store = store
+        self.summary_every = summary_every
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        by_session: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_session.setdefault(str(record.get("session_id") or ""), []).append(record)
+        for session_id, turns in by_session.items():
+            self.store.append_turns(session_id, turns)
+
+        if self.summary_every <= 0:
+            return
+        for session_id in by_session:
+            _, summarized_through, total = self.store.get_summary(session_id)
+            if session_id and total - summarized_through >= self.summary_every:
+                self._fold(session_id)
+
+    def _fold(self, session_id: str) -> None:
+        from shared.transcripts import update_rolling_summary
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(update_rolling_summary(session_id, self.store))
+        except Exception as e:
+            logging.warning("Rolling summary not updated for session %s: %s", session_id, e)
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        from shared.common import close_openai_client
+
+        try:
+            self._loop.run_until_complete(close_openai_client())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process queue flushed to a sink by a background thread.
+
+    A batch is written when ``batch_size`` records are waiting, when the oldest
+    record is ``flush_interval`` seconds old, or when flush() / close() is called.
+    When the queue is full the backpressure policy decides what happens:
+
+    - "drop_oldest": evict the oldest queued record to make room
+    - "drop_newest": reject the incoming record
+    - "block": wait up to ``block_timeout`` seconds for room, then reject.
+      put_async() awaits the room; put() waits only off the event loop
+
+    Sink failures are logged and the failed batch is counted as dropped; they never
+    propagate to the caller of put().
+    """
+
+    def __init__(
+        self,
+        sink: SessionLogSink,
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        backpressure: str = "drop_oldest",
+        block_timeout: float = 0.05
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {backpressure!r}")
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = backpressure
+        self.block_timeout = block_timeout
+
+        self._queue: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._condition = threading.Condition()
+        self._flush_requested = 0
+        self._flush_completed = 0
+        self._closed = False
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed_batches": 0}
+
+        self._thread = threading.Thread(target=self._run, name="session-log-flusher", daemon=True)
+        self._thread.start()
+
+    def put(self, record: Dict[str, Any]) -> bool:
+        """Queue a record without waiting on the sink. Returns False if it was dropped."""
+        accepted = self._put(record, wait=False)
+        if accepted is not None:
+            return accepted
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return bool(self._put(record, wait=True))
+        # Waiting here would stall every request on the event loop
+        with self._condition:
+            self._stats["dropped"] += 1
+        return False
+
+    async def put_async(self, record: Dict[str, Any]) -> bool:
+        """put() for coroutines: under the "block" policy the wait for room is awaited."""
+        accepted = self._put(record, wait=False)
+        if accepted is not None:
+            return accepted
+        return bool(await asyncio.get_running_loop().run_in_executor(None, self._put, record, True))
+
+    def _put(self, record: Dict[str, Any], wait: bool) -> Optional[bool]:
+        """Queue a record; None when the "block" policy would have to wait and ``wait`` is False."""
+        with self._condition:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+            if len(self._queue) >= self.max_queue:
+                if self.backpressure == "drop_oldest":
+                    self._queue.popleft()
+                    self._stats["dropped"] += 1
+                elif self.backpressure == "drop_newest":
+                    self._stats["dropped"] += 1
+                    return False
+                elif not wait:
+                    return None
+                else:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._queue) >= self.max_queue and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    if len(self._queue) >= self.max_queue or self._closed:
+                        self._stats["dropped"] += 1
+                        return False
+            self._queue.append((time.monotonic(), record))
+            self._stats["enqueued"] += 1
+            # Wake the flusher to start the age timer or to write a full batch
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+            return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued so far. Returns False if the timeout expired first."""
+        with self._condition:
+            self._flush_requested += 1
+            ticket = self._flush_requested
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._flush_completed >= ticket, timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Flush remaining records, stop the flusher thread and close the sink."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning("Session log flusher did not stop; %s records lost", len(self._queue))
+            return
+        self.sink.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for enqueued, written and dropped records plus current queue depth."""
+        with self._condition:
+            return {**self._stats, "queued": len(self._queue)}
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed or self._flush_requested > self._flush_completed:
+                        break
+                    if len(self._queue) >= self.batch_size:
+                        break
+                    if self._queue:
+                        age = time.monotonic() - self._queue[0][0]
+                        if age >= self.flush_interval:
+                            break
+                        self._condition.wait(self.flush_interval - age)
+                    else:
+                        self._condition.wait()
+                flush_ticket = self._flush_requested
+                drain = self._closed or flush_ticket > self._flush_completed
+                closing = self._closed
+
+            self._write_available(drain)
+
+            with self._condition:
+                if drain:
+                    self._flush_completed = max(self._flush_completed, flush_ticket)
+                    self._condition.notify_all()
+                if closing and not self._queue:
+                    return
+
+    def _write_available(self, drain: bool) -> None:
+        while True:
+            with self._condition:
+                if not self._queue:
+                    return
+                if not drain and len(self._queue) < self.batch_size:
+                    age = time.monotonic() - self._queue[0][0]
+                    if age < self.flush_interval:
+                        return
+                count = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft()[1] for _ in range(count)]
+                # Room was freed for producers waiting under the "block" policy
+                self._condition.notify_all()
+            try:
+                self.sink.write_batch(batch)
+                with self._condition:
+                    self._stats["written"] += len(batch)
+            except Exception as e:
+                logging.error("Session log sink failed, dropping %s records: %s", len(batch), e)
+                with self._condition:
+                    self._stats["dropped"] += len(batch)
+                    self._stats["failed_batches"] += 1
+
+
+def create_sink_from_env() -> SessionLogSink:
+    """Build the session log sink selected by SESSION_LOG_SINK."""
+    kind = (env_str("SESSION_LOG_SINK", "log") or "log").lower()
+    if kind == "jsonl":
+        return JSONLSink(env_str("SESSION_LOG_PATH", "session_log.jsonl"))
+    if kind == "sqlite":
+        return SQLiteSink(env_str("SESSION_LOG_PATH", "session_log.db"))
+    if kind == "nocodb":
+        return NocoDBSink(env_str("SESSION_LOG_TABLE_NAME", "session_log"))
+    if kind == "transcript":
+        from shared.transcripts import get_transcript_store
+
+        return TranscriptSink(get_transcript_store(), env_int("TRANSCRIPT_SUMMARY_EVERY_TURNS", 20))
+    if kind != "log":
+        logging.warning("Unknown SESSION_LOG_SINK %r, falling back to logging sink", kind)
+    return LoggingSink()
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_session_log_buffer() -> WriteBehindBuffer:
+    """Get the worker's write-behind buffer, creating it from configuration on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backpressure = env_str("SESSION_LOG_BACKPRESSURE", "drop_oldest")
+                if backpressure not in BACKPRESSURE_POLICIES:
+                    logging.warning("Unknown SESSION_LOG_BACKPRESSURE %r, using drop_oldest", backpressure)
+                    backpressure = "drop_oldest"
+                _buffer = WriteBehindBuffer(
+                    create_sink_from_env(),
+                    max_queue=env_int("SESSION_LOG_MAX_QUEUE", 10000),
+                    batch_size=env_int("SESSION_LOG_BATCH_SIZE", 100),
+                    flush_interval=env_float("SESSION_LOG_FLUSH_INTERVAL", 1.0),
+                    backpressure=backpressure,
+                    block_timeout=env_float("SESSION_LOG_BLOCK_TIMEOUT", 0.05)
+                )
+    return _buffer
+
+
+def flush_session_log(timeout: Optional[float] = 5.0) -> bool:
+    """Flush buffered session log records, if the buffer has been created."""
+    if _buffer is None:
+        return True
+    return _buffer.flush(timeout)
+
+
+@atexit.register
+def shutdown_session_log(timeout: Optional[float] = 5.0) -> None:
+    """Flush and close the buffer; registered to run when the worker shuts down."""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close(timeout)
+
 
 def save_session_summary(
     session_id: str,
@@ -9,15 +434,40 @@ def save_session_summary(
     timestamp: str
 ) -> None:
     """
-    Placeholder stub for saving a chat session summary.
-    Currently only logs the input parameters for debugging.
+    Queue a chat turn for persistence without blocking the caller.
+
+    The record is written later by the write-behind buffer; a full queue is handled
+    by the configured backpressure policy rather than by raising.
     """
-    record = {
+    record = _session_record(session_id, user_message, assistant_reply, routing_decision, timestamp)
+    if not get_session_log_buffer().put(record):
+        logging.warning("[save_session_summary] session log full, dropped record for session %s", session_id)
+
+
+async def save_session_summary_async(
+    session_id: str,
+    user_message: str,
+    assistant_reply: str,
+    routing_decision: str,
+    timestamp: str
+) -> None:
+    """save_session_summary() for coroutines; a "block" wait for room does not hold the event loop."""
+    record = _session_record(session_id, user_message, assistant_reply, routing_decision, timestamp)
+    if not await get_session_log_buffer().put_async(record):
+        logging.warning("[save_session_summary] session log full, dropped record for session %s", session_id)
+
+
+def _session_record(
+    session_id: str,
+    user_message: str,
+    assistant_reply: str,
+    routing_decision: str,
+    timestamp: str
+) -> Dict[str, Any]:
+    return {
         "session_id": session_id,
         "user_message": user_message,
         "assistant_reply": assistant_reply,
         "routing_decision": routing_decision,
         "timestamp": timestamp
     }
-    logging.info(f"[save_session_summary] {json.dumps(record)}")
-
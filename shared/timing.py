@@ -0,0 +1,203 @@
+"""
+Per-stage request timing for the function handlers.
+
+timed_handler() wraps a handler with a RequestTimer held in a context variable.
+Code anywhere below it records stages with ``with stage("openai"):`` or
+``mark("validate")`` (time since the previous stage ended) without passing the
+timer around; outside a timed request both are no-ops.
+
+When the handler returns, the stages are attached as a ``Server-Timing`` header,
+emitted as one structured log record, and, for sampled slow requests, a cProfile
+report is logged.
+
+Configuration is handled via environment variables:
+- TIMING_ENABLED: Master switch (defaults to true)
+- TIMING_PROFILE_SAMPLE_RATE: Fraction of requests run under cProfile (defaults to 0)
+- TIMING_SLOW_REQUEST_MS: Profiled requests at least this slow are reported (defaults to 1000)
+"""
+
+import functools
+import io
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from shared.config import env_bool, env_float
+from shared.log_pipeline import configure_logging, lazy_json
+
+if TYPE_CHECKING:
+    import cProfile
+
+
+class RequestTimer:
+    """Collects named stage durations for one request."""
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.started = time.perf_counter()
+        self._last_boundary = self.started
+        self._stages: Dict[str, float] = {}
+        self._order: List[str] = []
+
+    def record(self, name: str, duration_ms: float) -> None:
+        """Add a duration to a stage; repeated stages accumulate."""
+        if name not in self._stages:
+            self._order.append(name)
+            self._stages[name] = 0.0
+        self._stages[name] += duration_ms
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            self.record(name, (finished - started) * 1000)
+            self._last_boundary = finished
+
+    def mark(self, name: str) -> None:
+        """Record the time since the previous stage ended (or the request started)."""
+        now = time.perf_counter()
+        self.record(name, (now - self._last_boundary) * 1000)
+        self._last_boundary = now
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def stages(self) -> List[Tuple[str, float]]:
+        return [(name, self._stages[name]) for name in self._order]
+
+    def server_timing(self, total_ms: float) -> str:
+        entries = [f"{name};dur={duration:.2f}" for name, duration in self.stages()]
+        entries.append(f"total;dur={total_ms:.2f}")
+        return ", ".join(entries)
+
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+# cProfile cannot profile overlapping requests on one thread, so one at a time
+_profiling = threading.Lock()
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """The timer of the request being handled, if any."""
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a stage of the current request (no-op outside one)."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def mark(name: str) -> None:
+    """Record the time since the previous stage as ``name`` (no-op outside a request)."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.mark(name)
+
+
+def record(name: str, duration_ms: float) -> None:
+    """Record an externally measured duration for the current request."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, duration_ms)
+
+
+def timed_handler(function_name: str) -> Callable:
+    """
+    Decorate an async HTTP handler with per-stage timing.
+
+    Args:
+        function_name: Name used in metrics and logs
+    """
+    # Every handler module passes through here at import, after the host has set up logging
+    configure_logging()
+
+    def decorator(handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(handler)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not env_bool("TIMING_ENABLED", True):
+                return await handler(*args, **kwargs)
+
+            timer = RequestTimer(function_name)
+            token = _current_timer.set(timer)
+            profiler = _maybe_start_profiler()
+            try:
+                response = await handler(*args, **kwargs)
+            finally:
+                _current_timer.reset(token)
+                if profiler is not None:
+                    profiler.disable()
+                    _profiling.release()
+
+            total_ms = timer.total_ms
+            _attach_header(response, timer, total_ms)
+            _emit_metrics(timer, total_ms, getattr(response, "status_code", None))
+            if profiler is not None and total_ms >= env_float("TIMING_SLOW_REQUEST_MS", 1000.0):
+                _log_profile(function_name, total_ms, profiler)
+            return response
+        return wrapper
+    return decorator
+
+
+def _maybe_start_profiler() -> Optional["cProfile.Profile"]:
+    rate = env_float("TIMING_PROFILE_SAMPLE_RATE", 0.0)
+    if rate <= 0 or random.random() >= rate:
+        return None
+    if not _profiling.acquire(blocking=False):
+        return None
+    import cProfile
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this interpreter
+        _profiling.release()
+        return None
+    return profiler
+
+
+def _attach_header(response: Any, timer: RequestTimer, total_ms: float) -> None:
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return
+    try:
+        headers["Server-Timing"] = timer.server_timing(total_ms)
+    except Exception as e:
+        logging.debug("Could not attach Server-Timing header: %s", e)
+
+
+def _emit_metrics(timer: RequestTimer, total_ms: float, status_code: Optional[int]) -> None:
+    metrics = {
+        "function": timer.function_name,
+        "status_code": status_code,
+        "total_ms": round(total_ms, 2),
+        **{f"{name}_ms": round(duration, 2) for name, duration in timer.stages()},
+    }
+    # custom_dimensions is picked up as structured properties by Application Insights
+    logging.info("[timing] %s", lazy_json(metrics), extra={"custom_dimensions": metrics})
+
+
+def _log_profile(function_name: str, total_ms: float, profiler: "cProfile.Profile") -> None:
+    import pstats
+    
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(25)
+    logging.warning(
+        "[timing] slow %s request (%.0f ms) profile; "
+        "concurrent requests on the same loop are included:\n%s",
+        function_name, total_ms, output.getvalue()
+    )
@@ -0,0 +1,335 @@
+"""
+Compressed, append-only chat transcripts with an incrementally folded summary.
+
+Each session's turns are stored in zlib-compressed frames of up to
+TRANSCRIPT_FRAME_TURNS turns. Appending only rewrites the session's open tail
+frame, and reading a range of turns only decompresses the frames that overlap
+it, so neither depends on how long the session is.
+
+The rolling summary records how many turns it covers. update_rolling_summary()
+folds just the turns after that point into it (in chunks of at most
+TRANSCRIPT_SUMMARY_CHUNK_TURNS per OpenAI call), so the full history is never
+re-summarized.
+
+Configuration is handled via environment variables:
+- TRANSCRIPT_STORE_PATH: SQLite file of the store (defaults to "transcripts.db")
+- TRANSCRIPT_FRAME_TURNS: Turns per compressed frame (defaults to 16)
+- TRANSCRIPT_COMPRESSION_LEVEL: zlib level 1-9 (defaults to 6)
+- TRANSCRIPT_SUMMARY_CHUNK_TURNS: Turns folded into the summary per call (defaults to 40)
+- TRANSCRIPT_SUMMARY_EVERY_TURNS: The transcript session log sink folds a session's
+  summary once this many turns are unsummarized (defaults to 20, 0 disables)
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.config import env_int, env_str
+
+
+CODEC_ZLIB = "zlib"
+
+SUMMARY_MODEL = "gpt-4o-mini"
+# Matches the summary column written by save_session_summary / nocodb_upsert
+SUMMARY_MAX_CHARS = 2000
+SUMMARY_MAX_OUTPUT_TOKENS = 700
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the running summary of a mental health support conversation. "
+    "You receive the current summary (possibly empty) and the newest turns. "
+    "Return the updated summary as plain text: keep earlier facts unless the new "
+    "turns correct them, add what the new turns reveal about the user's symptoms, "
+    "their duration, triggers, intensity, frequency, impact on daily life and coping "
+    f"mechanisms, and any risk signals. Stay under {SUMMARY_MAX_CHARS} characters."
+)
+
+
+class TranscriptStore:
+    """
+    Per-session transcripts in a local SQLite file.
+
+    Turns are the session log records (user_message, assistant_reply,
+    routing_decision, timestamp) numbered from 0 in append order.
+    """
+
+    def __init__(self, path: str, frame_turns: int = 16, compression_level: int = 6):
+        self.path = path
+        self.frame_turns = max(1, frame_turns)
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcript_sessions ("
+            "session_id TEXT PRIMARY KEY, turn_count INTEGER NOT NULL, "
+            "raw_bytes INTEGER NOT NULL, stored_bytes INTEGER NOT NULL, "
+            "summary TEXT, summarized_through INTEGER NOT NULL DEFAULT 0, updated_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcript_frames ("
+            "session_id TEXT NOT NULL, first_turn INTEGER NOT NULL, turn_count INTEGER NOT NULL, "
+            "codec TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (session_id, first_turn)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def append_turns(self, session_id: str, turns: List[Dict[str, Any]]) -> int:
+        """
+        Append turns to a session's transcript.
+
+        Only the open tail frame is decompressed and rewritten; full frames are
+        never touched again.
+
+        Returns:
+            int: The session's turn count after the append
+        """
+        if not turns:
+            return self.turn_count(session_id)
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT turn_count, raw_bytes, stored_bytes FROM transcript_sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            turn_count, raw_bytes, stored_bytes = row if row else (0, 0, 0)
+
+            pending = list(turns)
+            tail = self._connection.execute(
+                "SELECT first_turn, turn_count, codec, data FROM transcript_frames "
+                "WHERE session_id = ? ORDER BY first_turn DESC LIMIT 1",
+                (session_id,)
+            ).fetchone()
+            if tail is not None and tail[1] < self.frame_turns:
+                first_turn, _, codec, data = tail
+                frame = _decode(codec, data)
+                room = self.frame_turns - len(frame)
+                frame.extend(pending[:room])
+                pending = pending[room:]
+                encoded = self._encode(frame)
+                stored_bytes += len(encoded) - len(data)
+                self._connection.execute(
+                    "UPDATE transcript_frames SET turn_count = ?, codec = ?, data = ? "
+                    "WHERE session_id = ? AND first_turn = ?",
+                    (len(frame), CODEC_ZLIB, encoded, session_id, first_turn)
+                )
+
+            next_turn = turn_count + len(turns) - len(pending)
+            for start in range(0, len(pending), self.frame_turns):
+                frame = pending[start:start + self.frame_turns]
+                encoded = self._encode(frame)
+                stored_bytes += len(encoded)
+                self._connection.execute(
+                    "INSERT INTO transcript_frames (session_id, first_turn, turn_count, codec, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, next_turn, len(frame), CODEC_ZLIB, encoded)
+                )
+                next_turn += len(frame)
+
+            turn_count += len(turns)
+            raw_bytes += sum(len(json.dumps(turn, separators=(",", ":")).encode("utf-8")) for turn in turns)
+            self._connection.execute(
+                "INSERT INTO transcript_sessions "
+                "(session_id, turn_count, raw_bytes, stored_bytes, summarized_through, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET turn_count = excluded.turn_count, "
+                "raw_bytes = excluded.raw_bytes, stored_bytes = excluded.stored_bytes, "
+                "updated_at = excluded.updated_at",
+                (session_id, turn_count, raw_bytes, stored_bytes, time.time())
+            )
+        return turn_count
+
+    def read_turns(self, session_id: str, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Turns ``start`` (inclusive) to ``stop`` (exclusive), decompressing only the overlapping frames."""
+        start = max(0, start)
+        if stop is not None and stop <= start:
+            return []
+        with self._lock:
+            # Seek to the frame holding ``start`` on the primary key instead of scanning the session
+            first = self._connection.execute(
+                "SELECT MAX(first_turn) FROM transcript_frames WHERE session_id = ? AND first_turn <= ?",
+                (session_id, start)
+            ).fetchone()[0]
+            query = "SELECT first_turn, codec, data FROM transcript_frames WHERE session_id = ? AND first_turn >= ?"
+            parameters: Tuple[Any, ...] = (session_id, first or 0)
+            if stop is not None:
+                query += " AND first_turn < ?"
+                parameters += (stop,)
+            frames = self._connection.execute(query + " ORDER BY first_turn", parameters).fetchall()
+
+        turns: List[Dict[str, Any]] = []
+        for first_turn, codec, data in frames:
+            frame = _decode(codec, data)
+            low = max(0, start - first_turn)
+            high = len(frame) if stop is None else min(len(frame), stop - first_turn)
+            turns.extend(frame[low:high])
+        return turns
+
+    def recent_turns(self, session_id: str, count: int) -> List[Dict[str, Any]]:
+        """The last ``count`` turns of a session, oldest first."""
+        total = self.turn_count(session_id)
+        return self.read_turns(session_id, max(0, total - count), total)
+
+    def turn_count(self, session_id: str) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT turn_count FROM transcript_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_summary(self, session_id: str) -> Tuple[Optional[str], int, int]:
+        """
+        The rolling summary of a session.
+
+        Returns:
+            Tuple[Optional[str], int, int]: (summary, turns it covers, total turns)
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary, summarized_through, turn_count FROM transcript_sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        return (row[0], row[1], row[2]) if row else (None, 0, 0)
+
+    def set_summary(self, session_id: str, summary: str, summarized_through: int, expected_through: int) -> bool:
+        """
+        Store a summary covering turns up to ``summarized_through``.
+
+        The update only applies if the stored summary still covers
+        ``expected_through`` turns, so two concurrent folds cannot overwrite each
+        other. Returns False when another fold won.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE transcript_sessions SET summary = ?, summarized_through = ?, updated_at = ? "
+                "WHERE session_id = ? AND summarized_through = ?",
+                (summary, summarized_through, time.time(), session_id, expected_through)
+            )
+        return cursor.rowcount == 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Session and turn counts plus raw versus stored (compressed) bytes."""
+        with self._lock:
+            sessions, turns, raw_bytes, stored_bytes = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(turn_count), 0), COALESCE(SUM(raw_bytes), 0), "
+                "COALESCE(SUM(stored_bytes), 0) FROM transcript_sessions"
+            ).fetchone()
+        return {
+            "sessions": sessions,
+            "turns": turns,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _encode(self, turns: List[Dict[str, Any]]) -> bytes:
+        return zlib.compress(json.dumps(turns, separators=(",", ":")).encode("utf-8"), self.compression_level)
+
+
+def _decode(codec: str, data: bytes) -> List[Dict[str, Any]]:
+    if codec != CODEC_ZLIB:
+        raise ValueError(f"Unknown transcript frame codec: {codec!r}")
+    return json.loads(zlib.decompress(data))
+
+
+def render_turns(turns: List[Dict[str, Any]]) -> str:
+    """Plain-text rendering of session log turns for the summarizer."""
+    lines = []
+    for turn in turns:
+        if turn.get("user_message"):
+            lines.append(f"User: {turn['user_message']}")
+        if turn.get("assistant_reply"):
+            lines.append(f"Assistant: {turn['assistant_reply']}")
+    return "\n".join(lines)
+
+
+async def fold_summary(previous_summary: Optional[str], turns: List[Dict[str, Any]]) -> str:
+    """
+    Fold new turns into a summary with one OpenAI call.
+
+    Raises:
+        ServiceUnavailableError: If OpenAI is unavailable or rate limited
+    """
+    from shared.common import get_openai_client
+    from shared.rate_limit import PRIORITY_BACKGROUND, estimate_tokens, get_rate_limiter
+    from shared.resilience import get_endpoint
+
+    content = f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew turns:\n{render_turns(turns)}"
+    client = get_openai_client()
+    await get_rate_limiter().acquire(
+        "chat", estimate_tokens((SUMMARY_SYSTEM_PROMPT, content), SUMMARY_MAX_OUTPUT_TOKENS), PRIORITY_BACKGROUND
+    )
+    response = await get_endpoint("openai.chat").call(
+        lambda timeout: client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": content}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_OUTPUT_TOKENS,
+            timeout=timeout
+        )
+    )
+    summary = (response.choices[0].message.content or "").strip()
+    return summary[:SUMMARY_MAX_CHARS]
+
+
+async def update_rolling_summary(session_id: str, store: Optional[TranscriptStore] = None) -> Optional[str]:
+    """
+    Bring a session's rolling summary up to date and return it.
+
+    Only turns after the ones the summary already covers are read and sent, at
+    most TRANSCRIPT_SUMMARY_CHUNK_TURNS per call. Returns None for a session
+    without turns. When the turns after the summary cannot be read (a missing
+    or truncated frame), the summary is returned as far as it goes.
+
+    Raises:
+        ServiceUnavailableError: If OpenAI is unavailable; the turns folded so
+                                 far are kept
+    """
+    store = store or get_transcript_store()
+    chunk = max(1, env_int("TRANSCRIPT_SUMMARY_CHUNK_TURNS", 40))
+    while True:
+        summary, through, total = store.get_summary(session_id)
+        if through >= total:
+            return summary
+        turns = store.read_turns(session_id, through, min(total, through + chunk))
+        if not turns:
+            # A missing or truncated frame; the summary cannot advance past it
+            logging.warning(
+                "Transcript of session %s has no turns at %s of %s; rolling summary left behind",
+                session_id, through, total
+            )
+            return summary
+        folded = await fold_summary(summary, turns)
+        # Losing the race means another worker folded these turns; re-read and continue
+        store.set_summary(session_id, folded, through + len(turns), through)
+
+
+_store: Optional[TranscriptStore] = None
+_store_lock = threading.Lock()
+
+
+def get_transcript_store() -> TranscriptStore:
+    """Get the worker's transcript store, opening it from configuration on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TranscriptStore(
+                    env_str("TRANSCRIPT_STORE_PATH", "transcripts.db"),
+                    frame_turns=env_int("TRANSCRIPT_FRAME_TURNS", 16),
+                    compression_level=env_int("TRANSCRIPT_COMPRESSION_LEVEL", 6),
+                )
+    return _store
+
+
+def is_transcript_store_enabled() -> bool:
+    """Whether chat turns are recorded in the transcript store (SESSION_LOG_SINK=transcript)."""
+    return (env_str("SESSION_LOG_SINK", "log") or "log").lower() == "transcript"
@@ -0,0 +1,332 @@
+"""
+Combined per-turn analysis: intake field extraction and chat mode in one LLM call.
+
+A single structured-output (JSON schema) request returns the seven intake fields
+and the next chat mode, instead of one request for extraction and another for the
+mode decision. The system prompt and schema are static and come first, and only
+the user turn varies, so the shared prefix is eligible for provider-side prompt
+caching.
+
+extract_fields_from_input is a thin wrapper over analyze_turn(), and the
+orchestrator and the analyze_turn function call it directly, so they share cached
+analyses of the same message. When the deterministic pre-pass
+(shared.pre_extract) has already read some fields off the message,
+extract_fields() asks for the remaining ones only.
+
+switch_chat_mode does not need the fields: decide_mode() asks for the mode alone
+and caps generation at a single token, over the windowed conversation context.
+
+Callers pass their own function name: it decides whether the response cache is
+used (LLM_CACHE_DISABLED_FUNCTIONS) and which namespace its hits and misses are
+counted under. The cache key does not include it, so callers still share cached
+answers.
+"""
+
+import functools
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from shared.cache import get_response_cache, is_cache_enabled, make_cache_key
+from shared.common import get_openai_client
+from shared.rate_limit import PRIORITY_ANALYSIS, estimate_tokens, get_rate_limiter
+from shared.resilience import get_endpoint
+from shared.timing import stage
+
+
+FUNCTION_NAME = "analyze_turn"
+TURN_ANALYSIS_MODEL = "gpt-4o-mini"
+# Bump whenever SYSTEM_PROMPT or RESPONSE_FORMAT changes so cached analyses are not reused
+TURN_ANALYSIS_PROMPT_VERSION = "turn-v1"
+# Same for the fields-only prompt of extract_fields()
+FIELDS_PROMPT_VERSION = "fields-v1"
+# Same for MODE_SYSTEM_PROMPT of decide_mode()
+MODE_PROMPT_VERSION = "mode-v3"
+MAX_OUTPUT_TOKENS = 500
+
+INTAKE_FIELDS = [
+    "symptoms", "duration", "triggers", "intensity",
+    "frequency", "impact_on_life", "coping_mechanisms",
+]
+VALID_MODES = ["intake", "advice", "reflection", "summary"]
+DEFAULT_MODE = "advice"
+
+# The four modes start with different letters, so the first generated token is
+# enough to identify the answer even when a mode spans several tokens. The
+# mode-only generation is therefore capped at a single token.
+MODE_BY_INITIAL = {mode[0]: mode for mode in VALID_MODES}
+
+SYSTEM_PROMPT = """You are the turn analyzer of a mental health assistant. For each user turn you do two things and answer with one JSON object.
+
+1. Extract these intake fields from the user's message, with these exact names: symptoms, duration, triggers, intensity, frequency, impact_on_life, coping_mechanisms. If a field is not clearly mentioned, return null. Do not guess, infer, or fabricate.
+
+2. Decide the next chat mode: whether the assistant should continue asking intake questions (intake), switch to advice-giving (advice), enter reflective discussion (reflection), or summarize and close (summary). Use the conversation context when it is given, otherwise the message alone.
+
+Examples:
+User: "I've been feeling overwhelmed for a few weeks. It gets worse at work."
+Output: {"fields": {"symptoms": "overwhelmed", "duration": "a few weeks", "triggers": "work", "intensity": null, "frequency": null, "impact_on_life": null, "coping_mechanisms": null}, "mode": "intake"}
+
+User: "Hello, how are you today?"
+Output: {"fields": {"symptoms": null, "duration": null, "triggers": null, "intensity": null, "frequency": null, "impact_on_life": null, "coping_mechanisms": null}, "mode": "intake"}
+
+User: "Thanks, I think that's all for now, bye."
+Output: {"fields": {"symptoms": null, "duration": null, "triggers": null, "intensity": null, "frequency": null, "impact_on_life": null, "coping_mechanisms": null}, "mode": "summary"}"""
+
+MODE_SYSTEM_PROMPT = "You are a conversation controller for a mental health assistant. Based on the conversation, and above all the user's last message, decide whether the assistant should continue asking intake questions, switch to advice-giving, enter reflective discussion, or summarize and close. Only return the most appropriate chat mode: intake, advice, reflection, or summary. Reply with the mode name only, in lowercase."
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "turn_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "fields": {
+                    "type": "object",
+                    "properties": {name: {"type": ["string", "null"]} for name in INTAKE_FIELDS},
+                    "required": INTAKE_FIELDS,
+                    "additionalProperties": False,
+                },
+                "mode": {"type": "string", "enum": VALID_MODES},
+            },
+            "required": ["fields", "mode"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def build_user_content(message: str, context: Optional[str] = None) -> str:
+    """The only per-turn part of the prompt; it goes last so the prefix stays cacheable."""
+    if not context or context == message:
+        return message
+    return f"Conversation context:\n{context}\n\nUser message:\n{message}"
+
+
+async def analyze_turn(
+    message: str,
+    context: Optional[str] = None,
+    function_name: str = FUNCTION_NAME
+) -> Dict[str, Any]:
+    """
+    Extract intake fields from a message and decide the next chat mode in one call.
+
+    Args:
+        message: The user's latest message; fields are extracted from it
+        context: Optional conversation context for the mode decision (defaults to
+                 the message)
+        function_name: Calling function, for its cache opt-out and statistics
+
+    Returns:
+        Dict[str, Any]: {"fields": {<seven intake fields, null when absent>},
+                         "mode": one of VALID_MODES}
+
+    Raises:
+        ServiceUnavailableError: If OpenAI is unavailable (circuit open, timed
+                                 out or rate limited); callers answer with
+                                 degraded_analysis()
+    """
+    content = build_user_content(message, context)
+    return await _completion(
+        function_name, TURN_ANALYSIS_PROMPT_VERSION, SYSTEM_PROMPT, content, parse_analysis,
+        response_format=RESPONSE_FORMAT
+    )
+
+
+async def decide_mode(context: str, function_name: str = FUNCTION_NAME) -> str:
+    """
+    Decide the next chat mode alone, with a single generated token.
+
+    Args:
+        context: Conversation context (e.g. the token-budgeted window)
+        function_name: Calling function, for its cache opt-out and statistics
+
+    Returns:
+        str: One of VALID_MODES
+
+    Raises:
+        ServiceUnavailableError: If OpenAI is unavailable
+    """
+    # The answer is a mode name, not user content, so it may go to the disk tier
+    return await _completion(
+        function_name, MODE_PROMPT_VERSION, MODE_SYSTEM_PROMPT, context, parse_mode,
+        max_tokens=1, casefold=True, persist=True
+    )
+
+
+async def extract_fields(
+    message: str,
+    names: Sequence[str],
+    function_name: str = FUNCTION_NAME
+) -> Dict[str, Optional[str]]:
+    """
+    Extract only the named intake fields from a message.
+
+    Used when the pre-pass has filled the others; the smaller schema and prompt
+    cost fewer tokens than the full turn analysis.
+
+    Returns:
+        Dict[str, Optional[str]]: The named fields, null when absent
+
+    Raises:
+        ServiceUnavailableError: If OpenAI is unavailable
+    """
+    names = tuple(name for name in INTAKE_FIELDS if name in names)
+    system_prompt, response_format = _fields_prompt(names)
+    return await _completion(
+        function_name,
+        f"{FIELDS_PROMPT_VERSION}:{','.join(names)}",
+        system_prompt,
+        message,
+        lambda content: parse_fields(content, names),
+        response_format=response_format
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _fields_prompt(names: Tuple[str, ...]) -> Tuple[str, Dict[str, Any]]:
+    """System prompt and response format of the fields-only extraction, built once per field set."""
+    system_prompt = (
+        "You extract intake fields from the user's message to a mental health assistant. "
+        f"Extract these fields, with these exact names: {', '.join(names)}. "
+        "If a field is not clearly mentioned, return null. Do not guess, infer, or fabricate. "
+        "Answer with one JSON object."
+    )
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "intake_fields",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {name: {"type": ["string", "null"]} for name in names},
+                "required": list(names),
+                "additionalProperties": False,
+            },
+        },
+    }
+    return system_prompt, response_format
+
+
+async def _completion(
+    function_name: str,
+    prompt_version: str,
+    system_prompt: str,
+    content: str,
+    parse: Callable[[Optional[str]], Any],
+    response_format: Optional[Dict[str, Any]] = None,
+    max_tokens: int = MAX_OUTPUT_TOKENS,
+    casefold: bool = False,
+    persist: bool = False
+) -> Any:
+    """
+    One cached, rate-limited completion, parsed with ``parse``.
+
+    Results that quote the user's message (analyses, fields) keep the default
+    ``persist=False`` and are never written to the disk tier.
+    """
+    cache = None
+    cache_key = None
+    if is_cache_enabled(function_name):
+        cache = get_response_cache()
+        cache_key = make_cache_key(
+            "chat.completions", TURN_ANALYSIS_MODEL, prompt_version, content, casefold=casefold
+        )
+        cached = await cache.get_async(function_name, cache_key, persist=persist)
+        if cached is not None:
+            return cached
+
+    client = get_openai_client()
+
+    # Queue behind risk checks instead of running into 429s
+    with stage("rate_limit"):
+        await get_rate_limiter().acquire(
+            "chat", estimate_tokens((system_prompt, content), max_tokens), PRIORITY_ANALYSIS
+        )
+
+    options = {"response_format": response_format} if response_format is not None else {}
+    with stage("openai"):
+        response = await get_endpoint("openai.chat").call(
+            lambda timeout: client.chat.completions.create(
+                model=TURN_ANALYSIS_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": content}
+                ],
+                temperature=0.1,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                **options
+            )
+        )
+
+    result = parse(response.choices[0].message.content)
+
+    if cache is not None:
+        cache.set(function_name, cache_key, result, persist=persist)
+
+    return result
+
+
+def empty_fields() -> Dict[str, None]:
+    return {name: None for name in INTAKE_FIELDS}
+
+
+def degraded_analysis(current_mode: Optional[str] = None) -> Dict[str, Any]:
+    """Analysis used while OpenAI is unavailable: nothing extracted, the mode unchanged."""
+    mode = current_mode if current_mode in VALID_MODES else DEFAULT_MODE
+    return {"fields": empty_fields(), "mode": mode}
+
+
+def parse_mode(content: Optional[str]) -> str:
+    """Map the (possibly truncated) mode-only output to a valid mode, defaulting to DEFAULT_MODE."""
+    token = (content or "").strip().lower()
+    if token in VALID_MODES:
+        return token
+    mode = MODE_BY_INITIAL.get(token[:1])
+    if mode is None or not mode.startswith(token):
+        return DEFAULT_MODE
+    return mode
+
+
+def parse_fields(content: Optional[str], names: Sequence[str]) -> Dict[str, Optional[str]]:
+    """
+    Normalize a fields-only model output; missing or non-string fields become null.
+
+    Raises:
+        ValueError: If the content is not a JSON object
+    """
+    data = json.loads((content or "").strip())
+    if not isinstance(data, dict):
+        raise ValueError("Field extraction is not a JSON object")
+    return {name: data.get(name) if isinstance(data.get(name), str) else None for name in names}
+
+
+def parse_analysis(content: Optional[str]) -> Dict[str, Any]:
+    """
+    Normalize the model output to the analysis shape.
+
+    Unknown keys are dropped, missing or non-string fields become null and an
+    unexpected mode falls back to DEFAULT_MODE.
+
+    Raises:
+        ValueError: If the content is not a JSON object
+    """
+    data = json.loads((content or "").strip())
+    if not isinstance(data, dict):
+        raise ValueError("Turn analysis is not a JSON object")
+
+    raw_fields = data.get("fields")
+    raw_fields = raw_fields if isinstance(raw_fields, dict) else {}
+    fields = {}
+    for name in INTAKE_FIELDS:
+        value = raw_fields.get(name)
+        fields[name] = value if isinstance(value, str) else None
+
+    mode = str(data.get("mode") or "").strip().lower()
+    if mode not in VALID_MODES:
+        logging.warning("Turn analysis returned unknown mode %r, using %s", mode, DEFAULT_MODE)
+        mode = DEFAULT_MODE
+
+    return {"fields": fields, "mode": mode}
@@ -1,60 +1,75 @@
 import azure.functions as func
-import json
 import logging
-import sys
-import os
+import time
+from shared.admission import admission_controlled
+from shared.context_window import build_context_window
+from shared.http import Field, Schema, json_handler, json_response
+from shared.mode_classifier import get_mode_classifier
+from shared.resilience import ServiceUnavailableError
+from shared.timing import mark, stage, timed_handler
+from shared.turn_analysis import decide_mode, degraded_analysis
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
-    from shared.common import get_openai_client
-except ImportError:
-    from openai import OpenAI
-    def get_openai_client():
-        return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+FUNCTION_NAME = "switch_chat_mode"
 
+REQUEST_SCHEMA = Schema(
+    Field("session_id", (str, int), required=True, non_empty=True, coerce=str),
+    Field("context", str, required=True, strip=True, non_empty=True),
+    Field("current_mode", str),
+)
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+
+@timed_handler(FUNCTION_NAME)
+@admission_controlled(FUNCTION_NAME)
+@json_handler(FUNCTION_NAME, "Internal server error occurred.")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     """Azure Function to determine chat mode switch using OpenAI analysis."""
+    payload = REQUEST_SCHEMA.parse(req)
+    session_id = payload["session_id"]
+    mark("validate")
+
+    # Only the most recent turns within the token budget are sent
+    with stage("context_window"):
+        window = build_context_window(payload["context"])
     
+    # While OpenAI is unavailable, stay in the client's current mode
+    result = {"status": "ok"}
     try:
-        req_body = req.get_json()
-        if not req_body:
-            return func.HttpResponse(json.dumps({"status": "error", "message": "Request body is required."}), status_code=400, mimetype="application/json")
-        
-        session_id = req_body.get("session_id")
-        context = req_body.get("context")
-        
-        if not session_id:
-            return func.HttpResponse(json.dumps({"status": "error", "message": "Missing required 'session_id' field."}), status_code=400, mimetype="application/json")
-        
-        if not context or not isinstance(context, str):
-            return func.HttpResponse(json.dumps({"status": "error", "message": "Missing or invalid 'context' field."}), status_code=400, mimetype="application/json")
-        
-        client = get_openai_client()
-        
-        system_prompt = "You are a conversation controller for a mental health assistant. Based on the user's last message, decide whether the assistant should continue asking intake questions, switch to advice-giving, enter reflective discussion, or summarize and close. Only return the most appropriate chat mode: intake, advice, reflection, or summary."
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": context}
-            ],
-            max_tokens=10,
-            temperature=0.1
-        )
-        
-        new_mode = response.choices[0].message.content.strip().lower()
-        valid_modes = ["intake", "advice", "reflection", "summary"]
-        if new_mode not in valid_modes:
-            new_mode = "advice"
-        
-        return func.HttpResponse(json.dumps({"status": "ok", "new_mode": new_mode}), status_code=200, mimetype="application/json")
-        
-    except ValueError:
-        return func.HttpResponse(json.dumps({"status": "error", "message": "Invalid JSON in request body."}), status_code=400, mimetype="application/json")
-    except Exception:
-        logging.error("Error in switch_chat_mode function")
-        return func.HttpResponse(json.dumps({"status": "error", "message": "Internal server error occurred."}), status_code=500, mimetype="application/json")
+        result["new_mode"] = await decide_chat_mode(window.text)
+    except ServiceUnavailableError as e:
+        logging.warning("Chat mode decision degraded for session %s: %s", session_id, e)
+        result["new_mode"] = degraded_analysis(payload["current_mode"])["mode"]
+        result["degraded"] = True
+    result["tokens"] = window.token_report()
+    
+    return json_response(result)
+
 
+async def decide_chat_mode(context: str) -> str:
+    """
+    Decide the next chat mode.
+
+    A confident answer of the local classifier (shared.mode_classifier) is used
+    directly; otherwise, and for sampled shadow comparisons, the mode comes from
+    the single-token LLM mode decision.
+    """
+    classifier = get_mode_classifier()
+    if classifier is None:
+        return await decide_mode(context, function_name=FUNCTION_NAME)
+
+    with stage("classifier"):
+        prediction = classifier.predict(context)
+    shadow = prediction.confident and classifier.should_shadow()
+    if prediction.confident and not shadow:
+        return prediction.mode
+
+    started = time.perf_counter()
+    try:
+        llm_mode = await decide_mode(context, function_name=FUNCTION_NAME)
+    except ServiceUnavailableError:
+        if shadow:
+            return prediction.mode
+        raise
+    classifier.record_llm(prediction, llm_mode, (time.perf_counter() - started) * 1000)
+    # A shadowed turn still answers with the classifier, as unsampled ones do
+    return prediction.mode if shadow else llm_mode